@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'babbleton.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, as it loads the webportal models
+from webportal.streams import live_stream  # noqa: E402
+
+# Live dashboards push stream, handled outside the Django request cycle
+LIVE_STREAM_PATH = '/live/stream/'
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == LIVE_STREAM_PATH:
+        await live_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
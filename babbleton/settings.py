@@ -39,6 +39,10 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'webportal',
     'thedjangolook',
+    # Indexes on the legacy tables, see webportal/indexes/__init__.py
+    # 'webportal.indexes',
+    # Trigger for LIVE_SESSIONS_REGISTRY, see webportal/notify/__init__.py
+    # 'webportal.notify',
 ]
 
 MIDDLEWARE = [
@@ -85,6 +89,23 @@ DATABASES = {
     },
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared by every worker process, so a single process polls ANDROMEDA for all
+# of them. The table is created by migrate (webportal migration 0006); Redis
+# or Memcached work too, but a per-process backend such as LocMemCache makes
+# every worker poll on its own.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'webportal_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -128,3 +149,66 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# ANDROMEDA
+# Switches whose /globaldata is merged into live traffic (ANDROMEDA_SERVER alone
+# when empty), seconds between polls shared by every live traffic viewer, the
+# longest wait for any one switch, the client timeouts, and how many
+# consecutive failures open a switch's circuit breaker for
+# ANDROMEDA_RESET_TIMEOUT seconds
+
+ANDROMEDA_SERVERS = []
+ANDROMEDA_POLL_INTERVAL = 2
+ANDROMEDA_UPSTREAM_TIMEOUT = 4
+ANDROMEDA_CONNECT_TIMEOUT = 2
+ANDROMEDA_READ_TIMEOUT = 5
+ANDROMEDA_FAILURE_THRESHOLD = 3
+ANDROMEDA_RESET_TIMEOUT = 30
+
+# In-memory sparkline history kept by each process, one sample per poll:
+# about 4 bytes x 3 metrics x (centres + 1) x hours x 3600 / poll interval
+
+TRAFFIC_HISTORY_HOURS = 6
+TRAFFIC_HISTORY_MAX_CENTRES = 64
+
+# Live dashboards
+# Seconds between active session refreshes and between keepalive comments on
+# the /live/stream/ push stream (only available when served through asgi.py)
+
+LIVE_SESSIONS_INTERVAL = 2
+LIVE_STREAM_HEARTBEAT = 15
+
+# Seconds a live sessions response is shared between viewers polling together
+
+LIVE_SESSIONS_COALESCE = 1
+
+# Rows rendered with the live sessions page, and the most one request may fetch
+
+LIVE_SESSIONS_PAGE = 100
+LIVE_SESSIONS_MAX_WINDOW = 500
+
+# Serve active sessions from an in-memory registry kept current by the
+# sessions_changed NOTIFY trigger instead of querying on every refresh, with
+# a full resync every LIVE_SESSIONS_RESYNC seconds (needs webportal.notify)
+
+LIVE_SESSIONS_REGISTRY = False
+LIVE_SESSIONS_RESYNC = 300
+
+# Seconds a report over a range that includes today is cached for. Reports
+# over completed days are cached for REPORTS_PAST_CACHE_TTL seconds, or until
+# the rollup rebuilds one of their days (manage.py refresh_sessions_daily)
+
+REPORTS_CACHE_TTL = 60
+REPORTS_PAST_CACHE_TTL = 86400
+
+# Days back each refresh_sessions_daily run checks for sessions that changed
+# after their day was rolled up; older changes need a rebuild with --since
+
+SESSIONS_DAILY_LOOKBACK_DAYS = 7
+
+# Compute centre reports over more than REPORT_JOBS_MIN_DAYS days in
+# background workers (manage.py run_report_jobs) while the page shows their
+# progress, instead of inside the web request (needs migration 0004)
+
+REPORT_JOBS = False
+REPORT_JOBS_MIN_DAYS = 31
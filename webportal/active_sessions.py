@@ -0,0 +1,329 @@
+"""Active (still open) sessions shown on the live sessions page"""
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+from .models import Sessions
+
+# Cache keys shared by every worker process of the deployment
+FEED_CACHE_KEY = 'webportal:sessions:feed'
+FEED_LOG_CACHE_KEY = 'webportal:sessions:feed:{}:{}'
+FEED_LOCK_CACHE_KEY = 'webportal:sessions:feed:lock'
+
+ACTIVE_SESSIONS_SELECT = """
+    SELECT
+        s.id,
+        s.operid,
+        s.start,
+        s.duration,
+        s.callduration,
+        s.calltotal,
+        s.external,
+        CONCAT(o.fname, ' ', o.sname) as agent_name,
+        o.langid as language_id,
+        l.name as language_name,
+        o.centreid as centre_id,
+        c.name as centre_name,
+        EXTRACT(EPOCH FROM (NOW() - s.start)) as duration_seconds
+    FROM sessions s
+    INNER JOIN operators o ON s.operid = o.id
+    INNER JOIN languages l ON o.langid = l.id
+    LEFT JOIN centres c ON o.centreid = c.id
+"""
+
+# Only sessions where duration is null are active
+ACTIVE_SESSIONS_SQL = ACTIVE_SESSIONS_SELECT + """
+    WHERE s.duration IS NULL
+    ORDER BY s.start DESC
+"""
+
+# The given sessions, if they are still active
+ACTIVE_SESSIONS_BY_ID_SQL = ACTIVE_SESSIONS_SELECT + """
+    WHERE s.duration IS NULL
+        AND s.id = ANY(%s)
+"""
+
+
+def session_row(session):
+    """Active session as a dict ready for webportal.http.dumps"""
+    return {
+        'id': session.id,
+        'agent_name': session.agent_name,
+        'start': session.start,
+        'duration_seconds': session.duration_seconds,
+        'language_id': session.language_id,
+        'language_name': session.language_name,
+        'centre_id': session.centre_id,
+        'centre_name': session.centre_name,
+        'calltotal': session.calltotal or 0,
+        'callduration': session.callduration or 0,
+        'external': session.external
+    }
+
+
+def fetch_active_sessions(ids=None):
+    """Return the active sessions, or those of ids that are still active"""
+    if ids is None:
+        return [session_row(session) for session in Sessions.objects.raw(ACTIVE_SESSIONS_SQL)]
+    return [session_row(session) for session in Sessions.objects.raw(ACTIVE_SESSIONS_BY_ID_SQL, [list(ids)])]
+
+
+# ?sort= values of the sessions endpoint; a leading '-' reverses the order
+SESSION_SORT_KEYS = {
+    'id': lambda session: session['id'],
+    'agent': lambda session: (session['agent_name'] or '').lower(),
+    'start': lambda session: session['start'].timestamp() if session['start'] else 0,
+    'language': lambda session: (session['language_name'] or '').lower(),
+    'centre': lambda session: (session['centre_name'] or '').lower(),
+    'calls': lambda session: session['calltotal'],
+    'minutes': lambda session: session['callduration'].total_seconds() if session['callduration'] else 0,
+}
+
+
+def window_sessions(sessions_list, offset, limit, sort='-start', language=None, centre=None):
+    """Filter and sort sessions, returning (matching count, rows offset..offset+limit)
+
+    Raises ValueError for an unknown sort.
+    """
+    field = sort.lstrip('-')
+    if field not in SESSION_SORT_KEYS:
+        raise ValueError(f"Unknown sort '{sort}'")
+    if language is not None:
+        sessions_list = [s for s in sessions_list if s['language_id'] == language]
+    if centre is not None:
+        sessions_list = [s for s in sessions_list if s['centre_id'] == centre]
+    # The active list is already newest first, so skip sorting for the default
+    if sort != '-start':
+        # Ties keep a stable order between polls
+        key = SESSION_SORT_KEYS[field]
+        sessions_list = sorted(sessions_list, key=lambda s: (key(s), s['id']), reverse=sort.startswith('-'))
+    return len(sessions_list), sessions_list[offset:offset + limit]
+
+
+# Columns of the ?format=columns encoding, in order
+SESSION_COLUMNS = ('id', 'agent_name', 'start', 'duration_seconds', 'language', 'centre',
+                   'calltotal', 'callduration', 'external')
+
+
+def encode_columns(sessions_list):
+    """Compact column-wise encoding of sessions for slow links
+
+    Column names are sent once with a parallel array of values each. start
+    is epoch seconds, durations are whole seconds, external is 0 or 1, and
+    language and centre are indexes into the 'languages' and 'centres' lists.
+    """
+    languages = {}
+    centres = {}
+    data = [[] for _ in SESSION_COLUMNS]
+    (ids, agents, starts, durations, language_indexes, centre_indexes,
+     calls, calldurations, externals) = data
+    for session in sessions_list:
+        ids.append(session['id'])
+        agents.append(session['agent_name'])
+        starts.append(int(session['start'].timestamp()) if session['start'] else None)
+        durations.append(int(session['duration_seconds'] or 0))
+        language_indexes.append(languages.setdefault(session['language_name'], len(languages)))
+        centre_indexes.append(centres.setdefault(session['centre_name'], len(centres)))
+        calls.append(session['calltotal'])
+        callduration = session['callduration']
+        calldurations.append(int(callduration.total_seconds()) if callduration else 0)
+        externals.append(1 if session['external'] else 0)
+    return {
+        'columns': SESSION_COLUMNS,
+        'data': data,
+        'languages': list(languages),
+        'centres': list(centres),
+    }
+
+
+def session_fingerprint(session):
+    """Identify a session's state ignoring the ever-growing duration_seconds"""
+    return (session['id'], session['calltotal'], session['callduration'], session['external'],
+            session['agent_name'], session['language_name'], session['centre_name'])
+
+
+def current_durations(sessions_list):
+    """Sessions with duration_seconds worked out now, as it grows without any change"""
+    now = datetime.now(timezone.utc)
+    return [dict(session, duration_seconds=(now - session['start']).total_seconds()) if session['start'] else session
+            for session in sessions_list]
+
+
+def fingerprints_digest(fingerprints):
+    """Short digest of the state of every active session"""
+    return hashlib.blake2b(repr(sorted(fingerprints.items())).encode(), digest_size=16).hexdigest()
+
+
+class ActiveSessionFeed:
+    """Versioned view of the active sessions answering "what changed since"
+
+    Every refresh is compared with the current version and records a new
+    one if any session opened, closed or changed. Clients hold a cursor
+    naming the version they have seen and get only the sessions touched
+    after it.
+
+    Only the current version, a digest of its sessions and the ids each
+    version touched live in the shared cache; the sessions themselves stay
+    in the memory of each process, along with the version they match. So
+    any worker process can answer a cursor handed out by another, without
+    the whole list crossing the cache. The cursor also carries a token of
+    the feed, so a cursor from before the cache lost it gets the full list
+    again.
+    """
+
+    # Number of versions kept to answer deltas; older cursors get a reset
+    log_size = 300
+    log_timeout = 3600
+    # Longest one process may take to record a version
+    lock_timeout = 5
+
+    def __init__(self):
+        # The version this process's sessions match, and those sessions
+        self.token = None
+        self.version = 0
+        self.sessions = []
+        self.fingerprints = {}
+        self._lock = threading.Lock()
+
+    def update(self, sessions_list, read_at):
+        """Record a fresh query result, read starting at read_at (time.time())
+
+        Returns (cursor, sessions) of the version this process is at. A
+        result read before the current version was recorded is out of date,
+        so the process keeps the version and sessions it had.
+        """
+        fingerprints = {session['id']: session_fingerprint(session) for session in sessions_list}
+        digest = fingerprints_digest(fingerprints)
+        head = cache.get(FEED_CACHE_KEY)
+        with self._lock:
+            if head is not None and head['digest'] == digest:
+                self.adopt(head, sessions_list, fingerprints)
+            elif head is None or read_at > head['read_at']:
+                self.record(sessions_list, fingerprints, digest, read_at)
+            elif self.token is None:
+                # Nothing to fall back on yet; the cursor gets a reset later
+                return self.cursor(), sessions_list
+            return self.cursor(), current_durations(self.sessions)
+
+    def adopt(self, head, sessions_list, fingerprints):
+        self.token = head['token']
+        self.version = head['version']
+        self.sessions = sessions_list
+        self.fingerprints = fingerprints
+
+    def record(self, sessions_list, fingerprints, digest, read_at):
+        """Store the next version and the ids it touched, unless another process is recording"""
+        if not cache.add(FEED_LOCK_CACHE_KEY, os.getpid(), timeout=self.lock_timeout):
+            return
+        try:
+            head = cache.get(FEED_CACHE_KEY)
+            if head is not None and head['digest'] == digest:
+                self.adopt(head, sessions_list, fingerprints)
+                return
+            if head is not None and read_at <= head['read_at']:
+                return
+
+            if head is None:
+                head = {'token': os.urandom(4).hex(), 'version': 0}
+            entry = self.changes(head, fingerprints)
+            version = head['version'] + 1
+            cache.set(FEED_LOG_CACHE_KEY.format(head['token'], version), entry, timeout=self.log_timeout)
+            head = {'token': head['token'], 'version': version, 'digest': digest, 'read_at': read_at}
+            cache.set(FEED_CACHE_KEY, head, timeout=None)
+            self.adopt(head, sessions_list, fingerprints)
+        finally:
+            cache.delete(FEED_LOCK_CACHE_KEY)
+
+    def changes(self, head, fingerprints):
+        """Ids opened, changed and closed from head to fingerprints, as a log entry
+
+        This process only knows the sessions of its own version. The ids
+        logged since then, by other processes, are compared too, so the
+        entry covers every change from head. Without a usable base the
+        entry tells clients to reset.
+        """
+        if self.token != head['token'] or self.version > head['version']:
+            return {'reset': True}
+        keys = [FEED_LOG_CACHE_KEY.format(head['token'], version)
+                for version in range(self.version + 1, head['version'] + 1)]
+        entries = cache.get_many(keys)
+        if len(entries) < len(keys) or any(entry.get('reset') for entry in entries.values()):
+            return {'reset': True}
+
+        logged = set()
+        for entry in entries.values():
+            logged |= entry['opened'] | entry['changed'] | entry['closed']
+        base = self.fingerprints
+        return {
+            'opened': {session_id for session_id in fingerprints
+                       if session_id not in base and session_id not in logged},
+            'changed': {session_id for session_id, fingerprint in fingerprints.items()
+                        if session_id in logged or (session_id in base and base[session_id] != fingerprint)},
+            'closed': {session_id for session_id in base.keys() | logged if session_id not in fingerprints},
+        }
+
+    def cursor(self):
+        return self.cursor_of(self.token, self.version)
+
+    def delta(self, cursor):
+        """Sessions opened, changed and closed after cursor, plus the new cursor
+
+        An unknown or expired cursor gets every active session with reset
+        set, and the client should drop what it had.
+        """
+        with self._lock:
+            token, version, sessions_list = self.token, self.version, self.sessions
+        cursor_token, _, since = (cursor or '').partition(':')
+        since = int(since) if since.isdigit() else -1
+
+        entries = None
+        if token is not None and cursor_token == token and since > version:
+            # The client saw a version this process has not caught up with yet
+            entries = {}
+            version = since
+        elif token is not None and cursor_token == token and 0 <= version - since <= self.log_size:
+            keys = [FEED_LOG_CACHE_KEY.format(token, logged) for logged in range(since + 1, version + 1)]
+            entries = cache.get_many(keys)
+            if len(entries) < len(keys) or any(entry.get('reset') for entry in entries.values()):
+                entries = None
+
+        if entries is None:
+            return {
+                'cursor': self.cursor_of(token, version),
+                'reset': True,
+                'opened': current_durations(sessions_list),
+                'changed': [],
+                'closed': [],
+                'count': len(sessions_list)
+            }
+
+        opened_ids, changed_ids, closed_ids = set(), set(), set()
+        for entry in entries.values():
+            opened_ids |= entry['opened']
+            changed_ids |= entry['changed']
+            closed_ids |= entry['closed']
+        sessions = {session['id']: session for session in sessions_list}
+        return {
+            'cursor': self.cursor_of(token, version),
+            'reset': False,
+            'opened': current_durations([sessions[i] for i in opened_ids if i in sessions]),
+            'changed': current_durations([sessions[i] for i in changed_ids - opened_ids if i in sessions]),
+            # Sessions that opened and closed in between were never seen
+            'closed': [i for i in closed_ids - opened_ids if i not in sessions],
+            'count': len(sessions_list)
+        }
+
+    @staticmethod
+    def cursor_of(token, version):
+        return f'{token}:{version}' if token else ''
+
+
+_feed = ActiveSessionFeed()
+
+
+def get_session_feed():
+    """Return the process-wide active sessions feed, versioned through the shared cache"""
+    return _feed
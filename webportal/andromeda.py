@@ -0,0 +1,190 @@
+"""HTTP client for the ANDROMEDA switch
+
+Keeps connections to ANDROMEDA alive between polls, fetches every server
+concurrently on a shared thread pool, and stops calling ANDROMEDA for a
+while after repeated failures instead of tying up a thread on every timeout
+while it is down. The circuit state lives in the shared cache, so a new
+poller leader carries on where the last one stopped.
+"""
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+BREAKER_CACHE_KEY = 'andromeda-breaker:{}'
+BREAKER_TRIAL_CACHE_KEY = 'andromeda-breaker:{}:trial'
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling ANDROMEDA while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Closed while calls succeed, open for reset_timeout after repeated failures
+
+    Once reset_timeout has passed a single trial call is let through
+    (half-open), in whichever process asks first; its outcome closes the
+    circuit again or re-opens it. The failure count and the time the
+    circuit opened are kept in the shared cache under the server's key.
+    """
+
+    def __init__(self, server, failure_threshold, reset_timeout):
+        self.key = BREAKER_CACHE_KEY.format(server)
+        self.trial_key = BREAKER_TRIAL_CACHE_KEY.format(server)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    def allow(self):
+        state = cache.get(self.key)
+        if state is None or state['opened_at'] is None:
+            return True
+        if time.time() - state['opened_at'] < self.reset_timeout:
+            return False
+        return cache.add(self.trial_key, True, timeout=self.reset_timeout)
+
+    def record_success(self):
+        # Only closing an open or failing circuit costs a write
+        if cache.get(self.key) is not None:
+            cache.delete_many([self.key, self.trial_key])
+
+    def record_failure(self):
+        state = cache.get(self.key) or {'failures': 0, 'opened_at': None}
+        state['failures'] += 1
+        # A failed trial re-opens the circuit straight away
+        if state['opened_at'] is not None or state['failures'] >= self.failure_threshold:
+            state['opened_at'] = time.time()
+            cache.delete(self.trial_key)
+        cache.set(self.key, state, timeout=None)
+
+
+class AndromedaClient:
+    """Pooled keep-alive client for one ANDROMEDA server"""
+
+    def __init__(self, server, connect_timeout, read_timeout, failure_threshold, reset_timeout):
+        self.server = server
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(server, failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount('http://', adapter)
+
+    def circuit_open_error(self):
+        return CircuitOpenError(f"ANDROMEDA {self.server} circuit is open")
+
+    def fetch_globaldata(self):
+        """Return the decoded /globaldata payload, whatever the circuit state
+
+        Raises requests.exceptions.RequestException or ValueError for an
+        invalid JSON body.
+        """
+        response = self.session.get(f"http://{self.server}/globaldata", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get_globaldata(self):
+        """Return the decoded /globaldata payload
+
+        Raises requests.exceptions.RequestException (CircuitOpenError while
+        the circuit is open) or ValueError for an invalid JSON body.
+        """
+        if not self.breaker.allow():
+            raise self.circuit_open_error()
+
+        try:
+            traffic_data = self.fetch_globaldata()
+        except (requests.exceptions.RequestException, ValueError):
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return traffic_data
+
+
+_executor = None
+_executor_size = 0
+_executor_lock = threading.Lock()
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared fetch pool, with a thread for every fetch that may be running
+
+    A fetch holds its thread for up to the connect and read timeouts, past
+    the upstream timeout and into the next polls, so each server needs a
+    thread per poll it may overlap. Otherwise fetches would queue behind
+    each other and use up their upstream timeout waiting.
+    """
+    global _executor, _executor_size
+    overlap = math.ceil(
+        (settings.ANDROMEDA_CONNECT_TIMEOUT + settings.ANDROMEDA_READ_TIMEOUT) / settings.ANDROMEDA_POLL_INTERVAL
+    )
+    size = len(andromeda_servers()) * (overlap + 1)
+    with _executor_lock:
+        if _executor is None or _executor_size < size:
+            # Threads are only started as fetches need them
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='andromeda')
+            _executor_size = size
+        return _executor
+
+
+def andromeda_servers():
+    """Configured ANDROMEDA servers, in display order"""
+    return list(settings.ANDROMEDA_SERVERS) or [settings.ANDROMEDA_SERVER]
+
+
+def get_client(server=None):
+    """Return the process-wide client for server (settings.ANDROMEDA_SERVER by default)"""
+    server = server or settings.ANDROMEDA_SERVER
+    with _clients_lock:
+        if server not in _clients:
+            _clients[server] = AndromedaClient(
+                server,
+                settings.ANDROMEDA_CONNECT_TIMEOUT,
+                settings.ANDROMEDA_READ_TIMEOUT,
+                settings.ANDROMEDA_FAILURE_THRESHOLD,
+                settings.ANDROMEDA_RESET_TIMEOUT,
+            )
+        return _clients[server]
+
+
+def fetch_all(servers, timeout):
+    """Fetch /globaldata from every server concurrently
+
+    Returns (server, payload, error) per server in the given order, with
+    exactly one of payload and error set. A server slower than timeout
+    counts as failed, so the total wait is bounded by timeout however many
+    servers there are; its fetch finishes on the pool in the background.
+
+    The circuits are checked and updated from the calling thread, so the
+    pool threads never touch the cache.
+    """
+    executor = get_executor()
+    clients = [get_client(server) for server in servers]
+    futures = [executor.submit(client.fetch_globaldata) if client.breaker.allow() else None
+               for client in clients]
+    wait([future for future in futures if future is not None], timeout)
+
+    results = []
+    for client, future in zip(clients, futures):
+        if future is None:
+            results.append((client.server, None, client.circuit_open_error()))
+            continue
+        if not future.done():
+            error = requests.exceptions.Timeout(f"No response from {client.server} within {timeout}s")
+        else:
+            error = future.exception()
+        if error is None:
+            client.breaker.record_success()
+            results.append((client.server, future.result(), None))
+        else:
+            client.breaker.record_failure()
+            results.append((client.server, None, error))
+    return results
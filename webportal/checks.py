@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """The traffic poller's lease only holds back other processes through a shared cache"""
+    if isinstance(caches['default'], (LocMemCache, DummyCache)):
+        return [Warning(
+            'The default cache is not shared between processes, so every worker '
+            'process polls ANDROMEDA on its own.',
+            hint='Use the DatabaseCache from babbleton/settings.py, Redis or Memcached.',
+            id='webportal.W001',
+        )]
+    return []
+
+
+@register()
+def check_sessions_notify(app_configs, **kwargs):
+    """The live sessions registry only hears about changes through webportal.notify's trigger"""
+    if settings.LIVE_SESSIONS_REGISTRY and not apps.is_installed('webportal.notify'):
+        return [Warning(
+            'LIVE_SESSIONS_REGISTRY is on but webportal.notify is not installed, so the '
+            'registry only sees session changes at each LIVE_SESSIONS_RESYNC.',
+            hint="Add 'webportal.notify' to INSTALLED_APPS and run migrate.",
+            id='webportal.W002',
+        )]
+    return []
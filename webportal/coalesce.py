@@ -0,0 +1,65 @@
+"""Request coalescing for endpoints many dashboards poll at the same moment
+
+Concurrent callers asking for the same key share one in-flight computation,
+and its result is reused for ttl seconds so the stragglers of a polling
+round do not start another one. Load then follows the poll interval rather
+than the number of viewers.
+"""
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = 0.0
+
+
+class SingleFlight:
+    """Run fn once per key for all concurrent callers and cache it for ttl"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn() for key, sharing a running or recently finished call
+
+        An exception raised by fn is raised in every caller waiting on that
+        call and is not cached.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set() and time.monotonic() - call.finished >= self.ttl:
+                call = None
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._expire()
+
+        if leader:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+            call.finished = time.monotonic()
+            call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _expire(self):
+        # Drop finished calls past their ttl so one-off keys do not pile up
+        now = time.monotonic()
+        for key in [key for key, call in self._calls.items()
+                    if call.done.is_set() and now - call.finished >= self.ttl]:
+            del self._calls[key]
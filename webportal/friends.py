@@ -0,0 +1,314 @@
+"""Frequent callers ("friends") per centre, language and period
+
+The calls table is far too big to count callers over on every request, so
+manage.py refresh_caller_sketches reads the calls added since its last run
+in batches of ids and folds each batch into a space-saving summary and a
+count-min sketch per day, centre and language (see webportal/sketches.py).
+Ids are not committed in order, so ids missing below the watermark are
+looked for again on later runs until they turn up or expire.
+Every call also counts towards the all-centres and all-languages sketches
+(centreid / langid 0), so any filter reads one sketch per period. Completed
+months get a month sketch merged from their days.
+
+A report merges the month and day sketches covering its range. The top
+callers and their counts are estimates that can only err upwards, and each
+comes with a guaranteed minimum.
+"""
+import json
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import CallerSketch
+from .rollups import utc_today
+from .sketches import CountMinSketch, SpaceSaving
+
+# Callers held per sketch; the most a report can rank
+CAPACITY = 200
+
+# Count-min sketch of 4 x 1024 counters, overestimating a caller by at most
+# about 0.3% of the period's calls with 98% probability
+CMS_WIDTH = 1024
+CMS_DEPTH = 4
+
+# Calls read per refresh transaction
+BATCH_CALLS = 50000
+
+# Seconds an id missing below the watermark is looked for before it is
+# taken to be a rolled back insert rather than a call still committing
+LATE_CALL_SECONDS = 3600
+
+# A longer run of missing ids is a sequence jump, not calls in flight
+MAX_GAP_IDS = 1000
+
+ALL = 0
+
+# Calls per day, centre, language and caller for a range or list of call ids.
+# Calls without a session or language only count towards the 'all' sketches.
+BATCH_SQL = """
+    SELECT
+        (c.start AT TIME ZONE 'UTC')::date,
+        o.centreid,
+        c.langid,
+        c.cli,
+        COUNT(*)
+    FROM calls c
+    LEFT JOIN sessions s ON c.sessid = s.id
+    LEFT JOIN operators o ON s.operid = o.id
+    WHERE {ids}
+        AND c.start IS NOT NULL
+        AND c.cli IS NOT NULL
+        AND c.cli <> ''
+    GROUP BY 1, 2, 3, 4
+"""
+
+ID_RANGE = "c.id > %s AND c.id <= %s"
+ID_LIST = "c.id = ANY(%s)"
+
+# Runs of ids missing from a range of call ids, as (first, last)
+GAPS_SQL = """
+    SELECT id + 1, next_id - 1
+    FROM (
+        SELECT id, LEAD(id, 1, %s + 1) OVER (ORDER BY id) AS next_id
+        FROM (
+            SELECT %s::bigint AS id
+            UNION ALL
+            SELECT id FROM calls WHERE id > %s AND id <= %s
+        ) ids
+    ) runs
+    WHERE next_id > id + 1
+"""
+
+# Completed months with day sketches for a centre and language but no month sketch
+MISSING_MONTHS_SQL = """
+    SELECT DISTINCT date_trunc('month', d.start)::date AS month, d.centreid, d.langid
+    FROM caller_sketches d
+    WHERE d.period = 'day'
+        AND d.start < %s
+        AND NOT EXISTS (
+            SELECT 1 FROM caller_sketches m
+            WHERE m.period = 'month'
+                AND m.start = date_trunc('month', d.start)::date
+                AND m.centreid = d.centreid
+                AND m.langid = d.langid
+        )
+"""
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def load(sketch):
+    """(SpaceSaving, CountMinSketch) of a stored CallerSketch"""
+    return (SpaceSaving.from_list(CAPACITY, sketch.top),
+            CountMinSketch.from_bytes(CMS_WIDTH, CMS_DEPTH, sketch.counts))
+
+
+def new_sketch(period, start, centre, language):
+    return CallerSketch(
+        period=period, start=start, centreid=centre, langid=language, calls=0,
+        top=[], counts=CountMinSketch(CMS_WIDTH, CMS_DEPTH).to_bytes()
+    )
+
+
+def refresh_caller_sketches(batch_calls=BATCH_CALLS, today=None):
+    """Count the calls added since the last refresh, then build missing month sketches
+
+    Returns the number of calls counted.
+    """
+    today = today or utc_today()
+    counted = count_late_calls(today)
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            last_id, pending = lock_watermark(cursor)
+            cursor.execute("SELECT MAX(id) FROM calls")
+            max_id = cursor.fetchone()[0]
+            if max_id is None or max_id <= last_id:
+                break
+
+            up_to = min(max_id, last_id + batch_calls)
+            counted += count_calls(cursor, ID_RANGE, [last_id, up_to], today)
+
+            # Ids skipped here may still be committing; look for them next time
+            cursor.execute(GAPS_SQL, [up_to, last_id, last_id, up_to])
+            now = time.time()
+            for first, last in cursor.fetchall():
+                if last - first < MAX_GAP_IDS:
+                    pending.extend([call_id, now] for call_id in range(first, last + 1))
+            cursor.execute(
+                "UPDATE caller_sketches_watermark SET last_call_id = %s, pending_ids = %s WHERE id = 1",
+                [up_to, json.dumps(pending)]
+            )
+
+    build_month_sketches(today)
+    return counted
+
+
+def lock_watermark(cursor):
+    """The last call id counted and the [id, first missed] still pending below it"""
+    cursor.execute(
+        "INSERT INTO caller_sketches_watermark (id, last_call_id, pending_ids) VALUES (1, 0, '[]') "
+        "ON CONFLICT DO NOTHING"
+    )
+    cursor.execute("SELECT last_call_id, pending_ids FROM caller_sketches_watermark WHERE id = 1 FOR UPDATE")
+    last_id, pending = cursor.fetchone()
+    if isinstance(pending, str):
+        pending = json.loads(pending)
+    return last_id, pending
+
+
+def count_late_calls(today):
+    """Count the calls committed since the last refresh with ids below its watermark"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        _, pending = lock_watermark(cursor)
+        if not pending:
+            return 0
+        cursor.execute("SELECT id FROM calls WHERE id = ANY(%s)", [[call_id for call_id, _ in pending]])
+        found = [row[0] for row in cursor.fetchall()]
+        counted = count_calls(cursor, ID_LIST, [found], today) if found else 0
+
+        found = set(found)
+        expired = time.time() - LATE_CALL_SECONDS
+        pending = [[call_id, missed] for call_id, missed in pending if call_id not in found and missed > expired]
+        cursor.execute("UPDATE caller_sketches_watermark SET pending_ids = %s WHERE id = 1", [json.dumps(pending)])
+    return counted
+
+
+def count_calls(cursor, ids, params, today):
+    """Fold the calls selected by an ID_RANGE or ID_LIST condition into the day sketches"""
+    cursor.execute(BATCH_SQL.format(ids=ids), params)
+    batch = defaultdict(Counter)
+    counted = 0
+    for day, centre, language, cli, calls in cursor.fetchall():
+        for centre_key in {ALL, centre or ALL}:
+            for language_key in {ALL, language or ALL}:
+                batch[(day, centre_key, language_key)][cli] += calls
+        counted += calls
+    add_to_day_sketches(batch, today)
+    return counted
+
+
+def add_to_day_sketches(batch, today):
+    """Fold {(day, centre, language): Counter of callers} into the day sketches"""
+    days = {day for day, _, _ in batch}
+    existing = {
+        (sketch.start, sketch.centreid, sketch.langid): sketch
+        for sketch in CallerSketch.objects.filter(period='day', start__in=days)
+    }
+
+    created, updated = [], []
+    for key, callers in batch.items():
+        sketch = existing.get(key)
+        if sketch is None:
+            sketch = new_sketch('day', *key)
+            created.append(sketch)
+        else:
+            updated.append(sketch)
+        top, counts = load(sketch)
+        top.add_counts(callers)
+        for cli, calls in callers.items():
+            counts.add(cli, calls)
+        sketch.top = top.to_list()
+        sketch.counts = counts.to_bytes()
+        sketch.calls += sum(callers.values())
+
+    CallerSketch.objects.bulk_create(created)
+    CallerSketch.objects.bulk_update(updated, ['top', 'counts', 'calls'])
+
+    # Late calls for a completed month make its month sketches stale
+    stale_months = {month_start(day) for day in days if month_start(day) < month_start(today)}
+    if stale_months:
+        CallerSketch.objects.filter(period='month', start__in=stale_months).delete()
+
+
+def build_month_sketches(today):
+    """Merge the day sketches of each completed month lacking a month sketch"""
+    with connection.cursor() as cursor:
+        cursor.execute(MISSING_MONTHS_SQL, [month_start(today)])
+        missing = cursor.fetchall()
+
+    for month, centre, language in missing:
+        days = CallerSketch.objects.filter(
+            period='day', centreid=centre, langid=language, start__gte=month, start__lt=next_month(month)
+        )
+        CallerSketch.objects.create(**merged_fields(list(days)), period='month', start=month,
+                                    centreid=centre, langid=language)
+
+
+def merged_fields(sketches):
+    loaded = [load(sketch) for sketch in sketches]
+    top = SpaceSaving.merge([top for top, _ in loaded], CAPACITY)
+    counts = CountMinSketch.merge([counts for _, counts in loaded], CMS_WIDTH, CMS_DEPTH)
+    return {'calls': sum(sketch.calls for sketch in sketches), 'top': top.to_list(), 'counts': counts.to_bytes()}
+
+
+def covering_sketches(start_day, end_day, centre, language):
+    """Month sketches for the whole completed months in the range, day sketches for the rest"""
+    today = utc_today()
+    months = []
+    month = month_start(start_day) if start_day.day == 1 else next_month(start_day)
+    while next_month(month) <= end_day and month < month_start(today):
+        months.append(month)
+        month = next_month(month)
+
+    sketches = list(CallerSketch.objects.filter(
+        period='month', centreid=centre, langid=language, start__in=months
+    ))
+    covered = {sketch.start for sketch in sketches}
+
+    # Day ranges outside the months answered by a month sketch
+    ranges = Q()
+    day = start_day
+    while day < end_day:
+        if month_start(day) in covered:
+            day = next_month(day)
+            continue
+        run_end = min(next_month(day), end_day)
+        ranges |= Q(start__gte=day, start__lt=run_end)
+        day = run_end
+    if ranges:
+        sketches += CallerSketch.objects.filter(ranges, period='day', centreid=centre, langid=language)
+    return sketches
+
+
+def top_callers(start_day, end_day, centre=None, language=None, k=20, cli=None):
+    """The k most frequent callers from start_day to end_day (exclusive)
+
+    Returns the calls counted, the callers as dicts with the estimated
+    calls, the guaranteed minimum and their share of all calls, and, when
+    cli is given, the estimated calls of that caller.
+    """
+    sketches = covering_sketches(start_day, end_day, centre or ALL, language or ALL)
+    if not sketches:
+        return {'calls': 0, 'callers': [], 'lookup': 0 if cli else None}
+
+    loaded = [load(sketch) for sketch in sketches]
+    top = SpaceSaving.merge([top for top, _ in loaded], CAPACITY)
+    counts = CountMinSketch.merge([counts for _, counts in loaded], CMS_WIDTH, CMS_DEPTH)
+    total = sum(sketch.calls for sketch in sketches)
+
+    callers = []
+    for caller, count, error in top.top(min(k, CAPACITY)):
+        # Both sketches overestimate, so the lower of the two is closer
+        estimate = min(count, counts.estimate(caller))
+        callers.append({
+            'cli': caller,
+            'calls': estimate,
+            'min_calls': count - error,
+            'share': estimate * 100 / total if total else 0,
+        })
+    callers.sort(key=lambda caller: (-caller['calls'], caller['cli']))
+
+    lookup = None
+    if cli:
+        held = top.counters.get(cli)
+        lookup = counts.estimate(cli) if held is None else min(held[0], counts.estimate(cli))
+    return {'calls': total, 'callers': callers, 'lookup': lookup}
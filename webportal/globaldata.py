@@ -0,0 +1,124 @@
+"""Parser for ANDROMEDA /globaldata payloads
+
+The payload is a list of objects, each with a 'columns' header and 'rows' of
+string cells. The first object holds the summary row, the others hold
+centre rows. A decoder is compiled once per distinct header and cached, so
+rows are decoded in a single pass by column name rather than by fixed index.
+Objects without a header fall back to the historical column order.
+"""
+from functools import lru_cache
+
+# Field -> header names ANDROMEDA may use for it
+SUMMARY_FIELDS = {
+    'traffic': ('traffic',),
+    'operators': ('operators', 'agents'),
+    'waiting': ('waiting',),
+    'calls': ('calls',),
+    'minutes': ('minutes',),
+    'acd': ('acd',),
+}
+
+CENTRE_FIELDS = {
+    'operators': ('operators', 'agents'),
+    'traffic': ('traffic',),
+    'waiting': ('waiting',),
+    'languages': ('languages',),
+    'calls': ('calls',),
+    'minutes': ('minutes',),
+    'acd': ('acd',),
+}
+
+CENTRE_NAME_HEADERS = ('centre', 'name')
+
+# Column order used before ANDROMEDA sent headers
+LEGACY_SUMMARY_COLUMNS = ('traffic', 'agents', 'waiting', 'calls', 'minutes', 'acd', '')
+LEGACY_CENTRE_COLUMNS = ('centre', 'id', 'operators', 'languages', 'calls', 'minutes', 'acd', 'traffic')
+
+
+def to_count(value):
+    """Counter cell to int; blanks and anything non-numeric count as 0"""
+    if value.__class__ is int:
+        return value
+    try:
+        return int(value) if value.isdigit() else 0
+    except AttributeError:
+        return 0
+
+
+class RowDecoder:
+    """Decodes rows of one header layout into dicts of named counters"""
+
+    def __init__(self, columns, fields, name_headers=()):
+        index = {str(column).strip().lower(): i for i, column in enumerate(columns)}
+        counters = []
+        for field, headers in fields.items():
+            found = next((index[h] for h in headers if h in index), None)
+            if found is not None:
+                counters.append((field, found))
+        self.counters = tuple(counters)
+        # Fields this header lacks are reported as 0
+        self.missing = {field: 0 for field in fields if field not in dict(counters)}
+        self.name_index = next((index[h] for h in name_headers if h in index), None)
+        # Shorter rows cannot be decoded with this header
+        used = [i for _, i in self.counters]
+        if self.name_index is not None:
+            used.append(self.name_index)
+        self.width = max(used) + 1 if used else 0
+
+    def decode(self, row):
+        """Return the counters of row, or None if it is too short"""
+        if len(row) < self.width:
+            return None
+        decoded = {field: to_count(row[i]) for field, i in self.counters}
+        if self.missing:
+            decoded.update(self.missing)
+        return decoded
+
+    def name(self, row):
+        return row[self.name_index] if self.name_index is not None else ''
+
+
+@lru_cache(maxsize=64)
+def summary_decoder(columns):
+    return RowDecoder(columns, SUMMARY_FIELDS)
+
+
+@lru_cache(maxsize=64)
+def centre_decoder(columns):
+    return RowDecoder(columns, CENTRE_FIELDS, CENTRE_NAME_HEADERS)
+
+
+def object_columns(data_object, legacy_columns):
+    columns = data_object.get('columns')
+    return tuple(columns) if columns else legacy_columns
+
+
+def parse_summary(raw_data):
+    """Summary counters from the first object, or None if there are none"""
+    if not raw_data:
+        return None
+    summary_object = raw_data[0]
+    rows = summary_object.get('rows')
+    if not rows:
+        return None
+    return summary_decoder(object_columns(summary_object, LEGACY_SUMMARY_COLUMNS)).decode(rows[0])
+
+
+def parse_centres(raw_data):
+    """Centre dicts from every object after the summary, in payload order"""
+    centres = []
+    for centre_object in raw_data[1:]:
+        rows = centre_object.get('rows')
+        if not rows:
+            continue
+        decoder = centre_decoder(object_columns(centre_object, LEGACY_CENTRE_COLUMNS))
+        for row in rows:
+            counters = decoder.decode(row)
+            if counters is None:
+                continue
+            # Sequential IDs, as the live pages have always used
+            centre_id = len(centres) + 1
+            counters['id'] = centre_id
+            counters['name'] = decoder.name(row) or f'Centre {centre_id}'
+            centres.append(counters)
+    return centres
@@ -0,0 +1,141 @@
+"""In-memory history of live traffic for sparklines and short trends
+
+Samples are kept at the poll interval in preallocated integer arrays used as
+a ring buffer, one row per series (the summary plus each centre), so memory
+is fixed up front by TRAFFIC_HISTORY_HOURS and TRAFFIC_HISTORY_MAX_CENTRES.
+"""
+import math
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+METRICS = ('traffic', 'operators', 'waiting')
+
+# Series name used for the deployment-wide summary
+SUMMARY = ''
+
+
+class TrafficHistory:
+    """Ring buffer of per-series traffic, operators and waiting samples
+
+    Snapshots only arrive when figures change, so slots skipped in between
+    are filled with the last known values when the next one is recorded or
+    the history is read.
+    """
+
+    def __init__(self, interval, capacity, max_series):
+        self.interval = interval
+        self.capacity = capacity
+        self.max_series = max_series
+        self.rows = {}
+        self.samples = {metric: array('i', bytes(4 * capacity * max_series)) for metric in METRICS}
+        self.latest = {metric: array('i', bytes(4 * max_series)) for metric in METRICS}
+        self.first_slot = None
+        self.last_slot = None
+        self._lock = threading.Lock()
+
+    def record(self, timestamp, values):
+        """Store values ({series name: {metric: value}}) for the slot of timestamp"""
+        slot = int(timestamp // self.interval)
+        with self._lock:
+            if self.last_slot is not None and slot <= self.last_slot:
+                slot = self.last_slot
+            else:
+                self._advance(slot - 1)
+
+            for metric in METRICS:
+                latest = self.latest[metric]
+                for row in range(len(self.rows)):
+                    latest[row] = 0
+            for name, counters in values.items():
+                row = self._row(name)
+                if row is None:
+                    continue
+                for metric in METRICS:
+                    self.latest[metric][row] = counters.get(metric, 0)
+
+            self._write(slot)
+            if self.first_slot is None:
+                self.first_slot = slot
+            self.last_slot = slot
+
+    def record_snapshot(self, snapshot, body=None):
+        """Poller listener recording the summary and every centre of a snapshot"""
+        if snapshot['status'] != 200:
+            return
+        values = {SUMMARY: snapshot['data']['summary']}
+        for centre in snapshot['data']['centres']:
+            values[centre['name']] = centre
+        self.record(time.time(), values)
+
+    def series(self, name, seconds, points):
+        """Up to points values per metric covering the last seconds, peak per point
+
+        Returns None for an unknown series.
+        """
+        with self._lock:
+            row = self.rows.get(name)
+            if row is None or self.last_slot is None:
+                return None
+            self._advance(int(time.time() // self.interval))
+
+            first = max(self.first_slot, self.last_slot - self.capacity + 1,
+                        self.last_slot - int(seconds // self.interval) + 1)
+            offset = row * self.capacity
+            slots = [offset + slot % self.capacity for slot in range(first, self.last_slot + 1)]
+            raw = {metric: [self.samples[metric][i] for i in slots] for metric in METRICS}
+
+        step = max(1, math.ceil(len(slots) / max(points, 1)))
+        return {
+            'step': step * self.interval,
+            'end': (self.last_slot + 1) * self.interval,
+            **{metric: [max(values[i:i + step]) for i in range(0, len(values), step)]
+               for metric, values in raw.items()}
+        }
+
+    def names(self):
+        with self._lock:
+            return [name for name in self.rows if name != SUMMARY]
+
+    def _row(self, name):
+        row = self.rows.get(name)
+        if row is None and len(self.rows) < self.max_series:
+            row = self.rows[name] = len(self.rows)
+        return row
+
+    def _advance(self, slot):
+        # Carry the latest values forward into the slots up to and including slot
+        if self.last_slot is None or slot <= self.last_slot:
+            return
+        for missing in range(max(self.last_slot + 1, slot - self.capacity + 1), slot + 1):
+            self._write(missing)
+        self.last_slot = slot
+
+    def _write(self, slot):
+        position = slot % self.capacity
+        for metric in METRICS:
+            samples = self.samples[metric]
+            latest = self.latest[metric]
+            for row in range(len(self.rows)):
+                samples[row * self.capacity + position] = latest[row]
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """Return the process-wide traffic history"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            interval = settings.ANDROMEDA_POLL_INTERVAL
+            _history = TrafficHistory(
+                interval,
+                int(settings.TRAFFIC_HISTORY_HOURS * 3600 // interval),
+                # One extra row for the summary series
+                settings.TRAFFIC_HISTORY_MAX_CENTRES + 1,
+            )
+        return _history
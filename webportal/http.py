@@ -0,0 +1,54 @@
+"""Fast JSON responses for the polled AJAX endpoints
+
+Serializes with orjson when it is installed and falls back to the standard
+library otherwise. Either way the result is bytes written straight into the
+response, and datetimes, dates, timedeltas and Decimals are handled without
+any per-row conversion in the views:
+
+    datetime, date  ISO 8601 string
+    timedelta       seconds as a float
+    Decimal         float
+"""
+import datetime
+import decimal
+import json
+
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(value):
+    """Encode the types neither encoder handles by itself"""
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(data):
+        """Serialize data to JSON bytes"""
+        return orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    _encoder = json.JSONEncoder(default=default, separators=(',', ':'))
+
+    def dumps(data):
+        """Serialize data to JSON bytes"""
+        return _encoder.encode(data).encode()
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse equivalent serializing through dumps"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
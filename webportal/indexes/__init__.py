@@ -0,0 +1,7 @@
+"""Opt-in indexes for the legacy tables the reports read
+
+The legacy tables are unmanaged, so webportal itself never adds indexes to
+them. Add 'webportal.indexes' to INSTALLED_APPS and run migrate to build
+the indexes concurrently, then run manage.py check_indexes to confirm the
+planner uses them.
+"""
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class IndexesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'webportal.indexes'
+    label = 'webportal_indexes'
+    verbose_name = 'Legacy table indexes'
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-17 18:05
+
+from django.db import migrations
+
+
+def create_index(name, definition):
+    # CONCURRENTLY keeps the tables writable while ANDROMEDA is logging calls
+    return migrations.RunSQL(
+        sql=f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}",
+        reverse_sql=f"DROP INDEX CONCURRENTLY IF EXISTS {name}",
+    )
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('webportal', '0001_initial'),
+    ]
+
+    operations = [
+        # Live sessions: only the handful of open sessions, newest first
+        create_index(
+            'sessions_active_start_idx',
+            "ON sessions (start DESC) WHERE duration IS NULL",
+        ),
+        # Agent detail: one operator's sessions over a date range
+        create_index(
+            'sessions_operid_start_idx',
+            "ON sessions (operid, start)",
+        ),
+        # Centre and language reports: date range scans reading only these columns
+        create_index(
+            'sessions_start_covering_idx',
+            "ON sessions (start) INCLUDE (operid, duration, calltotal, callduration)",
+        ),
+        # Operators of a centre and language
+        create_index(
+            'operators_centre_lang_idx',
+            "ON operators (centreid, langid)",
+        ),
+        # Rate bands of a language and centre in ACD order
+        create_index(
+            'payplan_lookup_idx',
+            "ON payplan (langid, centreid, acd) INCLUDE (rate)",
+        ),
+        migrations.RunSQL(
+            sql="ANALYZE sessions; ANALYZE operators; ANALYZE payplan;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
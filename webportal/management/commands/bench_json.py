@@ -0,0 +1,76 @@
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+
+from webportal import http
+from webportal.active_sessions import encode_columns
+
+
+def sample_sessions(count):
+    """Active sessions shaped like fetch_active_sessions returns them"""
+    now = datetime.now(timezone.utc)
+    rng = random.Random(count)
+    sessions_list = []
+    for i in range(count):
+        start = now - timedelta(seconds=rng.randint(0, 8 * 3600))
+        sessions_list.append({
+            'id': i + 1,
+            'agent_name': f'Agent {i % 700}',
+            'start': start,
+            'duration_seconds': Decimal(f'{(now - start).total_seconds():.6f}'),
+            'language_name': rng.choice(('English', 'Spanish', 'French', 'German', 'Italian')),
+            'centre_name': f'Centre {i % 12}',
+            'calltotal': rng.randint(0, 40),
+            'callduration': timedelta(seconds=rng.randint(0, 4 * 3600)),
+            'external': rng.random() < 0.1,
+        })
+    return sessions_list
+
+
+def legacy_response(sessions_list):
+    # What live_sessions_data did before: strftime per row, then JsonResponse
+    rows = [
+        dict(s, start=s['start'].strftime('%Y-%m-%d %H:%M:%S'),
+             callduration=s['callduration'].total_seconds())
+        for s in sessions_list
+    ]
+    return JsonResponse({'sessions': rows, 'count': len(rows)})
+
+
+def fast_response(sessions_list):
+    return http.FastJsonResponse({'sessions': sessions_list, 'count': len(sessions_list)})
+
+
+class Command(BaseCommand):
+    help = 'Compare JsonResponse with FastJsonResponse on a live sessions payload'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=5000, help='Sessions in the payload')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per response class')
+
+    def handle(self, *args, **options):
+        sessions_list = sample_sessions(options['sessions'])
+        encoder = 'orjson' if http.orjson is not None else 'json (install orjson for the fast path)'
+        self.stdout.write(f"{options['sessions']} sessions, {options['repeat']} runs, encoder: {encoder}")
+
+        results = {}
+        for name, build in (('JsonResponse', legacy_response), ('FastJsonResponse', fast_response)):
+            build(sessions_list)
+            best = min(timeit.repeat(lambda: build(sessions_list), number=1, repeat=options['repeat']))
+            size = len(build(sessions_list).content)
+            results[name] = best
+            self.stdout.write(f"{name:<18} {best * 1000:8.2f} ms  {size / 1024:8.1f} KiB")
+
+        speedup = results['JsonResponse'] / results['FastJsonResponse']
+        self.stdout.write(self.style.SUCCESS(f"FastJsonResponse is {speedup:.1f}x faster"))
+
+        # The opt-in ?format=columns encoding, for payload size on slow links
+        rows = len(http.dumps({'sessions': sessions_list}))
+        columns = len(http.dumps({'sessions': encode_columns(sessions_list)}))
+        self.stdout.write(
+            f"format=columns    {columns / 1024:8.1f} KiB vs {rows / 1024:.1f} KiB as rows ({columns / rows:.0%})"
+        )
@@ -0,0 +1,112 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from webportal.active_sessions import ACTIVE_SESSIONS_SQL
+
+# Index -> (table, query shaped like the view it serves)
+INDEX_PROBES = {
+    'sessions_active_start_idx': ('sessions', ACTIVE_SESSIONS_SQL),
+    'sessions_operid_start_idx': ('sessions', """
+        SELECT s.id, s.start, s.duration, s.calltotal, s.callduration
+        FROM sessions s
+        WHERE s.operid = %(operid)s
+            AND s.duration IS NOT NULL
+            AND s.start >= %(start)s
+            AND s.start < %(end)s
+        ORDER BY s.start DESC
+    """),
+    'sessions_start_covering_idx': ('sessions', """
+        SELECT s.operid, COUNT(*), SUM(s.calltotal), SUM(EXTRACT(EPOCH FROM s.callduration))
+        FROM sessions s
+        WHERE s.duration IS NOT NULL
+            AND s.start >= %(start)s
+            AND s.start < %(end)s
+        GROUP BY s.operid
+    """),
+    'operators_centre_lang_idx': ('operators', """
+        SELECT id FROM operators WHERE centreid = %(centreid)s AND langid = %(langid)s
+    """),
+    'payplan_lookup_idx': ('payplan', """
+        SELECT acd, rate FROM payplan
+        WHERE langid = %(langid)s AND centreid = %(centreid)s
+        ORDER BY acd
+    """),
+}
+
+
+def plan_indexes(node):
+    """Names of every index a JSON EXPLAIN plan node and its children use"""
+    names = set()
+    if 'Index Name' in node:
+        names.add(node['Index Name'])
+    for child in node.get('Plans', []):
+        names |= plan_indexes(child)
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Check that the legacy table indexes exist, are valid and are used by the planner'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Date range used for the report probes')
+        parser.add_argument('--operid', type=int, default=1)
+        parser.add_argument('--centreid', type=int, default=1)
+        parser.add_argument('--langid', type=int, default=1)
+
+    def handle(self, *args, **options):
+        end = datetime.now(timezone.utc)
+        params = {
+            'start': end - timedelta(days=options['days']),
+            'end': end,
+            'operid': options['operid'],
+            'centreid': options['centreid'],
+            'langid': options['langid'],
+        }
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relname, i.indisvalid
+                FROM pg_index i
+                INNER JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = ANY(%s)
+            """, [list(INDEX_PROBES)])
+            valid = dict(cursor.fetchall())
+
+        failures = 0
+        for name, (table, sql) in INDEX_PROBES.items():
+            if name not in valid:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{name}: missing (is webportal.indexes installed and migrated?)"))
+                continue
+            if not valid[name]:
+                # Left behind by an interrupted CREATE INDEX CONCURRENTLY
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{name}: invalid, drop it and migrate again"))
+                continue
+
+            if name in self.explain(sql, params):
+                self.stdout.write(self.style.SUCCESS(f"{name}: used"))
+            elif name in self.explain(sql, params, force=True):
+                # Usable, but the planner prefers a scan, e.g. on a small table
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: usable but not chosen for {table} at its current size"
+                ))
+            else:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{name}: not used by the query it was built for"))
+
+        if failures:
+            raise CommandError(f'{failures} index check(s) failed')
+
+    def explain(self, sql, params, force=False):
+        with transaction.atomic(), connection.cursor() as cursor:
+            if force:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan_indexes(plan[0]['Plan'])
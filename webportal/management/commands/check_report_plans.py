@@ -0,0 +1,80 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from webportal import reports, trends
+from webportal.rollups import day_start, utc_today
+
+# Tables no report may read with a sequential scan
+LARGE_TABLES = ('sessions', 'sessions_daily')
+
+
+def seq_scans(node):
+    """Tables read by Seq Scan anywhere in a JSON EXPLAIN plan node"""
+    tables = []
+    if node.get('Node Type') == 'Seq Scan':
+        tables.append(node.get('Relation Name'))
+    for child in node.get('Plans', []):
+        tables.extend(seq_scans(child))
+    return tables
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every report query and fail if any needs a sequential scan of the session tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=31, help='Length of the report range, ending today')
+        parser.add_argument('--centre', type=int, default=1)
+        parser.add_argument('--language', type=int, default=1)
+        parser.add_argument('--operator', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # Ending today means the plans include both the rollup and the raw sessions
+        end_day = utc_today() + timedelta(days=1)
+        start_day = end_day - timedelta(days=options['days'])
+        centre, language = options['centre'], options['language']
+
+        queries = {
+            'hierarchy': reports.hierarchy_sql(start_day, end_day),
+            'centres': reports.aggregate_sql('centre', start_day, end_day),
+            'centre detail': reports.aggregate_sql('language', start_day, end_day, centre=centre),
+            'language detail': reports.aggregate_sql('agent', start_day, end_day, centre=centre, language=language),
+            'agent detail': reports.agent_sessions_sql(options['operator'], start_day, end_day),
+            'agent detail page': reports.agent_sessions_sql(
+                options['operator'], start_day, end_day,
+                older_than=(day_start(end_day), 0), limit=reports.AGENT_SESSIONS_PAGE_SIZE + 1
+            ),
+            'agent totals': reports.agent_totals_sql(options['operator'], start_day, end_day),
+            'daily trend': trends.trend_sql('day', start_day, end_day, centre=centre),
+            'hourly trend': trends.trend_sql('hour', end_day - timedelta(days=2), end_day, language=language),
+        }
+
+        failures = 0
+        for name, (sql, params) in queries.items():
+            scanned = [table for table in self.explain(sql, params) if table in LARGE_TABLES]
+            if scanned:
+                failures += 1
+                self.stdout.write(self.style.ERROR(
+                    f"{name}: sequential scan of {', '.join(sorted(set(scanned)))}"
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name}: ok"))
+
+        if failures:
+            raise CommandError(
+                f'{failures} report plan(s) need a sequential scan; '
+                'check the predicates on start and that webportal.indexes is migrated'
+            )
+
+    def explain(self, sql, params):
+        # With sequential scans priced out, one only remains when no index
+        # can answer the query, e.g. a predicate wrapping start in a function
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return seq_scans(plan[0]['Plan'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from webportal.friends import BATCH_CALLS, refresh_caller_sketches
+
+
+class Command(BaseCommand):
+    help = 'Count new calls into the frequent caller sketches used by the friends report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=BATCH_CALLS, help='Calls read per transaction')
+
+    def handle(self, *args, **options):
+        # Meant to run from cron every few minutes; each run only reads new calls
+        counted = refresh_caller_sketches(options['batch'])
+        self.stdout.write(self.style.SUCCESS(f'Counted {counted} new call(s) into the caller sketches'))
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webportal.rollups import refresh_sessions_daily
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the sessions_daily rollup for the days whose sessions changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Also rebuild every day from this date (YYYY-MM-DD), e.g. to backfill the rollup',
+        )
+
+    def handle(self, *args, **options):
+        # Meant to run from cron, e.g. hourly and shortly after midnight UTC
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        days = refresh_sessions_daily(since)
+        if days:
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {len(days)} day(s) of sessions_daily, {days[0]:%Y-%m-%d} to {days[-1]:%Y-%m-%d}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS('sessions_daily is up to date'))
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from webportal.timeseries import rollup
+
+
+class Command(BaseCommand):
+    help = 'Roll persisted ANDROMEDA traffic samples up into 15-minute and hourly buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Rebuild buckets from this date (YYYY-MM-DD) instead of the last two hours',
+        )
+
+    def handle(self, *args, **options):
+        # The poller rolls up as it goes; this is for backfills and catch-up
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        else:
+            since = datetime.now(timezone.utc) - timedelta(hours=2)
+
+        rollup(since)
+        self.stdout.write(self.style.SUCCESS(f'Traffic samples rolled up since {since:%Y-%m-%d %H:%M}'))
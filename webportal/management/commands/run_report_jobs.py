@@ -0,0 +1,34 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from webportal.report_jobs import work
+
+
+class Command(BaseCommand):
+    help = 'Run queued background report jobs (see REPORT_JOBS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes to run')
+        parser.add_argument('--poll', type=float, default=2, help='Seconds between checks of an empty queue')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        # Meant to run under a process supervisor alongside the web workers
+        if options['workers'] <= 1:
+            work(options['poll'], options['once'])
+            return
+
+        # Each forked worker must open its own database connection
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=work, args=(options['poll'], options['once']), name=f'report-worker-{n}')
+            for n in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} report workers")
+        for process in processes:
+            process.join()
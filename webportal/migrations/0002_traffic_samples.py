@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 15:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webportal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrafficSamples',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('centre', models.CharField(max_length=64)),
+                ('samples', models.IntegerField()),
+                ('traffic_sum', models.BigIntegerField()),
+                ('operators_sum', models.BigIntegerField()),
+                ('waiting_sum', models.BigIntegerField()),
+                ('traffic_max', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'traffic_samples',
+                'unique_together': {('resolution', 'centre', 'bucket')},
+            },
+        ),
+    ]
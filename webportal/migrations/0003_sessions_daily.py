@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webportal', '0002_traffic_samples'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionsDailyDay',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('sessions', models.IntegerField()),
+                ('max_id', models.BigIntegerField()),
+                ('calls', models.BigIntegerField()),
+                ('callduration', models.DurationField()),
+            ],
+            options={
+                'db_table': 'sessions_daily_days',
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionsDailyWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('covered_from', models.DateField(blank=True, null=True)),
+                ('refreshed_through', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'sessions_daily_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='SessionsDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('operid', models.IntegerField()),
+                ('centreid', models.IntegerField(blank=True, null=True)),
+                ('langid', models.IntegerField(blank=True, null=True)),
+                ('sessions', models.IntegerField()),
+                ('calls', models.BigIntegerField()),
+                ('call_seconds', models.FloatField()),
+            ],
+            options={
+                'db_table': 'sessions_daily',
+                'unique_together': {('day', 'operid', 'centreid', 'langid')},
+            },
+        ),
+    ]
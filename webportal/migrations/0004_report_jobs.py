@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webportal', '0003_sessions_daily'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=16)),
+                ('centreid', models.IntegerField(blank=True, null=True)),
+                ('langid', models.IntegerField(blank=True, null=True)),
+                ('start_day', models.DateField()),
+                ('end_day', models.DateField()),
+                ('status', models.CharField(default='queued', max_length=16)),
+                ('progress', models.IntegerField(default=0)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('worker', models.CharField(blank=True, default='', max_length=64)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('heartbeat', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'report_jobs',
+                'indexes': [models.Index(fields=['status', 'created'], name='report_jobs_status_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('level', 'start_day', 'end_day', 'centreid'), name='report_jobs_active_uniq', nulls_distinct=False)],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webportal', '0004_report_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallerSketchWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_call_id', models.BigIntegerField(default=0)),
+                ('pending_ids', models.JSONField(default=list)),
+            ],
+            options={
+                'db_table': 'caller_sketches_watermark',
+            },
+        ),
+        migrations.CreateModel(
+            name='CallerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=8)),
+                ('start', models.DateField()),
+                ('centreid', models.IntegerField()),
+                ('langid', models.IntegerField()),
+                ('calls', models.BigIntegerField()),
+                ('top', models.JSONField()),
+                ('counts', models.BinaryField()),
+            ],
+            options={
+                'db_table': 'caller_sketches',
+                'unique_together': {('period', 'start', 'centreid', 'langid')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:00
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    # The traffic poller's lease and snapshot live in the shared cache; this
+    # is a no-op unless a DatabaseCache is configured
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webportal', '0005_caller_sketches'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
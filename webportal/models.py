@@ -310,3 +310,135 @@ class Suspects(models.Model):
     class Meta:
         managed = False
         db_table = 'suspects'
+
+
+class TrafficSamples(models.Model):
+    """ANDROMEDA traffic per centre and time bucket, kept at several resolutions
+
+    Sums over the polls in the bucket are stored rather than averages, so
+    coarser buckets can be rolled up from finer ones exactly. The summary
+    series uses an empty centre name.
+    """
+    resolution = models.IntegerField()  # Bucket width in seconds
+    bucket = models.DateTimeField()
+    centre = models.CharField(max_length=64)
+    samples = models.IntegerField()
+    traffic_sum = models.BigIntegerField()
+    operators_sum = models.BigIntegerField()
+    waiting_sum = models.BigIntegerField()
+    traffic_max = models.IntegerField()
+
+    class Meta:
+        db_table = 'traffic_samples'
+        unique_together = (('resolution', 'centre', 'bucket'),)
+
+
+class SessionsDaily(models.Model):
+    """Finished sessions per day, operator, centre and language
+
+    Maintained by manage.py refresh_sessions_daily for the days whose
+    signature in sessions_daily_days changed; see webportal/rollups.py.
+    """
+    day = models.DateField()
+    operid = models.IntegerField()
+    centreid = models.IntegerField(blank=True, null=True)
+    langid = models.IntegerField(blank=True, null=True)
+    sessions = models.IntegerField()
+    calls = models.BigIntegerField()
+    call_seconds = models.FloatField()
+
+    class Meta:
+        db_table = 'sessions_daily'
+        unique_together = (('day', 'operid', 'centreid', 'langid'),)
+
+
+class SessionsDailyDay(models.Model):
+    """Signature of the finished sessions a day's rollup rows were built from"""
+    day = models.DateField(primary_key=True)
+    sessions = models.IntegerField()
+    max_id = models.BigIntegerField()
+    calls = models.BigIntegerField()
+    callduration = models.DurationField()
+
+    class Meta:
+        db_table = 'sessions_daily_days'
+
+
+class SessionsDailyWatermark(models.Model):
+    """Single row: the days sessions_daily covers"""
+    covered_from = models.DateField(blank=True, null=True)
+    refreshed_through = models.DateField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'sessions_daily_watermark'
+
+
+class ReportJob(models.Model):
+    """A long report computed in the background by manage.py run_report_jobs
+
+    See webportal/report_jobs.py. end_day is exclusive, and result holds the
+    report rows once status is done.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    level = models.CharField(max_length=16)
+    centreid = models.IntegerField(blank=True, null=True)
+    langid = models.IntegerField(blank=True, null=True)
+    start_day = models.DateField()
+    end_day = models.DateField()
+    status = models.CharField(max_length=16, default=QUEUED)
+    progress = models.IntegerField(default=0)  # Percent of the range done
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=64, blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    heartbeat = models.DateTimeField(blank=True, null=True)  # Last sign of life from the worker
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'report_jobs'
+        indexes = [models.Index(fields=['status', 'created'], name='report_jobs_status_idx')]
+        # One queued or running job per report, however many requests ask at once
+        constraints = [
+            models.UniqueConstraint(
+                fields=['level', 'start_day', 'end_day', 'centreid'],
+                condition=models.Q(status__in=['queued', 'running']),
+                nulls_distinct=False,
+                name='report_jobs_active_uniq',
+            ),
+        ]
+
+
+class CallerSketch(models.Model):
+    """Frequent caller CLIs of a day or month at a centre and language
+
+    centreid and langid are 0 for all centres or languages. Maintained by
+    manage.py refresh_caller_sketches; see webportal/friends.py.
+    """
+    period = models.CharField(max_length=8)  # 'day' or 'month'
+    start = models.DateField()  # First day of the period
+    centreid = models.IntegerField()
+    langid = models.IntegerField()
+    calls = models.BigIntegerField()
+    top = models.JSONField()  # Space-saving counters as [cli, count, error]
+    counts = models.BinaryField()  # Count-min sketch counters
+
+    class Meta:
+        db_table = 'caller_sketches'
+        unique_together = (('period', 'start', 'centreid', 'langid'),)
+
+
+class CallerSketchWatermark(models.Model):
+    """Single row: the last calls.id counted into the caller sketches
+
+    pending_ids holds [id, unix time first missed] of ids below last_call_id
+    that had no call yet, so calls committed late are still counted.
+    """
+    last_call_id = models.BigIntegerField(default=0)
+    pending_ids = models.JSONField(default=list)
+
+    class Meta:
+        db_table = 'caller_sketches_watermark'
@@ -0,0 +1,9 @@
+"""Opt-in NOTIFY trigger for the live sessions registry
+
+The trigger sends every change to ANDROMEDA's sessions table on the
+sessions_changed channel, which webportal/session_registry.py listens on.
+It costs ANDROMEDA's write path a notification per row and a lock at
+every commit, so it is only installed with the registry: add
+'webportal.notify' to INSTALLED_APPS along with LIVE_SESSIONS_REGISTRY and
+run migrate. Migrating the app back to zero removes the trigger.
+"""
@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class NotifyConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'webportal.notify'
+    label = 'webportal_notify'
+    verbose_name = 'Live sessions notifications'
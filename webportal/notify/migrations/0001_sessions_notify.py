@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-17 21:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webportal', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE OR REPLACE FUNCTION sessions_notify() RETURNS trigger AS $$
+                BEGIN
+                    IF TG_OP = 'DELETE' THEN
+                        PERFORM pg_notify('sessions_changed', OLD.id::text);
+                    ELSE
+                        PERFORM pg_notify('sessions_changed', NEW.id::text);
+                    END IF;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE TRIGGER sessions_notify
+                    AFTER INSERT OR UPDATE OR DELETE ON sessions
+                    FOR EACH ROW EXECUTE FUNCTION sessions_notify();
+            """,
+            reverse_sql="""
+                DROP TRIGGER IF EXISTS sessions_notify ON sessions;
+                DROP FUNCTION IF EXISTS sessions_notify();
+            """,
+        ),
+    ]
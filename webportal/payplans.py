@@ -0,0 +1,81 @@
+"""Payplan rate tiers held in memory for the centre reports
+
+Each (centre, language) has a list of tiers sorted by ACD, and a language
+with no tiers of its own at a centre falls back to the global ones (centre
+0). The whole payplan table is small, so every process loads it in one
+query and looks rates up with a binary search over the ACD breakpoints.
+
+The admin payments views call invalidate() after any change. That bumps a
+version in the shared cache, and each process reloads its table the next
+time it sees a version other than the one it loaded.
+"""
+import threading
+import time
+from bisect import bisect_right
+
+from django.core.cache import cache
+from django.db import connection
+
+GLOBAL_CENTRE = 0
+
+VERSION_CACHE_KEY = 'payplan-rates-version'
+
+PAYPLANS_SQL = """
+    SELECT centreid, langid, acd, rate
+    FROM payplan
+    WHERE centreid IS NOT NULL
+        AND langid IS NOT NULL
+        AND acd IS NOT NULL
+    ORDER BY centreid, langid, acd, id
+"""
+
+
+class RateTable:
+    """Payplan tiers by (centre, language) as sorted ACD breakpoints and rates"""
+
+    def __init__(self, rows):
+        self.tiers = {}
+        for centreid, langid, acd, rate in rows:
+            breakpoints, rates = self.tiers.setdefault((centreid, langid), ([], []))
+            breakpoints.append(acd)
+            rates.append(rate)
+
+    def rate(self, centre, language, acd_seconds):
+        """Rate of the highest tier whose ACD is at most acd_seconds, or None
+
+        Uses the centre's own tiers for the language when it has any, else
+        the global tiers.
+        """
+        tiers = self.tiers.get((centre, language)) or self.tiers.get((GLOBAL_CENTRE, language))
+        if tiers is None:
+            return None
+        breakpoints, rates = tiers
+        index = bisect_right(breakpoints, acd_seconds)
+        return rates[index - 1] if index else None
+
+
+_table = None
+_table_version = None
+_table_lock = threading.Lock()
+
+
+def load_rate_table():
+    with connection.cursor() as cursor:
+        cursor.execute(PAYPLANS_SQL)
+        return RateTable(cursor.fetchall())
+
+
+def get_rate_table():
+    """Return the process-wide rate table, reloading it after invalidate()"""
+    global _table, _table_version
+    version = cache.get(VERSION_CACHE_KEY)
+    with _table_lock:
+        if _table is None or version != _table_version:
+            _table = load_rate_table()
+            _table_version = version
+        return _table
+
+
+def invalidate():
+    """Make every process reload its rate table after a payplan change"""
+    cache.set(VERSION_CACHE_KEY, time.time_ns(), timeout=None)
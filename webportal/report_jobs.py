@@ -0,0 +1,158 @@
+"""Background jobs for centre reports over long date ranges
+
+With REPORT_JOBS on, a centres or centre detail report spanning more than
+REPORT_JOBS_MIN_DAYS days that is not already cached is queued as a
+ReportJob instead of being computed inside the web request, which could
+outlast the proxy timeout. The page polls the job's progress and reloads
+with ?job=<id> once it is done, rendering the stored rows.
+
+Workers started by manage.py run_report_jobs claim queued jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can share the
+queue, and pick up jobs whose worker stopped sending heartbeats. A running
+job's heartbeat is refreshed every HEARTBEAT_INTERVAL seconds however long
+its chunks take.
+"""
+import os
+import socket
+import threading
+import time
+from dataclasses import asdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import reports
+from .models import ReportJob
+
+# Days aggregated per query, and so per progress update
+CHUNK_DAYS = 7
+
+# Seconds between heartbeats of a running job, and without one after which
+# the job is taken over
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 300
+
+# Finished jobs are deleted after this long
+KEEP_FINISHED = timedelta(days=1)
+
+
+def report_rows(request, level, start_day, end_day, centre=None):
+    """ReportRows for a report view, or the ReportJob computing them
+
+    Short ranges, cached reports and deployments without REPORT_JOBS are
+    answered inline. A request carrying ?job= for a finished job with the
+    same parameters gets that job's rows.
+    """
+    key = reports.aggregate_key(level, centre)
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        job = ReportJob.objects.filter(
+            id=int(job_id), level=level, centreid=centre, start_day=start_day, end_day=end_day
+        ).first()
+        if job is not None:
+            if job.status != ReportJob.DONE:
+                return job
+            rows = [reports.ReportRow(**row) for row in job.result]
+            reports.store(key, start_day, end_day, rows)
+            return rows
+
+    long_range = (end_day - start_day).days > settings.REPORT_JOBS_MIN_DAYS
+    if not settings.REPORT_JOBS or not long_range:
+        return reports.aggregate(level, start_day, end_day, centre=centre)
+    rows = reports.cached_aggregate(level, start_day, end_day, centre=centre)
+    if rows is not None:
+        return rows
+    return enqueue(level, start_day, end_day, centre)
+
+
+def enqueue(level, start_day, end_day, centre=None):
+    """Queue a report job, or return the one already queued or running for it"""
+    params = {'level': level, 'centreid': centre, 'start_day': start_day, 'end_day': end_day}
+    active = ReportJob.objects.filter(status__in=[ReportJob.QUEUED, ReportJob.RUNNING], **params)
+    job = active.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return ReportJob.objects.create(**params)
+    except IntegrityError:
+        # Another request queued it first (report_jobs_active_uniq)
+        return active.get()
+
+
+def keep_alive(job, stop):
+    """Refresh job's heartbeat every HEARTBEAT_INTERVAL seconds until stop is set"""
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            ReportJob.objects.filter(id=job.id, worker=job.worker).update(heartbeat=timezone.now())
+    finally:
+        connection.close()
+
+
+def claim_job(worker):
+    """Mark the oldest queued or abandoned job as running by worker and return it"""
+    stale = timezone.now() - timedelta(seconds=STALE_AFTER)
+    with transaction.atomic():
+        job = (ReportJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(Q(status=ReportJob.QUEUED) | Q(status=ReportJob.RUNNING, heartbeat__lt=stale))
+               .order_by('created')
+               .first())
+        if job is None:
+            return None
+        job.status = ReportJob.RUNNING
+        job.worker = worker
+        job.progress = 0
+        job.heartbeat = timezone.now()
+        job.save(update_fields=['status', 'worker', 'progress', 'heartbeat'])
+    return job
+
+
+def run_job(job):
+    """Compute a claimed job, storing its rows or error"""
+    def progress(done, total):
+        job.progress = int(done * 100 / total)
+        job.heartbeat = timezone.now()
+        job.save(update_fields=['progress', 'heartbeat'])
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=keep_alive, args=(job, stop), name=f'report-job-{job.id}', daemon=True)
+    heartbeat.start()
+    try:
+        rows = reports.aggregate_in_chunks(
+            job.level, job.start_day, job.end_day, centre=job.centreid,
+            chunk_days=CHUNK_DAYS, progress=progress
+        )
+        job.result = [asdict(row) for row in rows]
+        job.status = ReportJob.DONE
+        job.progress = 100
+    except Exception as e:
+        print(f"Error in report job {job.id}: {e}")
+        job.status = ReportJob.FAILED
+        job.error = str(e)
+    finally:
+        stop.set()
+        heartbeat.join()
+    job.finished = timezone.now()
+    job.save(update_fields=['result', 'status', 'progress', 'error', 'finished'])
+
+
+def work(poll_interval, once=False):
+    """Run jobs as they are queued; with once, stop when the queue is empty"""
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    while True:
+        close_old_connections()
+        ReportJob.objects.filter(
+            status__in=[ReportJob.DONE, ReportJob.FAILED], finished__lt=timezone.now() - KEEP_FINISHED
+        ).delete()
+
+        job = claim_job(worker)
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
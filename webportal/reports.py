@@ -0,0 +1,498 @@
+"""Report queries shared by the centre, language and agent report views
+
+Every report is one aggregate over daily_sessions_source() at a grouping
+level (centre, language or agent), optionally filtered to a centre and a
+language, for a range of whole days. Ranges are always half-open on day
+boundaries, so every predicate on sessions.start stays index-friendly, and
+results come back as ReportRow and SessionRow instances rather than tuples.
+
+The centre -> language -> agent drill-down is answered from one hierarchy
+per range: a GROUPING SETS query computes all three levels in one pass, and
+the result is cached as a ReportTree, so each level after the first page is
+a lookup in the tree.
+
+Results are cached by level, filters and range. A range of completed days
+only changes when the rollup rebuilds one of them, so the generation of its
+months (see rollups.range_generation()) is part of the cache key and those
+entries last REPORTS_PAST_CACHE_TTL seconds; ranges including today expire
+after REPORTS_CACHE_TTL seconds.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .rollups import daily_sessions_source, day_start, range_generation, utc_today
+
+# Rows fetched per round trip when streaming a report for export
+EXPORT_BATCH_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class Level:
+    """How one grouping level joins, labels and orders the daily rows"""
+    join: str
+    id: str
+    name: str
+    order: str
+
+
+LEVELS = {
+    'centre': Level(
+        join='INNER JOIN centres g ON d.centreid = g.id',
+        id='g.id',
+        name='g.name',
+        order='g.name',
+    ),
+    'language': Level(
+        join='INNER JOIN languages g ON d.langid = g.id',
+        id='g.id',
+        name='g.name',
+        order='g.name',
+    ),
+    'agent': Level(
+        join='INNER JOIN operators g ON d.operid = g.id',
+        id='g.id',
+        name="CONCAT(g.fname, ' ', g.sname)",
+        order='g.fname, g.sname',
+    ),
+}
+
+AGGREGATE_SQL = """
+    SELECT
+        {level.id} AS id,
+        {level.name} AS name,
+        COUNT(DISTINCT d.langid) AS languages_count,
+        COUNT(DISTINCT d.operid) AS agents_count,
+        SUM(d.sessions)::bigint AS sessions_count,
+        COALESCE(SUM(d.calls), 0)::bigint AS total_calls,
+        COALESCE(SUM(d.call_seconds), 0) AS total_minutes_seconds
+    FROM {source} d
+    {level.join}
+    WHERE {where}
+    GROUP BY {level.id}, {level.name}, {level.order}
+    ORDER BY {level.order}
+"""
+
+# Per group, language and agent, so a long range can be summed a chunk at a
+# time and still give exact distinct language and agent counts
+PARTIAL_AGGREGATE_SQL = """
+    SELECT
+        {level.id} AS id,
+        {level.name} AS name,
+        d.langid,
+        d.operid,
+        SUM(d.sessions)::bigint,
+        COALESCE(SUM(d.calls), 0)::bigint,
+        COALESCE(SUM(d.call_seconds), 0)
+    FROM {source} d
+    {level.join}
+    WHERE {where}
+    GROUP BY {level.id}, {level.name}, d.langid, d.operid
+"""
+
+# Every centre, language within a centre and agent within those in one pass.
+# Names are MAX()ed since only ids are grouped, and rows come out in the
+# order each level is shown in.
+HIERARCHY_SQL = """
+    SELECT
+        GROUPING(d.langid, d.operid) AS depth,
+        d.centreid,
+        d.langid,
+        d.operid,
+        MAX(c.name),
+        MAX(l.name),
+        MAX(CONCAT(g.fname, ' ', g.sname)),
+        MAX(g.id),
+        COUNT(DISTINCT d.langid),
+        COUNT(DISTINCT d.operid),
+        SUM(d.sessions)::bigint,
+        COALESCE(SUM(d.calls), 0)::bigint,
+        COALESCE(SUM(d.call_seconds), 0)
+    FROM {source} d
+    INNER JOIN centres c ON d.centreid = c.id
+    LEFT JOIN languages l ON d.langid = l.id
+    LEFT JOIN operators g ON d.operid = g.id
+    GROUP BY GROUPING SETS (
+        (d.centreid),
+        (d.centreid, d.langid),
+        (d.centreid, d.langid, d.operid)
+    )
+    ORDER BY MAX(c.name), MAX(l.name), MAX(g.fname), MAX(g.sname)
+"""
+
+# GROUPING(d.langid, d.operid) of each level of the hierarchy
+CENTRE_DEPTH = 3
+LANGUAGE_DEPTH = 1
+AGENT_DEPTH = 0
+
+AGENT_SESSIONS_SQL = """
+    SELECT
+        s.id,
+        s.start,
+        EXTRACT(EPOCH FROM s.duration),
+        COALESCE(d.username, 'Unknown Device'),
+        s.calltotal,
+        EXTRACT(EPOCH FROM s.callduration)
+    FROM sessions s
+    LEFT JOIN devices d ON s.devid = d.id
+    WHERE s.operid = %s
+        AND s.duration IS NOT NULL
+        AND s.start >= %s
+        AND s.start < %s
+        {keyset}
+    ORDER BY s.start {direction}, s.id {direction}
+    {limit}
+"""
+
+# Sessions on either side of a (start, id) page boundary. The start bound
+# alone is what the (operid, start) index answers, so a page costs the same
+# however deep it is.
+OLDER_THAN_SQL = "AND s.start <= %s AND (s.start < %s OR s.id < %s)"
+NEWER_THAN_SQL = "AND s.start >= %s AND (s.start > %s OR s.id > %s)"
+
+AGENT_TOTALS_SQL = """
+    SELECT
+        COALESCE(SUM(d.sessions), 0)::bigint,
+        COALESCE(SUM(d.calls), 0)::bigint,
+        COALESCE(SUM(d.call_seconds), 0)
+    FROM {source} d
+    WHERE d.operid = %s
+"""
+
+AGENT_SESSIONS_PAGE_SIZES = (50, 100, 250, 500)
+AGENT_SESSIONS_PAGE_SIZE = 100
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class ReportRow:
+    """Totals for one centre, language or agent over the report range"""
+    id: int
+    name: str
+    languages_count: int
+    agents_count: int
+    sessions_count: int
+    total_calls: int
+    total_minutes_seconds: float
+    rate: Optional[float] = None
+    due: Optional[float] = None
+
+    @property
+    def acd_seconds(self):
+        return self.total_minutes_seconds / self.total_calls if self.total_calls else 0
+
+
+@dataclass
+class SessionRow:
+    """One finished session of an agent"""
+    session_id: int
+    start: datetime
+    duration_seconds: float
+    device_name: str
+    calltotal: int
+    callduration_seconds: float
+
+    @property
+    def acd_seconds(self):
+        if not self.calltotal or self.calltotal <= 0:
+            return 0
+        if self.callduration_seconds is None:
+            return None
+        return self.callduration_seconds / self.calltotal
+
+
+@dataclass
+class ReportTree:
+    """Centre, language and agent rows of one range, by their parent ids"""
+    centres: list
+    languages: dict  # centre id -> ReportRow per language
+    agents: dict  # (centre id, language id) -> ReportRow per agent
+
+    def rows(self, level, centre=None, language=None):
+        """The rows aggregate() would return, or None if the tree cannot answer"""
+        if level == 'centre' and centre is None and language is None:
+            return self.centres
+        if level == 'language' and centre is not None and language is None:
+            return self.languages.get(centre, [])
+        if level == 'agent' and centre is not None and language is not None:
+            return self.agents.get((centre, language), [])
+        return None
+
+
+@dataclass
+class SessionPage:
+    """One page of an agent's sessions, newest first, with cursors to its neighbours"""
+    rows: list
+    newer: Optional[str]
+    older: Optional[str]
+
+
+def day_range(start_date, end_date):
+    """(first day, day after the last) for YYYY-MM-DD dates, both inclusive
+
+    Raises ValueError for dates in any other format.
+    """
+    start_day = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end_day = datetime.strptime(end_date, '%Y-%m-%d').date() + timedelta(days=1)
+    return start_day, end_day
+
+
+def aggregate_sql(level, start_day, end_day, centre=None, language=None, template=AGGREGATE_SQL):
+    """SQL and params of aggregate(), for running it or checking its plan"""
+    level = LEVELS[level]
+    source, params = daily_sessions_source(start_day, end_day)
+    conditions = ['TRUE']
+    if centre is not None:
+        conditions.append('d.centreid = %s')
+        params.append(centre)
+    if language is not None:
+        conditions.append('d.langid = %s')
+        params.append(language)
+    sql = template.format(level=level, source=source, where=' AND '.join(conditions))
+    return sql, params
+
+
+def aggregate(level, start_day, end_day, centre=None, language=None):
+    """ReportRow per centre, language or agent with finished sessions from start_day to end_day (exclusive)"""
+    rows = cached_rows(aggregate_key(level, centre, language), start_day, end_day)
+    if rows is not None:
+        return rows
+    rows = hierarchy(start_day, end_day).rows(level, centre, language)
+    if rows is not None:
+        return rows
+
+    def query():
+        sql, params = aggregate_sql(level, start_day, end_day, centre, language)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [ReportRow(*row) for row in cursor.fetchall()]
+
+    return cached(aggregate_key(level, centre, language), start_day, end_day, query)
+
+
+def cached_aggregate(level, start_day, end_day, centre=None, language=None):
+    """aggregate() if it can be answered from the cache, else None"""
+    rows = cached_rows(aggregate_key(level, centre, language), start_day, end_day)
+    if rows is None:
+        tree = cached_rows(HIERARCHY_KEY, start_day, end_day)
+        if tree is not None:
+            rows = tree.rows(level, centre, language)
+    return rows
+
+
+def hierarchy_sql(start_day, end_day):
+    source, params = daily_sessions_source(start_day, end_day)
+    return HIERARCHY_SQL.format(source=source), params
+
+
+def hierarchy(start_day, end_day):
+    """ReportTree of every centre, language and agent from start_day to end_day (exclusive)"""
+    def query():
+        sql, params = hierarchy_sql(start_day, end_day)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        tree = ReportTree([], {}, {})
+        for depth, centre, language, agent, centre_name, language_name, agent_name, operator, *totals in rows:
+            if depth == CENTRE_DEPTH:
+                tree.centres.append(ReportRow(centre, centre_name, *totals))
+            elif language_name is None:
+                # Not a known language, which the language and agent levels join out
+                continue
+            elif depth == LANGUAGE_DEPTH:
+                tree.languages.setdefault(centre, []).append(ReportRow(language, language_name, *totals))
+            # An operator that no longer exists shows in its id; CONCAT() is never NULL
+            elif depth == AGENT_DEPTH and operator is not None:
+                tree.agents.setdefault((centre, language), []).append(ReportRow(agent, agent_name, *totals))
+        return tree
+
+    return cached(HIERARCHY_KEY, start_day, end_day, query)
+
+
+def aggregate_in_chunks(level, start_day, end_day, centre=None, language=None, chunk_days=7, progress=None):
+    """aggregate() computed chunk_days at a time, calling progress(done, total) after each chunk
+
+    For background jobs over long ranges, where each query stays short and
+    the caller can report how far it has got. Rows are ordered by name.
+    """
+    chunk_starts = []
+    day = start_day
+    while day < end_day:
+        chunk_starts.append(day)
+        day += timedelta(days=chunk_days)
+
+    groups = {}
+    for done, chunk_start in enumerate(chunk_starts, 1):
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end_day)
+        sql, params = aggregate_sql(level, chunk_start, chunk_end, centre, language, template=PARTIAL_AGGREGATE_SQL)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for group_id, name, langid, operid, sessions, calls, call_seconds in cursor.fetchall():
+                group = groups.setdefault(group_id, {
+                    'name': name, 'languages': set(), 'agents': set(), 'sessions': 0, 'calls': 0, 'seconds': 0,
+                })
+                group['languages'].add(langid)
+                group['agents'].add(operid)
+                group['sessions'] += sessions
+                group['calls'] += calls
+                group['seconds'] += call_seconds
+        if progress is not None:
+            progress(done, len(chunk_starts))
+
+    rows = [
+        ReportRow(
+            group_id,
+            group['name'],
+            len(group['languages'] - {None}),
+            len(group['agents'] - {None}),
+            group['sessions'],
+            group['calls'],
+            group['seconds'],
+        )
+        for group_id, group in groups.items()
+    ]
+    rows.sort(key=lambda row: (row.name, row.id))
+    return rows
+
+
+def agent_sessions_sql(operator, start_day, end_day, older_than=None, newer_than=None, limit=None):
+    """SQL and params listing operator's sessions newest first, or oldest first after newer_than
+
+    older_than and newer_than are (start, id) keys of a page boundary.
+    """
+    params = [operator, day_start(start_day), day_start(end_day)]
+    keyset = ''
+    direction = 'DESC'
+    if older_than is not None:
+        keyset = OLDER_THAN_SQL
+        params += [older_than[0], older_than[0], older_than[1]]
+    elif newer_than is not None:
+        keyset = NEWER_THAN_SQL
+        params += [newer_than[0], newer_than[0], newer_than[1]]
+        direction = 'ASC'
+    sql = AGENT_SESSIONS_SQL.format(
+        keyset=keyset, direction=direction, limit='LIMIT %s' if limit is not None else ''
+    )
+    if limit is not None:
+        params.append(limit)
+    return sql, params
+
+
+def session_cursor(row):
+    """Page boundary token for a SessionRow"""
+    return f'{(row.start - EPOCH) // timedelta(microseconds=1)}-{row.session_id}'
+
+
+def parse_session_cursor(token):
+    """(start, id) of a session_cursor() token; raises ValueError if malformed"""
+    microseconds, session_id = token.split('-')
+    return EPOCH + timedelta(microseconds=int(microseconds)), int(session_id)
+
+
+def agent_sessions_page(operator, start_day, end_day, page_size, before=None, after=None):
+    """SessionPage of operator's sessions older than the before cursor, newer than after, or the newest
+
+    Raises ValueError for a malformed cursor.
+    """
+    older_than = parse_session_cursor(before) if before else None
+    newer_than = parse_session_cursor(after) if after and not before else None
+    sql, params = agent_sessions_sql(operator, start_day, end_day, older_than, newer_than, limit=page_size + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = [SessionRow(*row) for row in cursor.fetchall()]
+
+    # The extra row only tells whether there is another page that way
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if newer_than is not None:
+        rows.reverse()
+        has_newer, has_older = more, True
+    else:
+        has_newer, has_older = older_than is not None, more
+
+    return SessionPage(
+        rows=rows,
+        newer=session_cursor(rows[0]) if rows and has_newer else None,
+        older=session_cursor(rows[-1]) if rows and has_older else None,
+    )
+
+
+def agent_totals_sql(operator, start_day, end_day):
+    source, params = daily_sessions_source(start_day, end_day)
+    return AGENT_TOTALS_SQL.format(source=source), params + [operator]
+
+
+def agent_totals(operator, start_day, end_day):
+    """(sessions, calls, call seconds) of operator's finished sessions from start_day to end_day (exclusive)"""
+    def query():
+        sql, params = agent_totals_sql(operator, start_day, end_day)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone()
+
+    return cached(('totals', 'agent', None, None, operator), start_day, end_day, query)
+
+
+def iter_rows(sql, params, row_class):
+    """row_class per result row, read in batches through a server-side cursor"""
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield row_class(*row)
+
+
+def iter_aggregate(level, start_day, end_day, centre=None, language=None):
+    """aggregate() as a generator that never holds the whole result, for exports"""
+    sql, params = aggregate_sql(level, start_day, end_day, centre, language)
+    return iter_rows(sql, params, ReportRow)
+
+
+def iter_agent_sessions(operator, start_day, end_day):
+    """Every session of operator, newest first, as a generator that never holds the whole result, for exports"""
+    sql, params = agent_sessions_sql(operator, start_day, end_day)
+    return iter_rows(sql, params, SessionRow)
+
+
+HIERARCHY_KEY = ('hierarchy', None, None, None, None)
+
+
+def aggregate_key(level, centre=None, language=None):
+    """Cache key of aggregate() for the level and filters, without the range"""
+    return ('aggregate', level, centre, language, None)
+
+
+def cache_key(key, start_day, end_day):
+    generation = range_generation(start_day, end_day)
+    return ':'.join(str(part) for part in ('report', generation, *key, start_day, end_day))
+
+
+def store(key, start_day, end_day, rows):
+    """Cache rows under key and the range, for longer once the range is in the past"""
+    # Completed days change only through a rollup rebuild, which invalidates
+    past = end_day <= utc_today()
+    timeout = settings.REPORTS_PAST_CACHE_TTL if past else settings.REPORTS_CACHE_TTL
+    cache.set(cache_key(key, start_day, end_day), rows, timeout=timeout)
+
+
+def cached_rows(key, start_day, end_day):
+    """Rows stored under key and the range, or None"""
+    return cache.get(cache_key(key, start_day, end_day))
+
+
+def cached(key, start_day, end_day, query):
+    """query() cached under key and the range, see store()"""
+    rows = cached_rows(key, start_day, end_day)
+    if rows is None:
+        rows = query()
+        store(key, start_day, end_day, rows)
+    return rows
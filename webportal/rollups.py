@@ -0,0 +1,254 @@
+"""Daily rollup of finished sessions for the centre, language and agent reports
+
+sessions_daily holds one row per day, operator, centre and language with the
+session count, calls and call seconds, so a month of report is a few
+thousand rollup rows instead of every session in it. sessions_daily_days
+keeps a signature of the finished sessions each day was built from (count,
+highest id, calls and call duration), and refresh_sessions_daily() rebuilds
+only the days of the last SESSIONS_DAILY_LOOKBACK_DAYS whose signature no
+longer matches, so ANDROMEDA's sessions table needs no trigger.
+
+The watermark records the completed days the rollup covers. Reports read
+those from sessions_daily and anything else (today, days not backfilled
+yet) from the raw sessions, through daily_sessions_source(). A late change
+to a covered day shows in the reports after the next refresh.
+
+Cached reports over completed days stay valid until a refresh rebuilds one
+of their days. Each month has a generation in the shared cache that the
+refresh bumps when it rebuilds a day in it, and range_generation() is part
+of every report cache key, so a rebuild only expires ranges over its month.
+"""
+import hashlib
+import threading
+import time as clock
+from datetime import datetime, time, timedelta, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+# Day of a session, the same in every connection whatever its time zone
+SESSION_DAY = "(s.start AT TIME ZONE 'UTC')::date"
+
+REBUILD_DAY_SQL = f"""
+    INSERT INTO sessions_daily (day, operid, centreid, langid, sessions, calls, call_seconds)
+    SELECT
+        {SESSION_DAY},
+        s.operid,
+        o.centreid,
+        o.langid,
+        COUNT(*),
+        COALESCE(SUM(s.calltotal), 0),
+        COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0)
+    FROM sessions s
+    INNER JOIN operators o ON s.operid = o.id
+    WHERE s.duration IS NOT NULL
+        AND s.start >= %s
+        AND s.start < %s
+    GROUP BY 1, 2, 3, 4
+"""
+
+# What each day's rollup rows are built from; any insert, delete or finish
+# on the day changes one of these
+SIGNATURES_SQL = f"""
+    SELECT
+        {SESSION_DAY},
+        COUNT(*),
+        MAX(s.id),
+        COALESCE(SUM(s.calltotal), 0),
+        COALESCE(SUM(s.callduration), interval '0')
+    FROM sessions s
+    WHERE s.duration IS NOT NULL
+        AND s.start >= %s
+        AND s.start < %s
+    GROUP BY 1
+"""
+
+# Same columns as sessions_daily, aggregated from the raw sessions
+RAW_DAILY_SQL = f"""
+    SELECT
+        {SESSION_DAY} AS day,
+        s.operid,
+        o.centreid,
+        o.langid,
+        COUNT(*) AS sessions,
+        COALESCE(SUM(s.calltotal), 0) AS calls,
+        COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0)::double precision AS call_seconds
+    FROM sessions s
+    INNER JOIN operators o ON s.operid = o.id
+    WHERE s.duration IS NOT NULL
+        AND ({{ranges}})
+    GROUP BY 1, 2, 3, 4
+"""
+
+ROLLUP_DAILY_SQL = """
+    SELECT day, operid, centreid, langid, sessions, calls, call_seconds
+    FROM sessions_daily
+    WHERE day >= %s
+        AND day < %s
+"""
+
+GENERATION_CACHE_KEY = 'sessions-daily-generation:{:%Y-%m}'
+
+# Seconds a process reuses a month's generation before reading it again
+GENERATION_MEMO_SECONDS = 5
+
+EMPTY_DAILY_SQL = """
+    SELECT NULL::date AS day, NULL::integer AS operid, NULL::integer AS centreid,
+        NULL::integer AS langid, 0 AS sessions, 0::bigint AS calls, 0::double precision AS call_seconds
+    WHERE false
+"""
+
+
+def day_start(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def range_months(start_day, end_day):
+    """First day of every month from start_day to end_day (exclusive)"""
+    month = start_day.replace(day=1)
+    while month < end_day:
+        yield month
+        month = (month + timedelta(days=31)).replace(day=1)
+
+
+def range_generation(start_day, end_day):
+    """Digest of the generations of the months from start_day to end_day (exclusive)
+
+    A month with no generation in the cache, never rebuilt or evicted, gets
+    a new one, so it can never match a key stored before the eviction.
+    """
+    now = clock.monotonic()
+    months = list(range_months(start_day, end_day))
+    with _generations_lock:
+        stale = [month for month in months
+                 if month not in _generations or now - _generations[month][1] >= GENERATION_MEMO_SECONDS]
+    if stale:
+        keys = {GENERATION_CACHE_KEY.format(month): month for month in stale}
+        found = cache.get_many(keys)
+        for key, month in keys.items():
+            if key not in found:
+                cache.add(key, clock.time_ns(), timeout=None)
+                found[key] = cache.get(key)
+            with _generations_lock:
+                _generations[month] = (found[key], now)
+    with _generations_lock:
+        values = [_generations[month][0] for month in months]
+    return hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+
+
+def bump_generations(days):
+    """Expire the cached reports over the months of days"""
+    months = {day.replace(day=1) for day in days}
+    cache.set_many({GENERATION_CACHE_KEY.format(month): clock.time_ns() for month in months}, timeout=None)
+    with _generations_lock:
+        for month in months:
+            _generations.pop(month, None)
+
+
+def refresh_sessions_daily(since=None, today=None):
+    """Rebuild the changed completed days, and every day from since onwards
+
+    Days of the last SESSIONS_DAILY_LOOKBACK_DAYS, and any not refreshed
+    yet, are rebuilt when their signature changed. The first refresh
+    without since starts covering from today, leaving older days to the raw
+    sessions until they are backfilled with since. Returns the days rebuilt.
+    """
+    today = today or utc_today()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("INSERT INTO sessions_daily_watermark (id) VALUES (1) ON CONFLICT DO NOTHING")
+        cursor.execute(
+            "SELECT covered_from, refreshed_through FROM sessions_daily_watermark WHERE id = 1 FOR UPDATE"
+        )
+        covered_from, refreshed_through = cursor.fetchone()
+        if since is not None:
+            covered_from = min(covered_from, since) if covered_from else since
+        covered_from = covered_from or today
+
+        # Today is still changing and is always read from the raw sessions
+        check_from = today - timedelta(days=settings.SESSIONS_DAILY_LOOKBACK_DAYS)
+        if refreshed_through is not None:
+            check_from = min(check_from, refreshed_through + timedelta(days=1))
+        check_from = max(check_from, covered_from)
+        if since is not None:
+            check_from = min(check_from, since)
+
+        cursor.execute(SIGNATURES_SQL, [day_start(check_from), day_start(today)])
+        signatures = {row[0]: row[1:] for row in cursor.fetchall()}
+        cursor.execute(
+            "SELECT day, sessions, max_id, calls, callduration FROM sessions_daily_days "
+            "WHERE day >= %s AND day < %s",
+            [check_from, today]
+        )
+        built = {row[0]: row[1:] for row in cursor.fetchall()}
+        days = sorted(
+            day for day in signatures.keys() | built.keys()
+            if signatures.get(day) != built.get(day) or (since is not None and day >= since)
+        )
+
+        for day in days:
+            cursor.execute("DELETE FROM sessions_daily WHERE day = %s", [day])
+            cursor.execute(REBUILD_DAY_SQL, [day_start(day), day_start(day + timedelta(days=1))])
+            cursor.execute("DELETE FROM sessions_daily_days WHERE day = %s", [day])
+            if day in signatures:
+                cursor.execute(
+                    "INSERT INTO sessions_daily_days (day, sessions, max_id, calls, callduration) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    [day, *signatures[day]]
+                )
+
+        cursor.execute(
+            "UPDATE sessions_daily_watermark SET covered_from = %s, refreshed_through = %s WHERE id = 1",
+            [covered_from, today - timedelta(days=1)]
+        )
+        # Reports cached over the rebuilt days are out of date once they commit
+        if days:
+            transaction.on_commit(lambda: bump_generations(days))
+    return days
+
+
+def daily_sessions_source(start_day, end_day):
+    """Derived-table SQL and params with sessions_daily rows from start_day to end_day (exclusive)
+
+    Covered days come from the rollup, every other day is aggregated from
+    sessions on the fly. Use as FROM (<sql>) d.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT covered_from, refreshed_through FROM sessions_daily_watermark WHERE id = 1")
+        watermark = cursor.fetchone()
+
+    rollup_from = rollup_to = start_day
+    if watermark and watermark[0] and watermark[1]:
+        rollup_from = max(start_day, watermark[0])
+        rollup_to = min(end_day, watermark[1] + timedelta(days=1))
+
+    # The days before and after the ones the rollup can answer
+    if rollup_from < rollup_to:
+        raw_ranges = [(first, last) for first, last in ((start_day, rollup_from), (rollup_to, end_day))
+                      if first < last]
+    else:
+        raw_ranges = [(start_day, end_day)] if start_day < end_day else []
+
+    parts = []
+    params = []
+    if rollup_from < rollup_to:
+        parts.append(ROLLUP_DAILY_SQL)
+        params.extend([rollup_from, rollup_to])
+    if raw_ranges:
+        parts.append(RAW_DAILY_SQL.format(
+            ranges=' OR '.join(['(s.start >= %s AND s.start < %s)'] * len(raw_ranges))
+        ))
+        for first, last in raw_ranges:
+            params.extend([day_start(first), day_start(last)])
+    if not parts:
+        parts.append(EMPTY_DAILY_SQL)
+
+    return '(' + ' UNION ALL '.join(parts) + ')', params
@@ -0,0 +1,164 @@
+"""In-memory registry of active sessions kept current by Postgres NOTIFY
+
+A trigger on sessions (the opt-in webportal.notify app) sends the id of every inserted,
+updated or deleted row on the sessions_changed channel. One listener thread
+per process re-reads just those sessions, so the live pages read active
+sessions from memory instead of querying the whole table on every refresh.
+
+After connecting, and again after any lost connection, the registry resyncs
+from a full query before trusting notifications. Until it has done so,
+current_sessions() falls back to querying the database directly.
+"""
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from .active_sessions import current_durations, fetch_active_sessions, get_session_feed
+from .coalesce import SingleFlight
+
+CHANNEL = 'sessions_changed'
+
+# Seconds to wait before reconnecting after the listener connection failed
+RECONNECT_DELAY = 5
+
+# Further notifications are gathered this long so bursts cost one query
+BATCH_WINDOW = 0.2
+
+
+class SessionRegistry:
+    """Active sessions by id, maintained from NOTIFY events"""
+
+    def __init__(self, resync_interval):
+        self.resync_interval = resync_interval
+        self.sessions = {}
+        self.ready = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the listener thread once per process"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sessions-listener', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.listen()
+            except Exception as e:
+                print(f"Error in sessions listener: {e}")
+            # Notifications may have been missed, so stop serving until resynced
+            with self._lock:
+                self.ready = False
+            time.sleep(RECONNECT_DELAY)
+
+    def listen(self):
+        """LISTEN on a dedicated connection and apply notifications until it fails"""
+        listener = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with listener.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            # Listening first means nothing changed after the resync is lost
+            self.resync()
+            resynced = time.monotonic()
+            while True:
+                ids = wait_for_ids(listener.connection, min(self.resync_interval, 30))
+                if ids:
+                    self.refresh(ids)
+                # Catches changes no trigger reports, such as agent renames
+                if time.monotonic() - resynced >= self.resync_interval:
+                    self.resync()
+                    resynced = time.monotonic()
+        finally:
+            listener.close()
+
+    def resync(self):
+        """Replace the registry with a full query of the active sessions"""
+        close_old_connections()
+        sessions = {session['id']: session for session in fetch_active_sessions()}
+        with self._lock:
+            self.sessions = sessions
+            self.ready = True
+
+    def refresh(self, ids):
+        """Re-read the given sessions, dropping those no longer active"""
+        close_old_connections()
+        active = {session['id']: session for session in fetch_active_sessions(ids)}
+        with self._lock:
+            for session_id in ids:
+                if session_id in active:
+                    self.sessions[session_id] = active[session_id]
+                else:
+                    self.sessions.pop(session_id, None)
+
+    def sessions_list(self):
+        """Active sessions newest first, or None until the registry is in sync"""
+        with self._lock:
+            if not self.ready:
+                return None
+            sessions = list(self.sessions.values())
+
+        sessions = [session for session in sessions if session['start'] is not None]
+        sessions.sort(key=lambda session: session['start'], reverse=True)
+        # Durations keep growing without any notification, so work them out now
+        return current_durations(sessions)
+
+
+def wait_for_ids(connection, timeout):
+    """Session ids notified within timeout, gathering any burst that follows"""
+    ids = set()
+    if is_psycopg3:
+        for notify in connection.notifies(timeout=timeout, stop_after=1):
+            ids.add(int(notify.payload))
+        if ids:
+            for notify in connection.notifies(timeout=BATCH_WINDOW):
+                ids.add(int(notify.payload))
+    else:
+        if select.select([connection], [], [], timeout)[0]:
+            time.sleep(BATCH_WINDOW)
+            connection.poll()
+            while connection.notifies:
+                ids.add(int(connection.notifies.pop(0).payload))
+    return ids
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide registry, starting its listener on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SessionRegistry(settings.LIVE_SESSIONS_RESYNC)
+        _registry.start()
+        return _registry
+
+
+def current_sessions():
+    """Active sessions from the registry when enabled and in sync, else the database"""
+    if settings.LIVE_SESSIONS_REGISTRY:
+        sessions_list = get_registry().sessions_list()
+        if sessions_list is not None:
+            return sessions_list
+    return fetch_active_sessions()
+
+
+# Viewers polling within the same second share one read of the sessions
+sessions_flight = SingleFlight(settings.LIVE_SESSIONS_COALESCE)
+
+
+def load_sessions():
+    read_at = time.time()
+    return get_session_feed().update(current_sessions(), read_at)
+
+
+def shared_sessions():
+    """Return (feed cursor, active sessions), read once for all concurrent callers"""
+    return sessions_flight.do('sessions', load_sessions)
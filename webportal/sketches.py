@@ -0,0 +1,107 @@
+"""Bounded-memory summaries of a stream of keys, mergeable across periods
+
+SpaceSaving keeps the capacity most frequent keys with an overestimated
+count and the most it may be overestimated by, so its top entries are the
+heavy hitters without storing every key. CountMinSketch estimates the
+count of any key, also only ever overestimating, from a fixed grid of
+counters. Both are updated with the exact counts of a batch of keys, and
+summaries of separate periods can be merged.
+"""
+import hashlib
+from array import array
+from operator import add
+
+
+class SpaceSaving:
+    """The most frequent keys of a stream with upper-bound counts and their error
+
+    A capacity of None holds every key, i.e. exact counts.
+    """
+
+    def __init__(self, capacity, counters=None):
+        self.capacity = capacity
+        # key -> [count, error], where count - error is a guaranteed lower bound
+        self.counters = counters if counters is not None else {}
+
+    def add_counts(self, counts):
+        """Add exact counts of a batch of keys, keeping at most capacity keys"""
+        batch = SpaceSaving(None, {key: [count, 0] for key, count in counts.items()})
+        self.counters = SpaceSaving.merge([self, batch], self.capacity).counters
+
+    def floor(self):
+        """Most any key not held may have occurred"""
+        if self.capacity is None or len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def top(self, k):
+        """(key, count, error) of the k highest counts"""
+        ranked = sorted(self.counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [(key, count, error) for key, (count, error) in ranked[:k]]
+
+    def to_list(self):
+        return [[key, count, error] for key, (count, error) in self.counters.items()]
+
+    @classmethod
+    def from_list(cls, capacity, items):
+        return cls(capacity, {key: [count, error] for key, count, error in items})
+
+    @classmethod
+    def merge(cls, summaries, capacity):
+        """One summary of the union of the streams behind summaries
+
+        A key missing from a full summary may have occurred up to that
+        summary's floor, so the floor is added to its count and error.
+        """
+        floors = [summary.floor() for summary in summaries]
+        total_floor = sum(floors)
+        merged = {}
+        for summary, floor in zip(summaries, floors):
+            for key, (count, error) in summary.counters.items():
+                counter = merged.setdefault(key, [total_floor, total_floor])
+                counter[0] += count - floor
+                counter[1] += error - floor
+        ranked = sorted(merged.items(), key=lambda item: (-item[1][0], item[0]))[:capacity]
+        return cls(capacity, dict(ranked))
+
+
+class CountMinSketch:
+    """Overestimated counts of any key from depth rows of width counters"""
+
+    def __init__(self, width, depth, counts=None):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array('I', bytes(4 * width * depth))
+        # The error bound needs independent hashes per row. Seeded CRCs are
+        # not: CRC is affine in its seed, so keys of equal length that
+        # collide in one row collide in every row.
+        self.salts = [row.to_bytes(hashlib.blake2b.SALT_SIZE, 'little') for row in range(depth)]
+
+    def _cells(self, key):
+        data = key.encode('utf-8')
+        return [row * self.width
+                + int.from_bytes(hashlib.blake2b(data, digest_size=8, salt=salt).digest(), 'little') % self.width
+                for row, salt in enumerate(self.salts)]
+
+    def add(self, key, weight=1):
+        for cell in self._cells(key):
+            self.counts[cell] += weight
+
+    def estimate(self, key):
+        return min(self.counts[cell] for cell in self._cells(key))
+
+    def to_bytes(self):
+        return self.counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, width, depth, data):
+        counts = array('I')
+        counts.frombytes(bytes(data))
+        return cls(width, depth, counts)
+
+    @classmethod
+    def merge(cls, sketches, width, depth):
+        merged = cls(width, depth)
+        for sketch in sketches:
+            merged.counts = array('I', map(add, merged.counts, sketch.counts))
+        return merged
@@ -0,0 +1,185 @@
+"""Server-Sent Events push stream for the live dashboards
+
+Served as a plain ASGI app from babbleton/asgi.py, next to Django, so an open
+dashboard costs one long-lived connection instead of a full request cycle
+every two seconds. Each topic has a single producer per process that only
+runs while somebody is subscribed, and fans every change out to all clients.
+"""
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .http import dumps
+from .session_registry import shared_sessions
+from .traffic import get_poller, get_traffic_snapshot
+
+
+class Topic:
+    """One event stream fanned out to any number of subscribers"""
+
+    # Pending events per subscriber; a slow client only ever misses
+    # intermediate states, never the latest one
+    queue_size = 4
+
+    def __init__(self, name, producer):
+        self.name = name
+        self.producer = producer
+        self.subscribers = set()
+        self.last_event = None
+        self.last_key = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.last_event is not None:
+            queue.put_nowait(self.last_event)
+        self.subscribers.add(queue)
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._produce())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self.task is not None:
+            # Nobody is watching, so stop querying until the next subscriber
+            self.task.cancel()
+            self.task = None
+            self.last_event = None
+            self.last_key = None
+
+    async def _produce(self):
+        try:
+            await self.producer(self)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in {self.name} stream producer: {e}")
+            self.task = None
+
+    def publish(self, body, key=None):
+        """Send body to every subscriber unless it is unchanged"""
+        key = body if key is None else key
+        if key == self.last_key:
+            return
+        self.last_key = key
+        self.last_event = b'event: ' + self.name.encode() + b'\ndata: ' + body + b'\n\n'
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(self.last_event)
+
+
+async def produce_traffic(topic):
+    """Forward every new ANDROMEDA snapshot from the shared poller"""
+    loop = asyncio.get_running_loop()
+
+    def on_snapshot(snapshot, body):
+        loop.call_soon_threadsafe(topic.publish, body)
+
+    poller = get_poller()
+    poller.add_listener(on_snapshot)
+    try:
+        snapshot, body = await sync_to_async(get_traffic_snapshot, thread_sensitive=False)()
+        topic.publish(body)
+        await loop.create_future()
+    finally:
+        poller.remove_listener(on_snapshot)
+
+
+def sessions_event():
+    # Only a change notice; each page fetches the window of rows it shows
+    close_old_connections()
+    cursor, sessions_list = shared_sessions()
+    return dumps({'cursor': cursor, 'count': len(sessions_list)}), cursor
+
+
+async def produce_sessions(topic):
+    """Query active sessions once per interval for all subscribers"""
+    while True:
+        try:
+            body, key = await sync_to_async(sessions_event)()
+            topic.publish(body, key)
+        except Exception as e:
+            print(f"Error refreshing sessions stream: {e}")
+        await asyncio.sleep(settings.LIVE_SESSIONS_INTERVAL)
+
+
+TOPICS = {
+    'traffic': Topic('traffic', produce_traffic),
+    'sessions': Topic('sessions', produce_sessions),
+}
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def live_stream(scope, receive, send):
+    """ASGI app streaming the requested topics as Server-Sent Events"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    names = ','.join(query.get('topics', ['traffic,sessions'])).split(',')
+    topics = [TOPICS[name] for name in names if name in TOPICS]
+    if not topics:
+        await send({'type': 'http.response.start', 'status': 400,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Unknown topics'})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    # Every topic feeds the same per-connection queue
+    outbox = asyncio.Queue()
+    subscriptions = []
+    forwarders = []
+    for topic in topics:
+        queue = topic.subscribe()
+        subscriptions.append((topic, queue))
+        forwarders.append(asyncio.ensure_future(forward(queue, outbox)))
+
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+        while True:
+            next_event = asyncio.ensure_future(outbox.get())
+            done, pending = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.LIVE_STREAM_HEARTBEAT,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                next_event.cancel()
+                break
+            if next_event in done:
+                body = next_event.result()
+            else:
+                # Keep proxies from closing an idle connection
+                next_event.cancel()
+                body = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    except OSError:
+        pass
+    finally:
+        disconnected.cancel()
+        for forwarder in forwarders:
+            forwarder.cancel()
+        for topic, queue in subscriptions:
+            topic.unsubscribe(queue)
+
+
+async def forward(queue, outbox):
+    while True:
+        await outbox.put(await queue.get())
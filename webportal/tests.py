@@ -1,3 +1,1044 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import math
+import pickle
+import socket
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import QuerySet
+from django.db.models.signals import pre_migrate
+from django.dispatch import receiver
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, modify_settings, override_settings
+from django.urls import reverse
+
+from . import exports, models, payplans, report_jobs, reports, rollups, streams, timeseries, trends
+from .active_sessions import FEED_CACHE_KEY, ActiveSessionFeed, encode_columns, window_sessions
+from .andromeda import AndromedaClient, CircuitOpenError
+from .coalesce import SingleFlight
+from .friends import CMS_DEPTH, CMS_WIDTH, refresh_caller_sketches, top_callers
+from .globaldata import CENTRE_FIELDS, CENTRE_NAME_HEADERS, SUMMARY_FIELDS, RowDecoder, parse_centres
+from .history import SUMMARY, TrafficHistory
+from .http import FastJsonResponse, dumps
+from .rollups import day_start, refresh_sessions_daily, utc_today
+from .sketches import CountMinSketch
+from .traffic import TrafficPoller, fetch_traffic, merge_parts, next_version
+
+# ANDROMEDA's tables are unmanaged, but the opt-in apps put indexes and
+# triggers on them and the reports read them, so the test database needs them first
+LEGACY_MODELS = (models.Centres, models.Languages, models.Operators, models.Payplan, models.Devices, models.Sessions,
+                 models.Calls)
+
+
+@receiver(pre_migrate)
+def create_legacy_tables(sender, using, **kwargs):
+    existing = connections[using].introspection.table_names()
+    with connections[using].schema_editor() as editor:
+        for model in LEGACY_MODELS:
+            if model._meta.db_table not in existing:
+                editor.create_model(model)
+
+
+def clis(n):
+    """n distinct caller CLIs of equal length"""
+    return [f'0044{7700000000 + i * 7919:010d}' for i in range(n)]
+
+
+class CountMinSketchTests(SimpleTestCase):
+    def test_overestimate_within_bound(self):
+        # Every 50th caller is a frequent one
+        counts = {cli: 21 if i % 50 == 0 else 1 for i, cli in enumerate(clis(20000))}
+        sketch = CountMinSketch(CMS_WIDTH, CMS_DEPTH)
+        for cli, calls in counts.items():
+            sketch.add(cli, calls)
+
+        # Over by at most e / width of all calls, except with probability e^-depth
+        bound = math.e / CMS_WIDTH * sum(counts.values())
+        over = [sketch.estimate(cli) - calls for cli, calls in counts.items()]
+        self.assertGreaterEqual(min(over), 0)
+        self.assertLessEqual(sum(error > bound for error in over) / len(over), math.exp(-CMS_DEPTH))
+
+    def test_rows_hash_independently(self):
+        sketch = CountMinSketch(CMS_WIDTH, CMS_DEPTH)
+        by_first_cell = {}
+        for cli in clis(20000):
+            cells = sketch._cells(cli)
+            by_first_cell.setdefault(cells[0], []).append(cells[1:])
+
+        # Callers sharing a counter in the first row should rarely share the others
+        pairs = shared = 0
+        for rest in by_first_cell.values():
+            for i, cells in enumerate(rest):
+                for other in rest[i + 1:]:
+                    pairs += 1
+                    shared += cells == other
+        self.assertGreater(pairs, 0)
+        self.assertLess(shared / pairs, 0.01)
+
+    def test_merge_adds_counts(self):
+        first, second = CountMinSketch(CMS_WIDTH, CMS_DEPTH), CountMinSketch(CMS_WIDTH, CMS_DEPTH)
+        first.add('0044770000001', 3)
+        second.add('0044770000001', 4)
+        merged = CountMinSketch.merge([first, second], CMS_WIDTH, CMS_DEPTH)
+        self.assertEqual(merged.estimate('0044770000001'), 7)
+        restored = CountMinSketch.from_bytes(CMS_WIDTH, CMS_DEPTH, merged.to_bytes())
+        self.assertEqual(restored.estimate('0044770000001'), 7)
+
+
+class RowDecoderTests(SimpleTestCase):
+    def test_reordered_and_extra_columns_are_decoded_by_name(self):
+        decoder = RowDecoder(['Calls', 'extra', ' ACD ', 'agents', 'traffic', 'waiting', 'minutes', 'centre'],
+                             CENTRE_FIELDS, CENTRE_NAME_HEADERS)
+        row = ['12', 'x', '95', '4', '3', '1', '30', 'Dublin']
+        self.assertEqual(decoder.decode(row), {
+            'calls': 12, 'acd': 95, 'operators': 4, 'traffic': 3, 'waiting': 1, 'minutes': 30, 'languages': 0
+        })
+        self.assertEqual(decoder.name(row), 'Dublin')
+
+    def test_missing_column_counts_as_zero(self):
+        decoder = RowDecoder(['traffic', 'operators', 'calls', 'minutes', 'acd'], SUMMARY_FIELDS)
+        self.assertEqual(decoder.decode(['5', '2', '7', '', 'n/a']), {
+            'traffic': 5, 'operators': 2, 'calls': 7, 'minutes': 0, 'acd': 0, 'waiting': 0
+        })
+        self.assertEqual(decoder.name(['5', '2', '7', '', 'n/a']), '')
+
+    def test_short_rows_are_skipped(self):
+        raw = [
+            {'columns': ['traffic'], 'rows': [['1']]},
+            {'columns': ['centre', 'traffic', 'calls'], 'rows': [['Cork', '2'], ['Dublin', '3', '9']]},
+        ]
+        self.assertEqual([(centre['id'], centre['name'], centre['calls']) for centre in parse_centres(raw)],
+                         [(1, 'Dublin', 9)])
+
+
+class CallerSketchRefreshTests(TestCase):
+    def add_calls(self, *ids):
+        with connection.cursor() as cursor:
+            for call_id in ids:
+                cursor.execute(
+                    "INSERT INTO calls (id, cli, start, langid) VALUES (%s, '0044770000001', now(), 1)", [call_id]
+                )
+
+    def test_late_commit_below_watermark_is_counted_once(self):
+        self.add_calls(1, 2, 4, 5)
+        self.assertEqual(refresh_caller_sketches(), 4)
+
+        # Call 3 commits after the watermark passed it
+        self.add_calls(3)
+        self.assertEqual(refresh_caller_sketches(), 1)
+        self.assertEqual(refresh_caller_sketches(), 0)
+
+        today = utc_today()
+        report = top_callers(today, today + timedelta(days=1))
+        self.assertEqual(report['calls'], 5)
+        self.assertEqual(report['callers'][0]['calls'], 5)
+        self.assertEqual(models.CallerSketchWatermark.objects.get().pending_ids, [])
+
+
+class ReportCacheTests(TestCase):
+    def test_rollup_rebuild_expires_cached_reports_over_its_month(self):
+        yesterday = utc_today() - timedelta(days=1)
+        earlier = yesterday - timedelta(days=60)
+        key = ('test', None, None, None, None)
+        with mock.patch.object(reports, 'cache', wraps=cache) as shared:
+            self.assertEqual(reports.cached(key, yesterday, utc_today(), lambda: ['before']), ['before'])
+        self.assertEqual(shared.set.call_args.kwargs['timeout'], settings.REPORTS_PAST_CACHE_TTL)
+        self.assertEqual(reports.cached(key, earlier, earlier + timedelta(days=1), lambda: ['earlier']), ['earlier'])
+
+        operator = models.Operators.objects.create(centreid=1, langid=1)
+        models.Sessions.objects.create(
+            operid=operator.id, start=day_start(yesterday) + timedelta(hours=9), duration=timedelta(hours=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(refresh_sessions_daily(since=yesterday), [yesterday])
+
+        # Other processes read the bumped generation from the shared cache
+        rollups._generations.clear()
+        self.assertEqual(reports.cached(key, yesterday, utc_today(), lambda: ['after']), ['after'])
+        self.assertEqual(reports.cached(key, earlier, earlier + timedelta(days=1), lambda: ['again']), ['earlier'])
+
+
+class SessionsDailyTests(TestCase):
+    def test_refresh_finds_changed_days_without_a_trigger(self):
+        today = utc_today()
+        operator = models.Operators.objects.create(centreid=1, langid=1)
+
+        def session(days_ago, **fields):
+            start = day_start(today - timedelta(days=days_ago)) + timedelta(hours=9)
+            return models.Sessions.objects.create(operid=operator.id, start=start, duration=timedelta(hours=1),
+                                                  calltotal=1, callduration=timedelta(minutes=5), **fields)
+
+        first = session(3)
+        session(2)
+        self.assertEqual(refresh_sessions_daily(since=today - timedelta(days=5), today=today),
+                         [today - timedelta(days=3), today - timedelta(days=2)])
+        self.assertEqual(refresh_sessions_daily(today=today), [])
+
+        # A late session, an edit and a delete each rebuild only their day
+        session(4)
+        self.assertEqual(refresh_sessions_daily(today=today), [today - timedelta(days=4)])
+        models.Sessions.objects.filter(id=first.id).update(callduration=timedelta(minutes=6))
+        self.assertEqual(refresh_sessions_daily(today=today), [today - timedelta(days=3)])
+        models.Sessions.objects.filter(id=first.id).delete()
+        self.assertEqual(refresh_sessions_daily(today=today), [today - timedelta(days=3)])
+        self.assertFalse(models.SessionsDaily.objects.filter(day=today - timedelta(days=3)).exists())
+
+        # Days not refreshed yet are built however long ago they were
+        session(0)
+        self.assertEqual(refresh_sessions_daily(today=today + timedelta(days=30)), [today])
+
+
+class ReportJobTests(TransactionTestCase):
+    def test_enqueue_returns_the_job_another_request_queued(self):
+        day = date(2026, 1, 1)
+        job = report_jobs.enqueue('centre', day, day + timedelta(days=60))
+        self.assertEqual(report_jobs.enqueue('centre', day, day + timedelta(days=60)), job)
+
+        # Both requests found no job before either created one
+        with mock.patch.object(QuerySet, 'first', return_value=None):
+            self.assertEqual(report_jobs.enqueue('centre', day, day + timedelta(days=60)), job)
+        self.assertEqual(models.ReportJob.objects.count(), 1)
+
+    def test_heartbeat_outlives_a_slow_chunk(self):
+        day = date(2026, 1, 1)
+        report_jobs.enqueue('centre', day, day + timedelta(days=60))
+        job = report_jobs.claim_job('worker')
+        claimed = job.heartbeat
+
+        def slow_chunk(*args, **kwargs):
+            time.sleep(0.3)
+            return []
+
+        with mock.patch.object(report_jobs, 'HEARTBEAT_INTERVAL', 0.05), \
+                mock.patch.object(reports, 'aggregate_in_chunks', side_effect=slow_chunk):
+            report_jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.ReportJob.DONE)
+        self.assertGreater(job.heartbeat, claimed)
+
+
+class RateTableTests(TestCase):
+    def test_admin_views_make_every_process_reload(self):
+        models.Languages.objects.create(id=1, name='English')
+        payplan = models.Payplan.objects.create(centreid=0, langid=1, acd=0, rate=1.0)
+        payplans.invalidate()
+        self.assertEqual(payplans.get_rate_table().rate(5, 1, 150), 1.0)
+
+        self.client.post(reverse('admin-payments-create'), {'centreid': 0, 'langid': 1, 'acd': 120, 'rate': 2.0})
+        self.assertEqual(payplans.get_rate_table().rate(5, 1, 150), 2.0)
+
+        # The version lives in the shared cache, so other processes see the bump too
+        version = cache.get(payplans.VERSION_CACHE_KEY)
+        self.client.post(reverse('admin-payments-edit', args=[payplan.id]),
+                         {'centreid': 0, 'langid': 1, 'acd': 0, 'rate': 1.5})
+        self.assertNotEqual(cache.get(payplans.VERSION_CACHE_KEY), version)
+        self.assertEqual(payplans.get_rate_table().rate(5, 1, 60), 1.5)
+
+        new = models.Payplan.objects.get(acd=120)
+        self.client.post(reverse('admin-payments-delete', args=[new.id]))
+        self.assertEqual(payplans.get_rate_table().rate(5, 1, 150), 1.5)
+
+
+class TrafficPollerTests(TestCase):
+    snapshot = {'data': {'summary': {}, 'centres': []}, 'status': 200, 'fetched': 0}
+
+    @mock.patch('webportal.traffic.record_sample')
+    @mock.patch('webportal.traffic.fetch_traffic')
+    def test_one_process_polls_per_interval(self, fetch_traffic, record_sample):
+        fetch_traffic.side_effect = lambda previous: dict(self.snapshot)
+        # One poller per worker process, sharing the configured cache
+        pollers = [TrafficPoller(interval=3600) for _ in range(3)]
+        for poller in pollers:
+            poller.poll_once()
+
+        self.assertEqual(fetch_traffic.call_count, 1)
+        self.assertEqual(record_sample.call_count, 1)
+        versions = {poller.snapshot()[0]['version'] for poller in pollers}
+        self.assertEqual(len(versions), 1)
+
+    def test_shared_cache_configured(self):
+        self.assertFalse([check for check in run_checks() if check.id == 'webportal.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_warns_about_per_process_cache(self):
+        self.assertTrue([check for check in run_checks() if check.id == 'webportal.W001'])
+
+
+def centre(centre_id, traffic):
+    return {'id': centre_id, 'name': f'Centre {centre_id}', 'traffic': traffic}
+
+
+def versioned_snapshot(version, centres):
+    return {'data': {'summary': {'traffic': sum(c['traffic'] for c in centres)}, 'centres': centres},
+            'status': 200, 'fetched': 0, 'version': version}
+
+
+class LiveTrafficDataTests(SimpleTestCase):
+    def setUp(self):
+        self.poller = TrafficPoller(interval=3600)
+        self.poller.publish(versioned_snapshot(10, [centre(1, 5), centre(2, 3)]))
+        self.poller.publish(versioned_snapshot(11, [centre(1, 6), centre(3, 1)]))
+        patcher = mock.patch('webportal.views.get_poller', return_value=self.poller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('webportal.views.get_traffic_snapshot', side_effect=self.poller.snapshot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **kwargs):
+        headers = {'HTTP_IF_NONE_MATCH': kwargs.pop('etag')} if 'etag' in kwargs else {}
+        return self.client.get(reverse('live-traffic-data'), kwargs, **headers)
+
+    def test_next_version_only_moves_when_data_changes(self):
+        with mock.patch('webportal.traffic.time.time', return_value=1700000000.5):
+            self.assertEqual(next_version(None, versioned_snapshot(None, [])), 1700000000)
+        previous = versioned_snapshot(7, [centre(1, 5)])
+        self.assertEqual(next_version(previous, versioned_snapshot(None, [centre(1, 5)])), 7)
+        self.assertEqual(next_version(previous, versioned_snapshot(None, [centre(1, 6)])), 8)
+
+    def test_delta_body_has_changed_and_removed_centres(self):
+        delta = json.loads(self.poller.delta_body(10))
+        self.assertTrue(delta['delta'])
+        self.assertEqual((delta['version'], delta['since']), (11, 10))
+        self.assertEqual(delta['centres'], [centre(1, 6), centre(3, 1)])
+        self.assertEqual(delta['removed'], [2])
+        self.assertEqual(delta['summary'], {'traffic': 7})
+
+    def test_delta_body_needs_a_recent_known_version(self):
+        self.assertIsNone(self.poller.delta_body(9))
+        self.poller.history_size = 2
+        self.poller.publish(versioned_snapshot(12, [centre(1, 7)]))
+        self.assertIsNone(self.poller.delta_body(10))
+        self.assertEqual(json.loads(self.poller.delta_body(11))['removed'], [3])
+
+    def test_current_etag_or_version_is_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"traffic-11"')
+        self.assertEqual(json.loads(response.content)['version'], 11)
+
+        self.assertEqual(self.get(etag='"traffic-11"').status_code, 304)
+        self.assertEqual(self.get(since=11).status_code, 304)
+        self.assertEqual(self.get(etag='"traffic-10"').status_code, 200)
+
+    def test_since_answers_a_delta_or_the_full_document(self):
+        delta = json.loads(self.get(since=10).content)
+        self.assertTrue(delta['delta'])
+        self.assertEqual(delta['removed'], [2])
+
+        for since in (9, 'abc'):
+            response = self.get(since=since)
+            document = json.loads(response.content)
+            self.assertNotIn('delta', document)
+            self.assertEqual(len(document['centres']), 2)
+            self.assertEqual(response['ETag'], '"traffic-11"')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight(ttl=60)
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait(5)
+            return len(calls)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1] * 8)
+        # Stragglers within the ttl reuse the result, other keys do not
+        self.assertEqual(flight.do('key', slow), 1)
+        self.assertEqual(flight.do('other', slow), 2)
+
+    def test_errors_reach_every_waiter_and_are_not_cached(self):
+        flight = SingleFlight(ttl=60)
+        with self.assertRaises(ValueError):
+            flight.do('key', mock.Mock(side_effect=ValueError))
+        self.assertEqual(flight.do('key', lambda: 'ok'), 'ok')
+
+    def test_results_expire_after_the_ttl(self):
+        flight = SingleFlight(ttl=1)
+        with mock.patch('webportal.coalesce.time.monotonic', return_value=100):
+            self.assertEqual(flight.do('key', lambda: 'first'), 'first')
+        with mock.patch('webportal.coalesce.time.monotonic', return_value=100.5):
+            self.assertEqual(flight.do('key', lambda: 'second'), 'first')
+        with mock.patch('webportal.coalesce.time.monotonic', return_value=101):
+            self.assertEqual(flight.do('key', lambda: 'third'), 'third')
+
+
+class FastJsonTests(SimpleTestCase):
+    def test_encodes_report_types_without_conversion(self):
+        data = {
+            'start': datetime(2026, 3, 2, 9, 30, tzinfo=timezone.utc),
+            'day': date(2026, 3, 2),
+            'duration': timedelta(minutes=1, seconds=30),
+            'rate': Decimal('1.25'),
+            'rows': [[1, 'Dublin', None]],
+        }
+        self.assertEqual(json.loads(dumps(data)), {
+            'start': '2026-03-02T09:30:00+00:00',
+            'day': '2026-03-02',
+            'duration': 90.0,
+            'rate': 1.25,
+            'rows': [[1, 'Dublin', None]],
+        })
+        with self.assertRaises(TypeError):
+            dumps({'value': object()})
+
+    def test_response_matches_json_response(self):
+        response = FastJsonResponse({'ok': True}, status=201)
+        self.assertEqual((response.status_code, response['Content-Type']), (201, 'application/json'))
+        self.assertEqual(json.loads(response.content), {'ok': True})
+        with self.assertRaises(TypeError):
+            FastJsonResponse([1, 2])
+        self.assertEqual(json.loads(FastJsonResponse([1, 2], safe=False).content), [1, 2])
+
+
+class TrafficHistoryTests(SimpleTestCase):
+    def series(self, history, name, now, seconds=600, points=60):
+        with mock.patch('webportal.history.time.time', return_value=now):
+            return history.series(name, seconds, points)
+
+    def test_fills_skipped_slots_and_wraps_around(self):
+        history = TrafficHistory(interval=10, capacity=6, max_series=3)
+        history.record(100, {SUMMARY: {'traffic': 1}, 'Dublin': {'traffic': 5, 'waiting': 2}})
+        # Snapshots only come when figures change; Dublin dropped out of this one
+        history.record(130, {SUMMARY: {'traffic': 3}})
+
+        summary = self.series(history, SUMMARY, 135)
+        self.assertEqual(summary['traffic'], [1, 1, 1, 3])
+        self.assertEqual((summary['step'], summary['end']), (10, 140))
+        self.assertEqual(self.series(history, 'Dublin', 135)['waiting'], [2, 2, 2, 0])
+        # Reading later carries the last values forward
+        self.assertEqual(self.series(history, SUMMARY, 155)['traffic'], [1, 1, 1, 3, 3, 3])
+
+        history.record(200, {SUMMARY: {'traffic': 7}})
+        self.assertEqual(self.series(history, SUMMARY, 205)['traffic'], [3, 3, 3, 3, 3, 7])
+        self.assertEqual(self.series(history, SUMMARY, 205, seconds=20)['traffic'], [3, 7])
+
+    def test_downsamples_to_peaks_and_caps_series(self):
+        history = TrafficHistory(interval=10, capacity=6, max_series=2)
+        for slot, traffic in enumerate([1, 4, 2, 2, 6]):
+            history.record(slot * 10, {SUMMARY: {'traffic': traffic}, 'Cork': {}, 'Dublin': {}})
+        summary = self.series(history, SUMMARY, 45, points=2)
+        self.assertEqual((summary['step'], summary['traffic']), (30, [4, 6]))
+        self.assertEqual(history.names(), ['Cork'])
+        self.assertIsNone(self.series(history, 'Dublin', 45))
+
+    def test_endpoint_rejects_bad_parameters(self):
+        response = self.client.get(reverse('live-traffic-history'), {'minutes': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LiveStreamTests(SimpleTestCase):
+    def test_topic_fans_out_changes_and_stops_without_subscribers(self):
+        async def scenario():
+            produced = asyncio.Event()
+
+            async def producer(topic):
+                topic.publish(b'{"n": 1}')
+                topic.publish(b'{"n": 1}')
+                produced.set()
+                await asyncio.get_running_loop().create_future()
+
+            topic = streams.Topic('test', producer)
+            first = topic.subscribe()
+            await produced.wait()
+            # A late subscriber starts from the last event
+            second = topic.subscribe()
+            for n in range(2, 8):
+                topic.publish(f'{{"n": {n}}}'.encode())
+
+            events = [first.get_nowait() for _ in range(first.qsize())]
+            self.assertEqual(events[-1], b'event: test\ndata: {"n": 7}\n\n')
+            self.assertEqual(len(events), streams.Topic.queue_size)
+            self.assertEqual(second.qsize(), streams.Topic.queue_size)
+
+            task = topic.task
+            topic.unsubscribe(first)
+            self.assertIs(topic.task, task)
+            topic.unsubscribe(second)
+            self.assertIsNone(topic.task)
+            await asyncio.sleep(0)
+            self.assertTrue(task.cancelled())
+
+        asyncio.run(scenario())
+
+    def test_stream_sends_events_until_the_client_disconnects(self):
+        async def scenario(topics):
+            sent = []
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if b'data:' in message.get('body', b''):
+                    disconnect.set()
+
+            async def producer(topic):
+                topic.publish(b'{"traffic": 3}')
+                await asyncio.get_running_loop().create_future()
+
+            with mock.patch.dict(streams.TOPICS, {'traffic': streams.Topic('traffic', producer)}):
+                scope = {'type': 'http', 'query_string': f'topics={topics}'.encode()}
+                await asyncio.wait_for(streams.live_stream(scope, receive, send), 5)
+                self.assertIsNone(streams.TOPICS['traffic'].task)
+            return sent
+
+        sent = asyncio.run(scenario('traffic'))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), sent[0]['headers'])
+        self.assertEqual(sent[-1]['body'], b'event: traffic\ndata: {"traffic": 3}\n\n')
+
+        sent = asyncio.run(scenario('nothing'))
+        self.assertEqual(sent[0]['status'], 400)
+
+
+def traffic_snapshot(traffic, **flags):
+    return {'status': 200, 'data': dict(flags, summary={'traffic': traffic}, centres=[])}
+
+
+class MinuteRecorderTests(TestCase):
+    def setUp(self):
+        # The recorder runs on the poller thread, where stale connections are closed first
+        patcher = mock.patch.object(timeseries, 'close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def samples(self, resolution):
+        return {bucket.timestamp(): (samples, traffic_sum) for bucket, samples, traffic_sum in (
+            models.TrafficSamples.objects.filter(resolution=resolution)
+            .values_list('bucket', 'samples', 'traffic_sum')
+        )}
+
+    def test_rolls_up_quarters_missed_while_not_recording(self):
+        hour = (int(time.time()) // 3600 - 5) * 3600
+        recorder = timeseries.MinuteRecorder()
+        recorder.add(hour + 10, traffic_snapshot(4))
+        recorder.add(hour + 20, traffic_snapshot(6))
+        # No polls until well into the third quarter hour
+        recorder.add(hour + 2000, traffic_snapshot(8))
+
+        self.assertEqual(self.samples(60), {hour: (2, 10)})
+        self.assertEqual(self.samples(900), {hour: (2, 10)})
+        self.assertEqual(self.samples(3600), {hour: (2, 10)})
+
+        recorder.add(hour + 2100, traffic_snapshot(2))
+        recorder.add(hour + 3610, traffic_snapshot(1))
+        self.assertEqual(self.samples(900), {hour: (2, 10), hour + 1800: (2, 10)})
+        self.assertEqual(self.samples(3600), {hour: (4, 20)})
+
+    def test_stale_and_partial_snapshots_are_not_recorded(self):
+        minute = (int(time.time()) // 60 - 5) * 60
+        recorder = timeseries.MinuteRecorder()
+        recorder.add(minute + 1, traffic_snapshot(4))
+        recorder.add(minute + 2, traffic_snapshot(9, partial=True))
+        recorder.add(minute + 3, traffic_snapshot(9, stale=True))
+        recorder.add(minute + 60, traffic_snapshot(1))
+        self.assertEqual(self.samples(60), {minute: (1, 4)})
+
+
+class SessionsNotifyTests(TransactionTestCase):
+    def sessions_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = 'sessions'::regclass AND NOT tgisinternal")
+            return {name for (name,) in cursor.fetchall()}
+
+    def test_trigger_only_installed_with_the_app(self):
+        # The core migrations leave ANDROMEDA's sessions table alone
+        self.assertEqual(self.sessions_triggers(), set())
+        with modify_settings(INSTALLED_APPS={'append': 'webportal.notify'}):
+            call_command('migrate', 'webportal_notify', verbosity=0)
+            try:
+                self.assertIn('sessions_notify', self.sessions_triggers())
+            finally:
+                call_command('migrate', 'webportal_notify', 'zero', verbosity=0)
+        self.assertNotIn('sessions_notify', self.sessions_triggers())
+
+    @override_settings(LIVE_SESSIONS_REGISTRY=True)
+    def test_warns_about_registry_without_trigger(self):
+        self.assertTrue([check for check in run_checks() if check.id == 'webportal.W002'])
+
+
+def active_session(session_id, calls=0):
+    return {
+        'id': session_id, 'agent_name': f'Agent {session_id}', 'start': datetime.now(timezone.utc),
+        'duration_seconds': 0, 'language_id': 1, 'language_name': 'English', 'centre_id': 1,
+        'centre_name': 'Dublin', 'calltotal': calls, 'callduration': None, 'external': False
+    }
+
+
+class ActiveSessionFeedTests(TestCase):
+    def test_any_process_answers_a_delta(self):
+        # One feed per worker process, sharing the configured cache
+        first, second = ActiveSessionFeed(), ActiveSessionFeed()
+        cursor, _ = first.update([active_session(1), active_session(2)], read_at=1)
+
+        # Nothing changed, whichever process reads next
+        self.assertEqual(second.update([active_session(1), active_session(2)], read_at=2)[0], cursor)
+        delta = second.delta(cursor)
+        self.assertFalse(delta['reset'])
+        self.assertEqual((delta['opened'], delta['changed'], delta['closed']), ([], [], []))
+
+        later, _ = second.update([active_session(2, calls=1), active_session(3)], read_at=3)
+        # Each process refreshes before answering, and catches up with the version
+        self.assertEqual(first.update([active_session(2, calls=1), active_session(3)], read_at=4)[0], later)
+        delta = first.delta(cursor)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(delta['cursor'], later)
+        self.assertEqual([session['id'] for session in delta['opened']], [3])
+        self.assertEqual([session['id'] for session in delta['changed']], [2])
+        self.assertEqual(delta['closed'], [1])
+
+    def test_out_of_date_read_is_not_recorded(self):
+        first, second = ActiveSessionFeed(), ActiveSessionFeed()
+        cursor, _ = first.update([active_session(1), active_session(2)], read_at=2)
+        second.update([active_session(1), active_session(2)], read_at=3)
+        # Read before the current version was recorded, so the process keeps what it had
+        self.assertEqual(second.update([active_session(1)], read_at=1)[0], cursor)
+        self.assertEqual([session['id'] for session in second.update([active_session(1)], read_at=1)[1]], [1, 2])
+        self.assertEqual(first.update([active_session(1), active_session(2)], read_at=4)[0], cursor)
+
+    def test_changes_logged_by_another_process_are_kept(self):
+        first, second = ActiveSessionFeed(), ActiveSessionFeed()
+        cursor, _ = first.update([active_session(1)], read_at=1)
+        # Another process records session 2 opening, then this one sees it closed
+        second.update([active_session(1)], read_at=2)
+        second.update([active_session(1), active_session(2)], read_at=3)
+        latest, _ = first.update([active_session(1, calls=1)], read_at=4)
+        delta = second.delta(cursor)
+        self.assertEqual([s['id'] for s in delta['opened']], [2])
+        delta = first.delta(cursor)
+        self.assertFalse(delta['reset'])
+        self.assertEqual(delta['cursor'], latest)
+        self.assertEqual(([s['id'] for s in delta['opened']], [s['id'] for s in delta['changed']]), ([], [1]))
+        # Session 2 opened and closed since the cursor, so the client never saw it
+        self.assertEqual(delta['closed'], [])
+        self.assertEqual(first.delta(latest.replace(':3', ':2'))['closed'], [2])
+
+    def test_cursor_agrees_without_sharing_the_sessions(self):
+        sessions_list = [active_session(session_id) for session_id in range(5000)]
+        first, second = ActiveSessionFeed(), ActiveSessionFeed()
+        cursor, _ = first.update(sessions_list, read_at=1)
+        self.assertEqual(second.update(list(sessions_list), read_at=2)[0], cursor)
+
+        # Only the version and a digest are shared, whatever the number of sessions
+        self.assertLess(len(pickle.dumps(cache.get(FEED_CACHE_KEY))), 200)
+        with mock.patch('webportal.active_sessions.cache.get_many') as get_many:
+            get_many.return_value = {}
+            delta = second.delta(cursor)
+        self.assertEqual(delta['cursor'], cursor)
+        self.assertFalse(delta['reset'])
+
+    def test_unknown_cursor_resets(self):
+        feed = ActiveSessionFeed()
+        feed.update([active_session(1)], read_at=1)
+        delta = feed.delta('feedcafe:1')
+        self.assertTrue(delta['reset'])
+        self.assertEqual([session['id'] for session in delta['opened']], [1])
+
+
+class LiveSessionsWindowTests(SimpleTestCase):
+    def setUp(self):
+        start = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+        self.sessions = []
+        for session_id in range(1, 8):
+            session = active_session(session_id, calls=session_id % 3)
+            session['start'] = start - timedelta(minutes=session_id)
+            session['centre_id'] = 1 + session_id % 2
+            self.sessions.append(session)
+
+    def test_window_filters_sorts_and_pages(self):
+        total, window = window_sessions(self.sessions, 0, 3)
+        self.assertEqual((total, [s['id'] for s in window]), (7, [1, 2, 3]))
+        total, window = window_sessions(self.sessions, 2, 2, sort='-calls', centre=2)
+        # Centre 2 has sessions 5, 7, 1 and 3 by calls, ties broken by id in the same direction
+        self.assertEqual((total, [s['id'] for s in window]), (4, [1, 3]))
+        with self.assertRaises(ValueError):
+            window_sessions(self.sessions, 0, 3, sort='password')
+
+    def test_endpoint_serves_one_window(self):
+        url = reverse('live-sessions-data')
+        with mock.patch('webportal.views.shared_sessions', return_value=('window:1', self.sessions)):
+            document = json.loads(self.client.get(url, {'limit': 2, 'offset': 1, 'sort': 'id'}).content)
+            self.assertEqual([s['id'] for s in document['sessions']], [2, 3])
+            self.assertEqual((document['total'], document['count'], document['cursor']), (7, 7, 'window:1'))
+
+            with override_settings(LIVE_SESSIONS_MAX_WINDOW=3):
+                document = json.loads(self.client.get(url, {'limit': 100}).content)
+            self.assertEqual(len(document['sessions']), 3)
+
+            self.assertEqual(self.client.get(url, {'limit': 'all'}).status_code, 400)
+            self.assertEqual(self.client.get(url, {'limit': 2, 'sort': 'password'}).status_code, 400)
+
+
+class ColumnsFormatTests(SimpleTestCase):
+    def test_sessions_are_encoded_column_wise(self):
+        first = active_session(1, calls=2)
+        first.update(start=datetime(2026, 3, 2, 9, tzinfo=timezone.utc), duration_seconds=61.7,
+                     callduration=timedelta(seconds=90.5), external=True)
+        second = active_session(2)
+        second.update(start=None, language_name='French', duration_seconds=None)
+        third = active_session(3)
+        third['start'] = first['start']
+
+        encoded = encode_columns([first, second, third])
+        rows = [dict(zip(encoded['columns'], values)) for values in zip(*encoded['data'])]
+        self.assertEqual(rows[0], {
+            'id': 1, 'agent_name': 'Agent 1', 'start': 1772442000, 'duration_seconds': 61, 'language': 0,
+            'centre': 0, 'calltotal': 2, 'callduration': 90, 'external': 1
+        })
+        self.assertEqual((rows[1]['start'], rows[1]['duration_seconds'], rows[1]['language']), (None, 0, 1))
+        self.assertEqual(rows[2]['language'], 0)
+        self.assertEqual((encoded['languages'], encoded['centres']), (['English', 'French'], ['Dublin']))
+        self.assertEqual(encode_columns([])['data'], [[] for _ in encoded['columns']])
+
+    def test_endpoint_serves_columns_on_request(self):
+        url = reverse('live-sessions-data')
+        sessions = [active_session(1), active_session(2)]
+        with mock.patch('webportal.views.shared_sessions', return_value=('columns:1', sessions)):
+            document = json.loads(self.client.get(url, {'format': 'columns'}).content)
+            self.assertEqual(document['sessions']['data'][0], [1, 2])
+            self.assertEqual(document['count'], 2)
+            document = json.loads(self.client.get(url).content)
+            self.assertEqual([s['id'] for s in document['sessions']], [1, 2])
+
+
+def globaldata(traffic, centres):
+    """/globaldata payload with a summary and one row per (name, traffic, calls, acd) centre"""
+    return [
+        {'columns': ['traffic', 'operators', 'waiting', 'calls', 'minutes', 'acd'],
+         'rows': [[str(traffic), '1', '0', str(sum(c[2] for c in centres)), '0', '60']]},
+        {'columns': ['centre', 'operators', 'traffic', 'waiting', 'languages', 'calls', 'minutes', 'acd'],
+         'rows': [[name, '1', str(load), '0', '1', str(calls), '0', str(acd)] for name, load, calls, acd in centres]},
+    ]
+
+
+class StubAndromeda:
+    """Local ANDROMEDA answering /globaldata with payload after delay seconds"""
+
+    def __init__(self, payload, delay=0):
+        self.payload = payload
+        self.delay = delay
+        self.failing = False
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(stub.delay)
+                status, body = (500, b'') if stub.failing else (200, json.dumps(stub.payload).encode())
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.block_on_close = False
+        self.server = f'127.0.0.1:{self.httpd.server_port}'
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def refused_server():
+    """Address with nothing listening on it"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'127.0.0.1:{sock.getsockname()[1]}'
+
+
+# Circuit state lives in the cache, kept in memory as these tests use no database
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FederatedTrafficTests(SimpleTestCase):
+    def stub(self, payload, delay=0):
+        stub = StubAndromeda(payload, delay)
+        self.addCleanup(stub.close)
+        return stub
+
+    def fetch(self, servers, previous=None):
+        with override_settings(ANDROMEDA_SERVERS=servers, ANDROMEDA_UPSTREAM_TIMEOUT=1):
+            started = time.monotonic()
+            snapshot = fetch_traffic(previous)
+            return snapshot, time.monotonic() - started
+
+    def test_slow_and_refused_upstreams_are_bounded_and_reported(self):
+        ok = self.stub(globaldata(5, [('Dublin', 5, 10, 60)]))
+        slow = self.stub(globaldata(7, [('Cork', 7, 10, 60)]), delay=3)
+        refused = refused_server()
+
+        snapshot, elapsed = self.fetch([ok.server, slow.server, refused])
+        self.assertLess(elapsed, 2)
+        self.assertEqual(snapshot['status'], 200)
+        data = snapshot['data']
+        self.assertTrue(data['partial'])
+        self.assertNotIn('stale', data)
+        self.assertEqual(data['summary']['traffic'], 5)
+        self.assertEqual([upstream['ok'] for upstream in data['upstreams']], [True, False, False])
+        self.assertEqual([upstream['server'] for upstream in data['upstreams']], [ok.server, slow.server, refused])
+
+    def test_failed_upstream_reuses_its_previous_part(self):
+        first = self.stub(globaldata(5, [('Dublin', 5, 10, 60)]))
+        second = self.stub(globaldata(7, [('Cork', 7, 10, 60)]))
+        previous, _ = self.fetch([first.server, second.server])
+        self.assertEqual(previous['data']['summary']['traffic'], 12)
+
+        second.failing = True
+        snapshot, _ = self.fetch([first.server, second.server], previous)
+        self.assertTrue(snapshot['data']['partial'])
+        self.assertEqual(snapshot['data']['summary']['traffic'], 12)
+        self.assertEqual(snapshot['data']['upstreams'][1], {
+            'server': second.server, 'ok': False, 'error': mock.ANY, 'stale': True
+        })
+
+        first.failing = True
+        snapshot, _ = self.fetch([first.server, second.server], snapshot)
+        self.assertTrue(snapshot['data']['stale'])
+        self.assertNotIn('partial', snapshot['data'])
+        self.assertEqual(snapshot['data']['summary']['traffic'], 12)
+
+    def test_many_upstreams_do_not_queue(self):
+        # More servers than threads would make the last ones wait past the timeout
+        stubs = [self.stub(globaldata(1, [(f'Centre {i}', 1, 1, 60)]), delay=0.7) for i in range(12)]
+        snapshot, elapsed = self.fetch([stub.server for stub in stubs])
+        self.assertLess(elapsed, 2)
+        self.assertTrue(all(upstream['ok'] for upstream in snapshot['data']['upstreams']))
+        self.assertEqual(snapshot['data']['summary']['traffic'], 12)
+
+    def test_open_circuit_is_shared_by_every_client(self):
+        server = refused_server()
+        first = AndromedaClient(server, 1, 1, failure_threshold=2, reset_timeout=30)
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                first.get_globaldata()
+
+        # A client in another process, such as the next poller leader
+        second = AndromedaClient(server, 1, 1, failure_threshold=2, reset_timeout=30)
+        with mock.patch.object(second.session, 'get') as get, self.assertRaises(CircuitOpenError):
+            second.get_globaldata()
+        get.assert_not_called()
+
+        # Only one of them gets the trial call once the reset timeout has passed
+        with mock.patch('webportal.andromeda.time.time', return_value=time.time() + 31):
+            self.assertEqual([first.breaker.allow(), second.breaker.allow()], [True, False])
+
+    def test_merge_parts_sums_and_dedupes_centres(self):
+        parts = [
+            {'summary': {'traffic': 2, 'operators': 3, 'waiting': 1, 'calls': 10, 'minutes': 20, 'acd': 60},
+             'centres': [{'id': 1, 'name': 'Dublin', 'traffic': 2, 'calls': 10, 'acd': 60}]},
+            {'summary': {'traffic': 4, 'operators': 5, 'waiting': 0, 'calls': 30, 'minutes': 90, 'acd': 180},
+             'centres': [{'id': 1, 'name': 'Dublin', 'traffic': 1, 'calls': 30, 'acd': 180},
+                         {'id': 2, 'name': 'Cork', 'traffic': 3, 'calls': 0, 'acd': 0}]},
+        ]
+        merged = merge_parts(parts)
+        self.assertEqual(merged['summary'], {
+            'traffic': 6, 'operators': 8, 'waiting': 1, 'calls': 40, 'minutes': 110, 'acd': 150
+        })
+        self.assertEqual(merged['centres'], [
+            {'traffic': 3, 'calls': 40, 'acd': 150, 'id': 1, 'name': 'Dublin'},
+            {'traffic': 3, 'calls': 0, 'acd': 0, 'id': 2, 'name': 'Cork'},
+        ])
+
+
+class ReportHierarchyTests(TestCase):
+    def test_agents_match_the_agent_level_query(self):
+        yesterday = utc_today() - timedelta(days=1)
+        centre = models.Centres.objects.create(name='Dublin')
+        language = models.Languages.objects.create(name='English')
+        kept, removed = (models.Operators.objects.create(centreid=centre.id, langid=language.id, fname=name, sname='Agent')
+                         for name in ('Kept', 'Removed'))
+        for operator in (kept, removed):
+            models.Sessions.objects.create(
+                operid=operator.id, start=day_start(yesterday) + timedelta(hours=9),
+                duration=timedelta(hours=1), calltotal=2
+            )
+        refresh_sessions_daily(since=yesterday)
+        # The rollup keeps the sessions of an operator deleted since
+        removed.delete()
+
+        sql, params = reports.aggregate_sql('agent', yesterday, utc_today(), centre=centre.id, language=language.id)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            expected = [reports.ReportRow(*row) for row in cursor.fetchall()]
+
+        tree = reports.hierarchy(yesterday, utc_today())
+        self.assertEqual(tree.rows('agent', centre.id, language.id), expected)
+        self.assertEqual([row.id for row in expected], [kept.id])
+
+
+class AgentSessionsPageTests(TestCase):
+    def test_pages_have_no_duplicates_or_gaps_with_shared_starts(self):
+        day = date(2026, 3, 2)
+        operator = models.Operators.objects.create(centreid=1, langid=1)
+        other = models.Operators.objects.create(centreid=1, langid=1)
+        starts = [day_start(day) + timedelta(hours=hour) for hour in (9, 9, 9, 10, 10, 11, 11, 11, 11, 12, 13)]
+        for start in starts:
+            models.Sessions.objects.create(operid=operator.id, start=start, duration=timedelta(minutes=30))
+        models.Sessions.objects.create(operid=operator.id, start=starts[0])
+        models.Sessions.objects.create(operid=other.id, start=starts[0], duration=timedelta(minutes=30))
+        expected = list(models.Sessions.objects.filter(operid=operator.id, duration__isnull=False)
+                        .order_by('-start', '-id').values_list('id', flat=True))
+
+        pages = [reports.agent_sessions_page(operator.id, day, day + timedelta(days=1), 4)]
+        while pages[-1].older:
+            pages.append(reports.agent_sessions_page(operator.id, day, day + timedelta(days=1), 4,
+                                                     before=pages[-1].older))
+        self.assertEqual([row.session_id for page in pages for row in page.rows], expected)
+        self.assertEqual([len(page.rows) for page in pages], [4, 4, 3])
+        self.assertIsNone(pages[0].newer)
+
+        # Paging back towards the newest gives the same pages
+        page = pages[-1]
+        for previous in reversed(pages[:-1]):
+            page = reports.agent_sessions_page(operator.id, day, day + timedelta(days=1), 4, after=page.newer)
+            self.assertEqual([row.session_id for row in page.rows], [row.session_id for row in previous.rows])
+        self.assertIsNone(page.newer)
+
+
+class SessionTrendsTests(TestCase):
+    def setUp(self):
+        self.today = utc_today()
+        dublin, cork = (models.Operators.objects.create(centreid=centre, langid=1) for centre in (1, 2))
+        for days_ago, operator, hour in ((3, dublin, 9), (1, dublin, 9), (1, dublin, 15), (1, cork, 9), (0, dublin, 0)):
+            models.Sessions.objects.create(
+                operid=operator.id, start=day_start(self.today - timedelta(days=days_ago)) + timedelta(hours=hour),
+                duration=timedelta(minutes=30), calltotal=2, callduration=timedelta(minutes=4)
+            )
+        # Completed days from the rollup, today from the raw sessions
+        refresh_sessions_daily(since=self.today - timedelta(days=3))
+
+    def test_daily_buckets_are_filled_in_and_filtered(self):
+        start_day = self.today - timedelta(days=3)
+        trend = trends.session_trends('day', start_day, self.today + timedelta(days=1), centre=1)
+        self.assertEqual(trend['labels'][0], day_start(start_day).replace(tzinfo=None).isoformat())
+        self.assertEqual(trend['sessions'], [1, 0, 2, 1])
+        self.assertEqual(trend['calls'], [2, 0, 4, 2])
+        self.assertEqual(trend['minutes'], [4.0, 0, 8.0, 4.0])
+        self.assertEqual(trend['acd'], [120.0, 0, 120.0, 120.0])
+
+    def test_hourly_buckets_come_from_the_raw_sessions(self):
+        start_day = self.today - timedelta(days=1)
+        trend = trends.session_trends('hour', start_day, self.today, language=1)
+        self.assertEqual(len(trend['labels']), 24)
+        self.assertEqual([(hour, n) for hour, n in enumerate(trend['sessions']) if n], [(9, 2), (15, 1)])
+
+    def test_bucket_choice_and_limits(self):
+        day = date(2026, 1, 1)
+        self.assertEqual([trends.pick_bucket(day, day + timedelta(days=days)) for days in (1, 30, 200, 800)],
+                         ['hour', 'day', 'week', 'month'])
+        with self.assertRaises(ValueError):
+            trends.session_trends('minute', day, day + timedelta(days=1))
+        with self.assertRaises(ValueError):
+            trends.session_trends('hour', day, day + timedelta(days=trends.MAX_HOUR_DAYS + 1))
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        self.day = utc_today() - timedelta(days=1)
+        centre = models.Centres.objects.create(name='Dublin & Co')
+        operator = models.Operators.objects.create(centreid=centre.id, langid=1, fname='Ann', sname='Agent')
+        for hour in (9, 11):
+            models.Sessions.objects.create(
+                operid=operator.id, start=day_start(self.day) + timedelta(hours=hour),
+                duration=timedelta(hours=1), calltotal=3, callduration=timedelta(minutes=6)
+            )
+
+    def export(self, export_format):
+        response = self.client.get(reverse('reports-centres-export'), {
+            'format': export_format, 'start_date': f'{self.day:%Y-%m-%d}', 'end_date': f'{self.day:%Y-%m-%d}'
+        })
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_centres_export_as_csv(self):
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="centres-{self.day:%Y-%m-%d}-to-{self.day:%Y-%m-%d}.csv"')
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows, [
+            ['Centre', 'Languages', 'Agents', 'Sessions', 'Calls', 'Minutes', 'ACD (seconds)'],
+            ['Dublin & Co', '1', '1', '2', '6', '12.0', '120'],
+        ])
+
+    def test_centres_export_as_xlsx(self):
+        response, content = self.export('xlsx')
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<c t="inlineStr" s="2"><is><t>Centre</t></is></c>', sheet)
+        self.assertIn('<t>Dublin &amp; Co</t></is></c><c><v>1</v></c><c><v>1</v></c><c><v>2</v></c>', sheet)
+
+    def test_large_exports_are_sent_in_chunks(self):
+        rows = [(n, f'row {n}', datetime(2026, 3, 2, 9)) for n in range(25)]
+        with mock.patch.object(exports, 'ROWS_PER_CHUNK', 10):
+            csv_parts = list(exports.csv_chunks(['n', 'name', 'start'], iter(rows)))
+            xlsx_parts = list(exports.xlsx_chunks(['n', 'name', 'start'], iter(rows), 'test'))
+        self.assertEqual(len(csv_parts), 3)
+        self.assertEqual(b''.join(csv_parts).decode('utf-8-sig').splitlines()[-1], '24,row 24,2026-03-02 09:00:00')
+        self.assertGreater(len(xlsx_parts), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(xlsx_parts))) as workbook:
+            self.assertEqual(workbook.read('xl/worksheets/sheet1.xml').decode().count('<row>'), 26)
+
+    def test_unknown_format_or_date_is_rejected(self):
+        url = reverse('reports-centres-export')
+        self.assertEqual(self.client.get(url, {'format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start_date': 'yesterday'}).status_code, 400)
+
+
+class ReportPlanTests(TransactionTestCase):
+    indexes = {'sessions_active_start_idx', 'sessions_operid_start_idx', 'sessions_start_covering_idx',
+               'operators_centre_lang_idx', 'payplan_lookup_idx'}
+
+    def legacy_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename IN ('sessions', 'operators', 'payplan')")
+            return {name for (name,) in cursor.fetchall()} & self.indexes
+
+    @modify_settings(INSTALLED_APPS={'append': 'webportal.indexes'})
+    def test_indexes_only_built_with_the_app(self):
+        self.assertEqual(self.legacy_indexes(), set())
+        call_command('migrate', 'webportal_indexes', verbosity=0)
+        try:
+            self.assertEqual(self.legacy_indexes(), self.indexes)
+        finally:
+            call_command('migrate', 'webportal_indexes', 'zero', verbosity=0)
+        self.assertEqual(self.legacy_indexes(), set())
+
+    # Building the indexes CONCURRENTLY cannot run inside a test transaction
+    @modify_settings(INSTALLED_APPS={'append': 'webportal.indexes'})
+    def test_no_report_needs_a_sequential_scan(self):
+        call_command('migrate', 'webportal_indexes', verbosity=0)
+        try:
+            # Raises CommandError naming the queries whose plans regressed
+            call_command('check_report_plans', stdout=io.StringIO())
+        finally:
+            call_command('migrate', 'webportal_indexes', 'zero', verbosity=0)
@@ -0,0 +1,228 @@
+"""Persisted ANDROMEDA traffic history for the Historical Reports page
+
+The process fetching from ANDROMEDA accumulates its polls per minute in
+memory and writes one row per centre per minute to traffic_samples. Minutes
+are rolled up into 15-minute and hourly buckets as each quarter hour
+completes, starting from the last 15-minute bucket written so that quarter
+hours missed while no process was recording are caught up. Each resolution
+is only kept for as long as it is useful:
+
+    1 minute    7 days
+    15 minutes  90 days
+    1 hour      forever
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.db import close_old_connections, connection
+
+# (bucket width in seconds, retention) from finest to coarsest
+RESOLUTIONS = (
+    (60, timedelta(days=7)),
+    (900, timedelta(days=90)),
+    (3600, None),
+)
+
+# Most points a chart should need to draw
+MAX_POINTS = 2000
+
+SUMMARY = ''
+
+UPSERT_SQL = """
+    INSERT INTO traffic_samples
+        (resolution, bucket, centre, samples, traffic_sum, operators_sum, waiting_sum, traffic_max)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (resolution, centre, bucket) DO UPDATE SET
+        samples = traffic_samples.samples + EXCLUDED.samples,
+        traffic_sum = traffic_samples.traffic_sum + EXCLUDED.traffic_sum,
+        operators_sum = traffic_samples.operators_sum + EXCLUDED.operators_sum,
+        waiting_sum = traffic_samples.waiting_sum + EXCLUDED.waiting_sum,
+        traffic_max = GREATEST(traffic_samples.traffic_max, EXCLUDED.traffic_max)
+"""
+
+# Recomputes whole coarse buckets from the finer resolution, so running it
+# again over the same range is harmless
+ROLLUP_SQL = """
+    INSERT INTO traffic_samples
+        (resolution, bucket, centre, samples, traffic_sum, operators_sum, waiting_sum, traffic_max)
+    SELECT
+        %(coarse)s,
+        to_timestamp(floor(extract(epoch FROM bucket) / %(coarse)s) * %(coarse)s) AS coarse_bucket,
+        centre,
+        SUM(samples),
+        SUM(traffic_sum),
+        SUM(operators_sum),
+        SUM(waiting_sum),
+        MAX(traffic_max)
+    FROM traffic_samples
+    WHERE resolution = %(fine)s
+        AND bucket >= %(since)s
+    GROUP BY coarse_bucket, centre
+    ON CONFLICT (resolution, centre, bucket) DO UPDATE SET
+        samples = EXCLUDED.samples,
+        traffic_sum = EXCLUDED.traffic_sum,
+        operators_sum = EXCLUDED.operators_sum,
+        waiting_sum = EXCLUDED.waiting_sum,
+        traffic_max = EXCLUDED.traffic_max
+"""
+
+
+def epoch_to_datetime(seconds):
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+class MinuteRecorder:
+    """Accumulates polls per minute and writes each minute once it is over"""
+
+    def __init__(self):
+        self.minute = None
+        self.rows = {}
+        self._lock = threading.Lock()
+
+    def add(self, timestamp, snapshot):
+        """Count one successful poll
+
+        Stale and partial snapshots repeat earlier figures for some or all
+        servers, so they are not real samples.
+        """
+        data = snapshot['data']
+        if snapshot['status'] != 200 or data.get('stale') or data.get('partial'):
+            return
+
+        minute = int(timestamp // 60) * 60
+        values = [(SUMMARY, snapshot['data']['summary'])]
+        values.extend((centre['name'], centre) for centre in snapshot['data']['centres'])
+
+        with self._lock:
+            finished = None
+            if self.minute is not None and minute != self.minute:
+                finished = (self.minute, self.rows)
+                self.rows = {}
+            self.minute = minute
+            for name, counters in values:
+                row = self.rows.setdefault(name, [0, 0, 0, 0, 0])
+                row[0] += 1
+                row[1] += counters.get('traffic', 0)
+                row[2] += counters.get('operators', 0)
+                row[3] += counters.get('waiting', 0)
+                row[4] = max(row[4], counters.get('traffic', 0))
+
+        if finished is not None:
+            self.flush(*finished)
+            # Roll up as soon as a quarter hour has completed, however many
+            # minutes went by since the last poll
+            quarter = RESOLUTIONS[1][0]
+            if minute // quarter != finished[0] // quarter:
+                rollup_pending()
+
+    def flush(self, minute, rows):
+        close_old_connections()
+        bucket = epoch_to_datetime(minute)
+        params = [
+            [RESOLUTIONS[0][0], bucket, name, *row]
+            for name, row in rows.items()
+        ]
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(UPSERT_SQL, params)
+        except Exception as e:
+            print(f"Error writing traffic samples: {e}")
+
+
+def rollup(since, now=None):
+    """Refresh coarser buckets from since onwards and apply retention"""
+    now = now or datetime.now(timezone.utc)
+    close_old_connections()
+    try:
+        with connection.cursor() as cursor:
+            for (fine, _), (coarse, _) in zip(RESOLUTIONS, RESOLUTIONS[1:]):
+                # Start on a coarse boundary so every touched bucket is complete
+                start = epoch_to_datetime(int(since.timestamp() // coarse) * coarse)
+                cursor.execute(ROLLUP_SQL, {'fine': fine, 'coarse': coarse, 'since': start})
+
+            for resolution, retention in RESOLUTIONS:
+                if retention is not None:
+                    cursor.execute(
+                        "DELETE FROM traffic_samples WHERE resolution = %s AND bucket < %s",
+                        [resolution, now - retention]
+                    )
+    except Exception as e:
+        print(f"Error rolling up traffic samples: {e}")
+
+
+def rollup_pending(now=None):
+    """Roll up every quarter hour since the last 15-minute bucket written"""
+    close_old_connections()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT MAX(bucket) FROM traffic_samples WHERE resolution = %s", [RESOLUTIONS[1][0]]
+            )
+            since = cursor.fetchone()[0]
+            if since is None:
+                cursor.execute(
+                    "SELECT MIN(bucket) FROM traffic_samples WHERE resolution = %s", [RESOLUTIONS[0][0]]
+                )
+                since = cursor.fetchone()[0]
+    except Exception as e:
+        print(f"Error rolling up traffic samples: {e}")
+        return
+    if since is not None:
+        rollup(since, now)
+
+
+def pick_resolution(start, end, now=None):
+    """Finest resolution still retained at start that keeps the chart small"""
+    now = now or datetime.now(timezone.utc)
+    span = (end - start).total_seconds()
+    for resolution, retention in RESOLUTIONS:
+        if retention is not None and start < now - retention:
+            continue
+        if span / resolution <= MAX_POINTS:
+            return resolution
+    return RESOLUTIONS[-1][0]
+
+
+def traffic_series(centre, start, end):
+    """Chart-ready average and peak traffic between start and end"""
+    resolution = pick_resolution(start, end)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT bucket, samples, traffic_sum, operators_sum, waiting_sum, traffic_max
+            FROM traffic_samples
+            WHERE resolution = %s
+                AND centre = %s
+                AND bucket >= %s
+                AND bucket < %s
+            ORDER BY bucket
+        """, [resolution, centre, start, end])
+        rows = cursor.fetchall()
+
+    return {
+        'resolution': resolution,
+        'labels': [row[0].isoformat() for row in rows],
+        'traffic': [round(row[2] / row[1], 1) for row in rows],
+        'operators': [round(row[3] / row[1], 1) for row in rows],
+        'waiting': [round(row[4] / row[1], 1) for row in rows],
+        'peak': [row[5] for row in rows],
+    }
+
+
+def centre_names():
+    """Centres that have any persisted history"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT centre FROM traffic_samples
+            WHERE resolution = %s AND centre <> %s
+            ORDER BY centre
+        """, [RESOLUTIONS[-1][0], SUMMARY])
+        return [row[0] for row in cursor.fetchall()]
+
+
+_recorder = MinuteRecorder()
+
+
+def record_sample(snapshot):
+    """Record a snapshot freshly fetched from ANDROMEDA"""
+    _recorder.add(time.time(), snapshot)
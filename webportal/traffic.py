@@ -0,0 +1,368 @@
+"""Shared ANDROMEDA traffic snapshot
+
+A single background poller fetches /globaldata once per interval and keeps the
+processed summary and centres in a snapshot that every request reads from,
+so the load on ANDROMEDA no longer grows with the number of open dashboards.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from .andromeda import CircuitOpenError, andromeda_servers, fetch_all
+from .globaldata import parse_centres, parse_summary
+from .history import get_history
+from .http import dumps
+from .timeseries import record_sample
+
+# Cache keys shared by every worker process of the deployment
+SNAPSHOT_CACHE_KEY = 'webportal:traffic:snapshot'
+LEADER_CACHE_KEY = 'webportal:traffic:leader'
+
+# Longest a request waits for the very first snapshot of a process
+FIRST_SNAPSHOT_TIMEOUT = 15
+
+
+def empty_summary():
+    """Zeroed summary used when ANDROMEDA data is unavailable"""
+    return {
+        'traffic': 0,
+        'operators': 0,
+        'waiting': 0,
+        'calls': 0,
+        'minutes': 0,
+        'acd': 0
+    }
+
+
+def process_traffic_summary(raw_data):
+    """Process raw data from ANDROMEDA to extract summary information"""
+    try:
+        summary = parse_summary(raw_data)
+    except Exception as e:
+        print(f"Error processing traffic summary: {e}")
+        summary = None
+
+    return {
+        'summary': summary or empty_summary()
+    }
+
+
+def process_traffic_centres(raw_data):
+    """Process raw data from ANDROMEDA to extract centres data for chart"""
+    try:
+        return parse_centres(raw_data)
+    except Exception as e:
+        print(f"Error processing traffic centres: {e}")
+        return []
+
+
+def describe_error(server, error):
+    """User-facing message for a failed fetch, reported on stdout once"""
+    if isinstance(error, CircuitOpenError):
+        # Already reported when the circuit opened
+        return 'ANDROMEDA server is unavailable'
+    if isinstance(error, requests.exceptions.RequestException):
+        print(f"Error fetching data from ANDROMEDA {server}: {error}")
+        return 'Failed to fetch data from ANDROMEDA server'
+    if isinstance(error, json.JSONDecodeError):
+        print(f"Error parsing JSON from ANDROMEDA {server}: {error}")
+        return 'Invalid JSON response from ANDROMEDA server'
+    print(f"Unexpected error fetching traffic from {server}: {error}")
+    return 'An unexpected error occurred'
+
+
+def weighted_acd(counters):
+    """ACD over several counter sets, weighted by their calls"""
+    calls = sum(c['calls'] for c in counters)
+    if not calls:
+        return max(c['acd'] for c in counters)
+    return round(sum(c['acd'] * c['calls'] for c in counters) / calls)
+
+
+def merge_parts(parts):
+    """Combine the summaries and centres of several ANDROMEDA servers"""
+    if len(parts) == 1:
+        return {
+            'summary': dict(parts[0]['summary']),
+            'centres': [dict(centre) for centre in parts[0]['centres']]
+        }
+
+    summary = {key: sum(part['summary'][key] for part in parts) for key in empty_summary()}
+    summary['acd'] = weighted_acd([part['summary'] for part in parts])
+
+    # A centre served by several switches is reported once
+    by_name = {}
+    for part in parts:
+        for centre in part['centres']:
+            by_name.setdefault(centre['name'], []).append(centre)
+
+    centres = []
+    for centre_id, (name, group) in enumerate(by_name.items(), 1):
+        centre = {key: sum(c.get(key, 0) for c in group) for key in group[0] if key not in ('id', 'name')}
+        centre['acd'] = weighted_acd(group)
+        centre['id'] = centre_id
+        centre['name'] = name
+        centres.append(centre)
+
+    return {
+        'summary': summary,
+        'centres': centres
+    }
+
+
+def fetch_traffic(previous=None):
+    """Fetch /globaldata from every ANDROMEDA server and build one snapshot
+
+    Servers are fetched concurrently, each bounded by ANDROMEDA_UPSTREAM_TIMEOUT.
+    A server that fails keeps contributing its last good figures from
+    previous (stale-while-revalidate), and its status is reported in the
+    snapshot's 'upstreams' list. Only when no server has ever answered is
+    the zeroed fallback returned.
+    """
+    servers = andromeda_servers()
+    now = time.time()
+    previous_parts = previous.get('parts', {}) if previous else {}
+
+    parts = {}
+    upstreams = []
+    messages = []
+    for server, traffic_data, error in fetch_all(servers, settings.ANDROMEDA_UPSTREAM_TIMEOUT):
+        if error is None:
+            try:
+                parts[server] = {
+                    'summary': process_traffic_summary(traffic_data)['summary'],
+                    'centres': process_traffic_centres(traffic_data),
+                    'fetched': now
+                }
+                upstreams.append({'server': server, 'ok': True})
+                continue
+            except Exception as e:
+                error = e
+
+        message = describe_error(server, error)
+        messages.append(message)
+        upstream = {'server': server, 'ok': False, 'error': message}
+        if server in previous_parts:
+            # Keep the last good figures of this server, flagged as stale
+            parts[server] = previous_parts[server]
+            upstream['stale'] = True
+        upstreams.append(upstream)
+
+    if not parts:
+        return {
+            'data': error_data(messages[0]),
+            'status': 500,
+            'fetched': now
+        }
+
+    data = merge_parts([parts[server] for server in servers if server in parts])
+    data['upstreams'] = upstreams
+    failed = [upstream['server'] for upstream in upstreams if not upstream['ok']]
+    if failed:
+        data['warning'] = f"{messages[0]}: {', '.join(failed)}"
+        # Stale when nothing in the snapshot is fresh, partial otherwise
+        if len(failed) == len(servers):
+            data['stale'] = True
+        else:
+            data['partial'] = True
+
+    return {
+        'data': data,
+        'status': 200,
+        'fetched': max(part['fetched'] for part in parts.values()),
+        'parts': parts
+    }
+
+
+def error_data(message):
+    """Zeroed traffic document returned alongside an error message"""
+    return {
+        'error': message,
+        'summary': empty_summary(),
+        'centres': []
+    }
+
+
+def next_version(previous, snapshot):
+    """Version for a freshly fetched snapshot, bumped only when data changed"""
+    if previous is None:
+        # Start from the clock so versions keep increasing across cache restarts
+        return int(time.time())
+    if previous['data'] == snapshot['data']:
+        return previous['version']
+    return previous['version'] + 1
+
+
+def traffic_etag(snapshot):
+    """ETag identifying the full traffic document of a snapshot"""
+    version = snapshot['version']
+    return f'"traffic-{version}"'
+
+
+class TrafficPoller:
+    """Background thread keeping the latest traffic snapshot in memory
+
+    Every worker process runs one poller, but only the process holding the
+    leader lease in the shared cache talks to ANDROMEDA on a given tick; the
+    others pick the snapshot up from the cache. With a shared cache backend
+    that gives one upstream request per interval for the whole deployment.
+    """
+
+    # Number of recent versions kept to answer ?since= with a delta
+    history_size = 30
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._snapshot = None
+        self._body = b''
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self._history = OrderedDict()
+        self._deltas = {}
+        self._ready = threading.Event()
+
+    def start(self):
+        """Start the polling thread once per process"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='andromeda-poller', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Error in ANDROMEDA poller: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def poll_once(self):
+        """Refresh the snapshot, fetching upstream only when holding the lease"""
+        # One lease per interval-sized time slot, so exactly one process of
+        # the deployment wins each slot without relying on expiry timing
+        lease = f'{LEADER_CACHE_KEY}:{int(time.time() // self.interval)}'
+        if cache.add(lease, os.getpid(), timeout=self.interval * 2):
+            previous = cache.get(SNAPSHOT_CACHE_KEY)
+            snapshot = fetch_traffic(previous)
+            snapshot['version'] = next_version(previous, snapshot)
+            cache.set(SNAPSHOT_CACHE_KEY, snapshot, timeout=self.interval * 10)
+            # Only the fetching process persists, so each poll counts once
+            record_sample(snapshot)
+        else:
+            snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+
+        if snapshot is not None:
+            self.publish(snapshot)
+
+    def publish(self, snapshot):
+        """Make a snapshot the current one for this process"""
+        # Serialize once per version so every request is a plain memory read
+        if self._snapshot is not None and snapshot['version'] == self._snapshot['version']:
+            return
+        body = dumps(dict(snapshot['data'], version=snapshot['version']))
+        with self._lock:
+            self._snapshot = snapshot
+            self._body = body
+            self._deltas = {}
+            if snapshot['status'] == 200:
+                self._history[snapshot['version']] = {c['id']: c for c in snapshot['data']['centres']}
+                while len(self._history) > self.history_size:
+                    self._history.popitem(last=False)
+            listeners = list(self._listeners)
+        self._ready.set()
+
+        for listener in listeners:
+            try:
+                listener(snapshot, body)
+            except Exception as e:
+                print(f"Error notifying traffic listener: {e}")
+
+    def add_listener(self, listener):
+        """Call listener(snapshot, body) from the poller thread on every new snapshot"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def wait_ready(self, timeout):
+        """Wait until the first snapshot is available"""
+        return self._ready.wait(timeout)
+
+    def snapshot(self):
+        """Return the latest snapshot and its serialized JSON body"""
+        with self._lock:
+            return self._snapshot, self._body
+
+    def delta_body(self, since):
+        """Serialized changes from version since to the current snapshot
+
+        Returns None when since is no longer in the recent history, in which
+        case the client needs the full document.
+        """
+        with self._lock:
+            if since in self._deltas:
+                return self._deltas[since]
+            snapshot = self._snapshot
+            previous = self._history.get(since)
+            current = self._history.get(snapshot['version']) if snapshot else None
+            if previous is None or current is None:
+                return None
+
+        changed = [centre for centre_id, centre in current.items() if previous.get(centre_id) != centre]
+        removed = [centre_id for centre_id in previous if centre_id not in current]
+        # Everything but the centres is small, so it is always sent in full
+        document = {key: value for key, value in snapshot['data'].items() if key != 'centres'}
+        document.update({
+            'version': snapshot['version'],
+            'since': since,
+            'delta': True,
+            'centres': changed,
+            'removed': removed
+        })
+        body = dumps(document)
+
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._deltas[since] = body
+        return body
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_poller():
+    """Return the process-wide poller, starting it on first use"""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = TrafficPoller(settings.ANDROMEDA_POLL_INTERVAL)
+            _poller.add_listener(get_history().record_snapshot)
+
+    _poller.start()
+    return _poller
+
+
+def get_traffic_snapshot():
+    """Return the current traffic snapshot, waiting for the first poll if needed"""
+    poller = get_poller()
+    if not poller.wait_ready(FIRST_SNAPSHOT_TIMEOUT):
+        snapshot = {
+            'data': error_data('Traffic data is not available yet'),
+            'status': 503,
+            'fetched': time.time(),
+            'version': 0
+        }
+        return snapshot, dumps(snapshot['data'])
+    return poller.snapshot()
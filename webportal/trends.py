@@ -0,0 +1,128 @@
+"""Session trends by hour, day, week or month for the Historical Reports page
+
+Day, week and month buckets are date_trunc over daily_sessions_source(), so
+completed days come from the sessions_daily rollup and only today or days
+not rolled up yet are aggregated from sessions. Hour buckets need the raw
+sessions and are limited to MAX_HOUR_DAYS. Empty buckets are filled in so
+every series lines up with its labels, and results go through the report
+cache like the other reports.
+"""
+from datetime import timedelta
+
+from django.db import connection
+
+from . import reports
+from .rollups import daily_sessions_source, day_start
+
+BUCKETS = ('hour', 'day', 'week', 'month')
+
+# Longest range that may be charted by the hour
+MAX_HOUR_DAYS = 31
+
+DAILY_TOTALS_SQL = """
+    SELECT
+        date_trunc(%s, d.day) AS bucket,
+        SUM(d.sessions)::bigint AS sessions,
+        COALESCE(SUM(d.calls), 0)::bigint AS calls,
+        COALESCE(SUM(d.call_seconds), 0) AS call_seconds
+    FROM {source} d
+    WHERE {where}
+    GROUP BY 1
+"""
+
+HOURLY_TOTALS_SQL = """
+    SELECT
+        date_trunc('hour', s.start AT TIME ZONE 'UTC') AS bucket,
+        COUNT(*) AS sessions,
+        COALESCE(SUM(s.calltotal), 0)::bigint AS calls,
+        COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0)::double precision AS call_seconds
+    FROM sessions s
+    INNER JOIN operators o ON s.operid = o.id
+    WHERE s.duration IS NOT NULL
+        AND s.start >= %s
+        AND s.start < %s
+        AND {where}
+    GROUP BY 1
+"""
+
+# Every bucket from start_day to end_day (exclusive), with or without sessions
+SERIES_SQL = """
+    WITH totals AS ({totals})
+    SELECT
+        b.bucket,
+        COALESCE(t.sessions, 0),
+        COALESCE(t.calls, 0),
+        COALESCE(t.call_seconds, 0)
+    FROM generate_series(
+        date_trunc(%s, %s::timestamp),
+        %s::timestamp - interval '1 microsecond',
+        %s::interval
+    ) AS b(bucket)
+    LEFT JOIN totals t ON t.bucket = b.bucket
+    ORDER BY b.bucket
+"""
+
+
+def pick_bucket(start_day, end_day):
+    """Bucket keeping a range between a few and a few hundred points"""
+    days = (end_day - start_day).days
+    if days <= 2:
+        return 'hour'
+    if days <= 92:
+        return 'day'
+    if days <= 366:
+        return 'week'
+    return 'month'
+
+
+def trend_sql(bucket, start_day, end_day, centre=None, language=None):
+    """SQL and params of session_trends(), for running it or checking its plan"""
+    prefix = 'o' if bucket == 'hour' else 'd'
+    conditions = ['TRUE']
+    filters = []
+    if centre is not None:
+        conditions.append(f'{prefix}.centreid = %s')
+        filters.append(centre)
+    if language is not None:
+        conditions.append(f'{prefix}.langid = %s')
+        filters.append(language)
+    where = ' AND '.join(conditions)
+
+    if bucket == 'hour':
+        totals = HOURLY_TOTALS_SQL.format(where=where)
+        params = [day_start(start_day), day_start(end_day)] + filters
+    else:
+        source, source_params = daily_sessions_source(start_day, end_day)
+        totals = DAILY_TOTALS_SQL.format(source=source, where=where)
+        params = [bucket] + source_params + filters
+
+    params += [bucket, start_day, end_day, f'1 {bucket}']
+    return SERIES_SQL.format(totals=totals), params
+
+
+def session_trends(bucket, start_day, end_day, centre=None, language=None):
+    """Chart-ready sessions, calls, call minutes and ACD per bucket from start_day to end_day (exclusive)
+
+    Raises ValueError for an unknown bucket or an hourly range longer than
+    MAX_HOUR_DAYS.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'")
+    if bucket == 'hour' and end_day - start_day > timedelta(days=MAX_HOUR_DAYS):
+        raise ValueError(f'Hourly trends cover at most {MAX_HOUR_DAYS} days')
+
+    def query():
+        sql, params = trend_sql(bucket, start_day, end_day, centre, language)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return {
+            'bucket': bucket,
+            'labels': [row[0].isoformat() for row in rows],
+            'sessions': [row[1] for row in rows],
+            'calls': [row[2] for row in rows],
+            'minutes': [round(row[3] / 60, 1) for row in rows],
+            'acd': [round(row[3] / row[2], 1) if row[2] else 0 for row in rows],
+        }
+
+    return reports.cached(('trend', bucket, centre, language, None), start_day, end_day, query)
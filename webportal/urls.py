@@ -6,6 +6,7 @@ urlpatterns = [
     path('', views.live_traffic, name='live-traffic'),
     path('live/traffic/', views.live_traffic, name='live-traffic'),
     path('live/traffic/data/', views.live_traffic_data, name='live-traffic-data'),
+    path('live/traffic/history/', views.live_traffic_history, name='live-traffic-history'),
     path('live/sessions/', views.live_sessions, name='live-sessions'),
     path('live/sessions/data/', views.live_sessions_data, name='live-sessions-data'),
     
@@ -17,6 +18,11 @@ urlpatterns = [
     path('reports/centres/<int:centre_id>/', views.reports_centre_detail, name='reports-centre-detail'),
     path('reports/centres/<int:centre_id>/<int:language_id>/', views.reports_language_detail, name='reports-language-detail'),
     path('reports/centres/<int:centre_id>/<int:language_id>/<int:operator_id>/', views.reports_agent_detail, name='reports-agent-detail'),
+    path('reports/centres/export/', views.reports_centres_export, name='reports-centres-export'),
+    path('reports/centres/<int:centre_id>/export/', views.reports_centre_detail_export, name='reports-centre-detail-export'),
+    path('reports/centres/<int:centre_id>/<int:language_id>/export/', views.reports_language_detail_export, name='reports-language-detail-export'),
+    path('reports/centres/<int:centre_id>/<int:language_id>/<int:operator_id>/export/', views.reports_agent_detail_export, name='reports-agent-detail-export'),
+    path('reports/jobs/<int:job_id>/', views.reports_job_status, name='reports-job-status'),
     path('reports/friends/', views.reports_friends, name='reports-friends'),
     path('reports/historical/', views.reports_historical, name='reports-historical'),
     
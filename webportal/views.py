@@ -1,13 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseRedirect
 from django.urls import reverse
 from django.contrib import messages
 from django.db import IntegrityError
 from django.conf import settings
-import requests
-import json
+from django.utils.cache import parse_etags
+from django.utils.text import slugify
 from datetime import date
-from .models import Centres, Operators, Administrators, Calls, Sessions, Languages, Payplan
+from .models import Centres, Operators, Administrators, Languages, Payplan, ReportJob
+from . import friends, payplans, report_jobs, reports, timeseries, trends
+from .active_sessions import SESSION_SORT_KEYS, encode_columns, get_session_feed, window_sessions
+from .exports import EXPORT_FORMATS, export_response
+from .history import SUMMARY, get_history
+from .http import FastJsonResponse, dumps
+from .session_registry import sessions_flight, shared_sessions
+from .traffic import get_poller, get_traffic_snapshot, traffic_etag
 
 # Create your views here.
 
@@ -21,194 +28,71 @@ def live_traffic(request):
     return render(request, 'live-traffic.html', context)
 
 def live_traffic_data(request):
-    """AJAX endpoint to get traffic data from ANDROMEDA server"""
-    try:
-        # Get the ANDROMEDA server URL from settings
-        andromeda_url = f"http://{settings.ANDROMEDA_SERVER}/globaldata"
-        
-        # Make HTTP request to ANDROMEDA server
-        response = requests.get(andromeda_url, timeout=10)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        
-        # Parse JSON response
-        traffic_data = response.json()
-        
-        # Process the data to extract summary information
-        summary_data = process_traffic_summary(traffic_data)
-        
-        # Process centres data for the chart
-        centres_data = process_traffic_centres(traffic_data)
-        
-        # Combine summary and centres data
-        response_data = {
-            'summary': summary_data['summary'],
-            'centres': centres_data
-        }
-        
-        return JsonResponse(response_data)
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from ANDROMEDA: {e}")
-        return JsonResponse({
-            'error': 'Failed to fetch data from ANDROMEDA server',
-            'summary': {
-                'traffic': 0,
-                'operators': 0,
-                'waiting': 0,
-                'calls': 0,
-                'minutes': 0,
-                'acd': 0
-            },
-            'centres': []
-        }, status=500)
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON from ANDROMEDA: {e}")
-        return JsonResponse({
-            'error': 'Invalid JSON response from ANDROMEDA server',
-            'summary': {
-                'traffic': 0,
-                'operators': 0,
-                'waiting': 0,
-                'calls': 0,
-                'minutes': 0,
-                'acd': 0
-            },
-            'centres': []
-        }, status=500)
-    except Exception as e:
-        print(f"Unexpected error in live_traffic_data: {e}")
-        return JsonResponse({
-            'error': 'An unexpected error occurred',
-            'summary': {
-                'traffic': 0,
-                'operators': 0,
-                'waiting': 0,
-                'calls': 0,
-                'minutes': 0,
-                'acd': 0
-            },
-            'centres': []
-        }, status=500)
-
-def process_traffic_summary(raw_data):
-    """Process raw data from ANDROMEDA to extract summary information"""
-    try:
-        # Based on your JSON structure, the first object contains the summary data
-        if len(raw_data) >= 1:
-            summary_object = raw_data[0]
-            
-            # Extract the summary row data
-            if 'rows' in summary_object and len(summary_object['rows']) > 0:
-                summary_row = summary_object['rows'][0]
-                
-                # Based on current data: ["7", "7", "9", "", "", "", "0"]
-                # Mapping: Traffic, Agents, Waiting, Calls, Minutes, ACD, (unused)
-                summary = {
-                    'traffic': int(summary_row[0]) if summary_row[0] and summary_row[0].isdigit() else 0,
-                    'operators': int(summary_row[1]) if summary_row[1] and summary_row[1].isdigit() else 0,
-                    'waiting': int(summary_row[2]) if summary_row[2] and summary_row[2].isdigit() else 0,
-                    'calls': int(summary_row[3]) if summary_row[3] and summary_row[3].isdigit() else 0,
-                    'minutes': int(summary_row[4]) if summary_row[4] and summary_row[4].isdigit() else 0,
-                    'acd': int(summary_row[5]) if summary_row[5] and summary_row[5].isdigit() else 0
-                }
-                
-                return {
-                    'summary': summary
-                }
-        
-        # Fallback if data structure is unexpected
-        return {
-            'summary': {
-                'traffic': 0,
-                'operators': 0,
-                'waiting': 0,
-                'calls': 0,
-                'minutes': 0,
-                'acd': 0
-            }
-        }
-        
-    except Exception as e:
-        print(f"Error processing traffic summary: {e}")
-        return {
-            'summary': {
-                'traffic': 0,
-                'operators': 0,
-                'waiting': 0,
-                'calls': 0,
-                'minutes': 0,
-                'acd': 0
-            }
-        }
+    """AJAX endpoint serving the shared ANDROMEDA traffic snapshot"""
+    # The poller fetches and processes ANDROMEDA data once per interval for
+    # all viewers; here we only hand out the pre-serialized snapshot
+    snapshot, body = get_traffic_snapshot()
+    if snapshot['status'] != 200 or not snapshot['version']:
+        return HttpResponse(body, content_type='application/json', status=snapshot['status'])
+    
+    # Nothing moved since the version the client already has
+    etag = traffic_etag(snapshot)
+    since = request.GET.get('since', '')
+    if etag in parse_etags(request.headers.get('If-None-Match', '')) or since == str(snapshot['version']):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    # Only the centres that changed, when the client's version is recent enough
+    if since.isdigit():
+        delta = get_poller().delta_body(int(since))
+        if delta is not None:
+            return HttpResponse(delta, content_type='application/json')
+    
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
 
-def process_traffic_centres(raw_data):
-    """Process raw data from ANDROMEDA to extract centres data for chart"""
+def live_traffic_history(request):
+    """AJAX endpoint with recent traffic history for sparklines"""
     try:
-        centres = []
-        
-        print(f"Processing centres from {len(raw_data)} objects")
-        
-        # Skip the first object (summary) and process the rest as centres
-        for i, centre_object in enumerate(raw_data[1:], 1):
-            print(f"Processing centre object {i}: {centre_object}")
-            
-            if 'rows' in centre_object and len(centre_object['rows']) > 0:
-                # Process all rows in this centre object (in case there are multiple centres in one object)
-                for row_index, centre_row in enumerate(centre_object['rows']):
-                    print(f"  Processing row {row_index}: {centre_row}")
-                    
-                    # Based on the JSON structure, extract centre data
-                    # Columns: ['centre', 'id', 'operators', 'languages', 'calls', 'minutes', 'acd', 'traffic']
-                    if len(centre_row) >= 8:
-                        centre_data = {
-                            'id': len(centres) + 1,  # Use sequential IDs
-                            'name': centre_row[0] if centre_row[0] else f'Centre {len(centres) + 1}',
-                            'operators': int(centre_row[2]) if centre_row[2] and centre_row[2].isdigit() else 0,  # operators is at index 2
-                            'traffic': int(centre_row[7]) if centre_row[7] and centre_row[7].isdigit() else 0,   # traffic is at index 7
-                            'languages': int(centre_row[3]) if centre_row[3] and centre_row[3].isdigit() else 0,  # languages is at index 3
-                            'calls': int(centre_row[4]) if centre_row[4] and centre_row[4].isdigit() else 0,      # calls is at index 4
-                            'minutes': int(centre_row[5]) if centre_row[5] and centre_row[5].isdigit() else 0,   # minutes is at index 5
-                            'acd': int(centre_row[6]) if centre_row[6] and centre_row[6].isdigit() else 0        # acd is at index 6
-                        }
-                        centres.append(centre_data)
-                        print(f"  Added centre: {centre_data}")
-        
-        print(f"Total centres processed: {len(centres)}")
-        return centres
-        
-    except Exception as e:
-        print(f"Error processing traffic centres: {e}")
-        return []
+        minutes = int(request.GET.get('minutes', 60))
+        points = int(request.GET.get('points', 60))
+    except ValueError:
+        return FastJsonResponse({'error': 'minutes and points must be integers'}, status=400)
+    
+    # History is recorded by the poller, so make sure it is running
+    get_poller()
+    history = get_history()
+    centre = request.GET.get('centre')
+    names = [centre] if centre else history.names()
+    
+    centres = {}
+    for name in names:
+        series = history.series(name, minutes * 60, points)
+        if series is not None:
+            centres[name] = series
+    
+    return FastJsonResponse({
+        'summary': history.series(SUMMARY, minutes * 60, points),
+        'centres': centres
+    })
 
 def live_sessions(request):
     """Live sessions monitoring"""
     try:
-        # Use raw SQL to get sessions with joins and calculated fields
-        # Only show sessions where duration is null (active sessions)
-        sessions_data = Sessions.objects.raw("""
-            SELECT 
-                s.id,
-                s.operid,
-                s.start,
-                s.duration,
-                s.callduration,
-                s.calltotal,
-                s.external,
-                CONCAT(o.fname, ' ', o.sname) as agent_name,
-                l.name as language_name,
-                EXTRACT(EPOCH FROM (NOW() - s.start)) as duration_seconds
-            FROM sessions s
-            INNER JOIN operators o ON s.operid = o.id
-            INNER JOIN languages l ON o.langid = l.id
-            WHERE s.duration IS NULL
-            ORDER BY s.start DESC
-        """)
+        # Only the first window is rendered; the table fetches the rest as it scrolls
+        cursor, sessions_list = shared_sessions()
+        sessions_data = sessions_list[:settings.LIVE_SESSIONS_PAGE]
         
         context = {
             'page_title': 'Live Sessions',
             'active_section': 'live',
             'active_subsection': 'sessions',
-            'sessions': sessions_data
+            'sessions': sessions_data,
+            'sessions_count': len(sessions_list),
+            'languages': Languages.objects.all().order_by('name'),
+            'centres': Centres.objects.all().order_by('name')
         }
         return render(request, 'live-sessions.html', context)
     except Exception as e:
@@ -218,55 +102,70 @@ def live_sessions(request):
             'page_title': 'Live Sessions',
             'active_section': 'live',
             'active_subsection': 'sessions',
-            'sessions': []
+            'sessions': [],
+            'sessions_count': 0,
+            'languages': [],
+            'centres': []
         }
         return render(request, 'live-sessions.html', context)
 
 def live_sessions_data(request):
-    """AJAX endpoint to get sessions data"""
+    """AJAX endpoint with the active sessions
+
+    ?cursor= returns only what changed since that cursor, and ?limit= one
+    sorted and filtered window of rows; otherwise every active session.
+    ?format=columns sends each list of sessions column-wise (encode_columns).
+    """
     try:
-        # Use raw SQL to get sessions with joins and calculated fields
-        # Only show sessions where duration is null (active sessions)
-        sessions_data = Sessions.objects.raw("""
-            SELECT 
-                s.id,
-                s.operid,
-                s.start,
-                s.duration,
-                s.callduration,
-                s.calltotal,
-                s.external,
-                CONCAT(o.fname, ' ', o.sname) as agent_name,
-                l.name as language_name,
-                EXTRACT(EPOCH FROM (NOW() - s.start)) as duration_seconds
-            FROM sessions s
-            INNER JOIN operators o ON s.operid = o.id
-            INNER JOIN languages l ON o.langid = l.id
-            WHERE s.duration IS NULL
-            ORDER BY s.start DESC
-        """)
+        cursor, sessions_list = shared_sessions()
+        columns = request.GET.get('format') == 'columns'
+        encode = encode_columns if columns else list
         
-        # Convert sessions to JSON-serializable format
-        sessions_list = []
-        for session in sessions_data:
-            sessions_list.append({
-                'id': session.id,
-                'agent_name': session.agent_name,
-                'start': session.start.strftime('%Y-%m-%d %H:%M:%S') if session.start else '',
-                'duration_seconds': session.duration_seconds,
-                'language_name': session.language_name,
-                'calltotal': session.calltotal or 0,
-                'callduration': session.callduration.total_seconds() if session.callduration else 0,
-                'external': session.external
-            })
+        if 'cursor' in request.GET:
+            since = request.GET['cursor']
+            
+            def delta_body():
+                delta = get_session_feed().delta(since)
+                delta['opened'] = encode(delta['opened'])
+                delta['changed'] = encode(delta['changed'])
+                return dumps(delta)
+            
+            body = sessions_flight.do(('delta', columns, cursor, since), delta_body)
+        elif 'limit' in request.GET:
+            try:
+                offset = max(0, int(request.GET.get('offset', 0)))
+                limit = min(max(1, int(request.GET['limit'])), settings.LIVE_SESSIONS_MAX_WINDOW)
+                language = int(request.GET['language']) if request.GET.get('language') else None
+                centre = int(request.GET['centre']) if request.GET.get('centre') else None
+            except ValueError:
+                return FastJsonResponse({'error': 'offset, limit, language and centre must be integers'}, status=400)
+            sort = request.GET.get('sort', '-start')
+            if sort.lstrip('-') not in SESSION_SORT_KEYS:
+                return FastJsonResponse({'error': f"Unknown sort '{sort}'"}, status=400)
+            
+            def window_body():
+                total, window = window_sessions(sessions_list, offset, limit, sort, language, centre)
+                return dumps({
+                    'sessions': encode(window),
+                    'offset': offset,
+                    'total': total,
+                    'count': len(sessions_list),
+                    'cursor': cursor
+                })
+            
+            body = sessions_flight.do(('window', columns, cursor, offset, limit, sort, language, centre),
+                                      window_body)
+        else:
+            body = sessions_flight.do(('full', columns, cursor), lambda: dumps({
+                'sessions': encode(sessions_list),
+                'count': len(sessions_list),
+                'cursor': cursor
+            }))
         
-        return JsonResponse({
-            'sessions': sessions_list,
-            'count': len(sessions_list)
-        })
+        return HttpResponse(body, content_type='application/json')
     except Exception as e:
         print(f"Error in live_sessions_data view: {e}")
-        return JsonResponse({
+        return FastJsonResponse({
             'error': str(e),
             'sessions': [],
             'count': 0
@@ -274,62 +173,21 @@ def live_sessions_data(request):
 
 def reports_centres(request):
     """Centres reports with date range filtering"""
-    from datetime import date, datetime
-    
     # Get date range from request or use today as default
     start_date = request.GET.get('start_date', date.today().strftime('%Y-%m-%d'))
     end_date = request.GET.get('end_date', date.today().strftime('%Y-%m-%d'))
     
     try:
-        # Convert string dates to datetime objects for the query
-        start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-        end_datetime = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
-        
-        # Use raw SQL to get aggregated data grouped by centre
-        from django.db import connection
-        
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    c.id as centre_id,
-                    c.name as centre_name,
-                    COUNT(DISTINCT o.langid) as languages_count,
-                    COUNT(DISTINCT s.operid) as agents_count,
-                    COUNT(s.id) as sessions_count,
-                    COALESCE(SUM(s.calltotal), 0) as total_calls,
-                    COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0) as total_minutes_seconds,
-                    CASE 
-                        WHEN COALESCE(SUM(s.calltotal), 0) > 0 
-                        THEN COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0) / COALESCE(SUM(s.calltotal), 1)
-                        ELSE 0 
-                    END as acd_seconds
-                FROM sessions s
-                INNER JOIN operators o ON s.operid = o.id
-                INNER JOIN centres c ON o.centreid = c.id
-                WHERE s.duration IS NOT NULL
-                    AND s.start >= %s
-                    AND s.start <= %s
-                GROUP BY c.id, c.name
-                ORDER BY c.name
-            """, [start_datetime, end_datetime])
-            
-            centres_data = []
-            for row in cursor.fetchall():
-                centres_data.append({
-                    'centre_id': row[0],
-                    'centre_name': row[1],
-                    'languages_count': row[2],
-                    'agents_count': row[3],
-                    'sessions_count': row[4],
-                    'total_calls': row[5],
-                    'total_minutes_seconds': row[6],
-                    'acd_seconds': row[7]
-                })
+        # Totals per centre over whole days, half-open at the end
+        start_day, end_day = reports.day_range(start_date, end_date)
+        centres_data = report_jobs.report_rows(request, 'centre', start_day, end_day)
+        if isinstance(centres_data, ReportJob):
+            return report_job_page(request, centres_data, 'Centres Reports')
         
         # Calculate summary totals
-        total_sessions = sum(centre['sessions_count'] for centre in centres_data)
-        total_calls = sum(centre['total_calls'] for centre in centres_data)
-        total_minutes = sum(centre['total_minutes_seconds'] for centre in centres_data)
+        total_sessions = sum(centre.sessions_count for centre in centres_data)
+        total_calls = sum(centre.total_calls for centre in centres_data)
+        total_minutes = sum(centre.total_minutes_seconds for centre in centres_data)
         
         context = {
             'page_title': 'Centres Reports',
@@ -360,120 +218,44 @@ def reports_centres(request):
 
 def reports_centre_detail(request, centre_id):
     """Centre detail report with language breakdown"""
-    from datetime import date, datetime
-    
     # Get date range from request or use today as default
     start_date = request.GET.get('start_date', date.today().strftime('%Y-%m-%d'))
     end_date = request.GET.get('end_date', date.today().strftime('%Y-%m-%d'))
     
     try:
-        # Convert string dates to datetime objects for the query
-        start_datetime = datetime.strptime(start_date, '%Y-%m-%d')
-        end_datetime = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        start_day, end_day = reports.day_range(start_date, end_date)
         
         # Get centre name first
         centre = Centres.objects.get(id=centre_id)
         
-        # Use raw SQL to get aggregated data grouped by language for the specific centre
-        from django.db import connection
+        # Totals per language for the specific centre
+        languages_data = report_jobs.report_rows(request, 'language', start_day, end_day, centre=centre_id)
+        if isinstance(languages_data, ReportJob):
+            return report_job_page(request, languages_data, f'Centre Detail - {centre.name}')
         
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    l.id as language_id,
-                    l.name as language_name,
-                    COUNT(DISTINCT s.operid) as agents_count,
-                    COUNT(s.id) as sessions_count,
-                    COALESCE(SUM(s.calltotal), 0) as total_calls,
-                    COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0) as total_minutes_seconds,
-                    CASE 
-                        WHEN COALESCE(SUM(s.calltotal), 0) > 0 
-                        THEN COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0) / COALESCE(SUM(s.calltotal), 1)
-                        ELSE 0 
-                    END as acd_seconds
-                FROM sessions s
-                INNER JOIN operators o ON s.operid = o.id
-                INNER JOIN languages l ON o.langid = l.id
-                WHERE s.duration IS NOT NULL
-                    AND s.start >= %s
-                    AND s.start <= %s
-                    AND o.centreid = %s
-                GROUP BY l.id, l.name
-                ORDER BY l.name
-            """, [start_datetime, end_datetime, centre_id])
-            
-            languages_data = []
-            for row in cursor.fetchall():
-                languages_data.append({
-                    'language_id': row[0],
-                    'language_name': row[1],
-                    'agents_count': row[2],
-                    'sessions_count': row[3],
-                    'total_calls': row[4],
-                    'total_minutes_seconds': row[5],
-                    'acd_seconds': row[6]
-                })
-        
-        # Calculate Rate and Due for each language
+        # Calculate Rate and Due for each language from the in-memory payplan tiers
+        rate_table = payplans.get_rate_table()
         for lang_data in languages_data:
-            lang_id = lang_data['language_id']
-            acd_minutes = lang_data['acd_seconds'] / 60  # Convert seconds to minutes
-            
-            # Find appropriate payplan rate
             rate = None
             due = None
             
-            if acd_minutes > 0:  # Only calculate if we have ACD
-                # Convert ACD to seconds for payplan comparison (payplan.acd is in seconds)
-                acd_seconds = lang_data['acd_seconds']
-                
-                # First try to find centre-specific payplan
-                centre_payplans = Payplan.objects.filter(
-                    langid=lang_id,
-                    centreid=centre_id
-                ).order_by('acd')
-                
-                # If no centre-specific, try global payplan (centreid=0)
-                if not centre_payplans.exists():
-                    centre_payplans = Payplan.objects.filter(
-                        langid=lang_id,
-                        centreid=0
-                    ).order_by('acd')
-                
-                if centre_payplans.exists():
-                    # Find the payplan where payplan.acd <= language_acd_seconds < next_payplan.acd
-                    payplans_list = list(centre_payplans)
-                    
-                    for i, payplan in enumerate(payplans_list):
-                        if i == len(payplans_list) - 1:
-                            # Last payplan - use it if acd_seconds >= payplan.acd
-                            if acd_seconds >= payplan.acd:
-                                rate = payplan.rate
-                                break
-                        else:
-                            # Check if acd_seconds is in this range
-                            next_payplan = payplans_list[i + 1]
-                            if payplan.acd <= acd_seconds < next_payplan.acd:
-                                rate = payplan.rate
-                                break
-                    
-                    # If no range found, use the first payplan if acd_seconds >= its acd
-                    if rate is None and payplans_list and acd_seconds >= payplans_list[0].acd:
-                        rate = payplans_list[0].rate
+            if lang_data.acd_seconds > 0:  # Only calculate if we have ACD
+                # payplan.acd is in seconds, like the language ACD
+                rate = rate_table.rate(centre_id, lang_data.id, lang_data.acd_seconds)
                 
                 # Calculate Due amount (rate is per minute, so multiply total minutes by rate)
                 if rate is not None:
-                    total_minutes_for_lang = lang_data['total_minutes_seconds'] / 60  # Convert total seconds to minutes
+                    total_minutes_for_lang = lang_data.total_minutes_seconds / 60  # Convert total seconds to minutes
                     due = float(total_minutes_for_lang) * float(rate)
             
-            lang_data['rate'] = rate
-            lang_data['due'] = due
+            lang_data.rate = rate
+            lang_data.due = due
         
         # Calculate summary totals
-        total_sessions = sum(lang['sessions_count'] for lang in languages_data)
-        total_calls = sum(lang['total_calls'] for lang in languages_data)
-        total_minutes = sum(lang['total_minutes_seconds'] for lang in languages_data)
-        total_due = sum(lang['due'] or 0 for lang in languages_data)
+        total_sessions = sum(lang.sessions_count for lang in languages_data)
+        total_calls = sum(lang.total_calls for lang in languages_data)
+        total_minutes = sum(lang.total_minutes_seconds for lang in languages_data)
+        total_due = sum(lang.due or 0 for lang in languages_data)
         
         context = {
             'page_title': f'Centre Detail - {centre.name}',
@@ -512,22 +294,128 @@ def reports_centre_detail(request, centre_id):
         }
         return render(request, 'reports-centre-detail.html', context)
 
+def report_job_page(request, job, page_title):
+    """Progress page for a report being computed by a background job"""
+    context = {
+        'page_title': page_title,
+        'active_section': 'reports',
+        'active_subsection': 'centres',
+        'job': job
+    }
+    return render(request, 'reports-job.html', context)
+
+def reports_job_status(request, job_id):
+    """AJAX endpoint with the status and progress of a background report job"""
+    job = ReportJob.objects.filter(id=job_id).only('id', 'status', 'progress', 'error').first()
+    if job is None:
+        return FastJsonResponse({'error': 'Report job not found'}, status=404)
+    return FastJsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'progress': job.progress,
+        'error': job.error
+    })
+
 def reports_friends(request):
-    """Friends reports"""
+    """Friends reports: most frequent callers per centre, language and period"""
+    from datetime import timedelta
+    
+    # Get date range from request or use the last 30 days as default
+    today = date.today()
+    start_date = request.GET.get('start_date', (today - timedelta(days=29)).strftime('%Y-%m-%d'))
+    end_date = request.GET.get('end_date', today.strftime('%Y-%m-%d'))
+    centre = request.GET.get('centre', '')
+    language = request.GET.get('language', '')
+    top = request.GET.get('top', '20')
+    cli = request.GET.get('cli', '').strip()
+    
     context = {
         'page_title': 'Friends Reports',
         'active_section': 'reports',
-        'active_subsection': 'friends'
+        'active_subsection': 'friends',
+        'start_date': start_date,
+        'end_date': end_date,
+        'centre': centre,
+        'language': language,
+        'top': top,
+        'top_choices': ['10', '20', '50', '100'],
+        'cli': cli,
+        'centres': Centres.objects.all().order_by('name'),
+        'languages': Languages.objects.all().order_by('name'),
+        'friends': None
     }
+    
+    try:
+        # Estimated from the caller sketches, never by counting calls
+        start_day, end_day = reports.day_range(start_date, end_date)
+        context['friends'] = friends.top_callers(
+            start_day, end_day,
+            centre=int(centre) if centre else None,
+            language=int(language) if language else None,
+            k=int(top),
+            cli=cli or None
+        )
+    except Exception as e:
+        print(f"Error in reports_friends view: {e}")
+        messages.error(request, f'Error loading friends report: {str(e)}')
+    
     return render(request, 'reports-friends.html', context)
 
 def reports_historical(request):
-    """Historical reports"""
+    """Historical reports with persisted ANDROMEDA traffic history"""
+    from datetime import datetime, timedelta, timezone
+    
+    # Get date range from request or use the last 7 days as default
+    today = date.today()
+    start_date = request.GET.get('start_date', (today - timedelta(days=6)).strftime('%Y-%m-%d'))
+    end_date = request.GET.get('end_date', today.strftime('%Y-%m-%d'))
+    centre = request.GET.get('centre', '')
+    bucket = request.GET.get('bucket', '')
+    trend_centre = request.GET.get('trend_centre', '')
+    trend_language = request.GET.get('trend_language', '')
+    
     context = {
         'page_title': 'Historical Reports',
         'active_section': 'reports',
-        'active_subsection': 'historical'
+        'active_subsection': 'historical',
+        'start_date': start_date,
+        'end_date': end_date,
+        'centre': centre,
+        'centres': [],
+        'traffic_series': None,
+        'buckets': trends.BUCKETS,
+        'bucket': bucket,
+        'trend_centre': trend_centre,
+        'trend_language': trend_language,
+        'trend_centres': Centres.objects.all().order_by('name'),
+        'trend_languages': Languages.objects.all().order_by('name'),
+        'session_trends': None
     }
+    
+    try:
+        # Half-open range covering the whole end date
+        start = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        end = datetime.strptime(end_date, '%Y-%m-%d').replace(tzinfo=timezone.utc) + timedelta(days=1)
+        
+        context['centres'] = timeseries.centre_names()
+        context['traffic_series'] = timeseries.traffic_series(centre, start, end)
+    except Exception as e:
+        print(f"Error in reports_historical view: {e}")
+        messages.error(request, f'Error loading traffic history: {str(e)}')
+    
+    try:
+        # Sessions, calls, minutes and ACD per bucket from the daily rollup
+        start_day, end_day = reports.day_range(start_date, end_date)
+        context['bucket'] = bucket = bucket or trends.pick_bucket(start_day, end_day)
+        context['session_trends'] = trends.session_trends(
+            bucket, start_day, end_day,
+            centre=int(trend_centre) if trend_centre else None,
+            language=int(trend_language) if trend_language else None
+        )
+    except Exception as e:
+        print(f"Error in reports_historical view: {e}")
+        messages.error(request, f'Error loading session trends: {str(e)}')
+    
     return render(request, 'reports-historical.html', context)
 
 def reports_language_detail(request, centre_id, language_id):
@@ -541,53 +429,13 @@ def reports_language_detail(request, centre_id, language_id):
         centre = get_object_or_404(Centres, id=centre_id)
         language = get_object_or_404(Languages, id=language_id)
         
-        # Use raw SQL to get aggregated data grouped by operatorid
-        from django.db import connection
+        # Totals per agent for the centre and language
+        start_day, end_day = reports.day_range(start_date, end_date)
+        agents_data = reports.aggregate('agent', start_day, end_day, centre=centre_id, language=language_id)
         
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    o.id as operator_id,
-                    o.fname,
-                    o.sname,
-                    COUNT(s.id) as sessions_count,
-                    COALESCE(SUM(s.calltotal), 0) as total_calls,
-                    COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0) as total_minutes_seconds,
-                    CASE 
-                        WHEN COALESCE(SUM(s.calltotal), 0) > 0 
-                        THEN COALESCE(SUM(EXTRACT(EPOCH FROM s.callduration)), 0) / COALESCE(SUM(s.calltotal), 1)
-                        ELSE 0 
-                    END as acd_seconds
-                FROM sessions s
-                INNER JOIN operators o ON s.operid = o.id
-                WHERE o.centreid = %s 
-                AND o.langid = %s
-                AND s.duration IS NOT NULL
-                AND DATE(s.start) BETWEEN %s AND %s
-                GROUP BY o.id, o.fname, o.sname
-                ORDER BY o.fname, o.sname
-            """, [centre_id, language_id, start_date, end_date])
-            
-            agents_data = []
-            total_sessions = 0
-            total_calls = 0
-            total_minutes = 0
-            
-            for row in cursor.fetchall():
-                agent_data = {
-                    'operator_id': row[0],
-                    'fname': row[1],
-                    'sname': row[2],
-                    'sessions_count': row[3],
-                    'total_calls': row[4],
-                    'total_minutes_seconds': row[5],
-                    'acd_seconds': row[6]
-                }
-                agents_data.append(agent_data)
-                
-                total_sessions += row[3]
-                total_calls += row[4]
-                total_minutes += row[5]
+        total_sessions = sum(agent.sessions_count for agent in agents_data)
+        total_calls = sum(agent.total_calls for agent in agents_data)
+        total_minutes = sum(agent.total_minutes_seconds for agent in agents_data)
         
         # Calculate overall ACD
         overall_acd = total_minutes / total_calls if total_calls > 0 else 0
@@ -626,49 +474,26 @@ def reports_agent_detail(request, centre_id, language_id, operator_id):
         language = get_object_or_404(Languages, id=language_id)
         operator = get_object_or_404(Operators, id=operator_id)
         
-        # Use raw SQL to get individual sessions for the agent
-        from django.db import connection
+        # Page size and the (start, id) cursor of the page boundary
+        page_size = request.GET.get('page_size', '')
+        page_size = int(page_size) if page_size.isdigit() else reports.AGENT_SESSIONS_PAGE_SIZE
+        if page_size not in reports.AGENT_SESSIONS_PAGE_SIZES:
+            page_size = reports.AGENT_SESSIONS_PAGE_SIZE
         
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT 
-                    s.id as session_id,
-                    s.start,
-                    EXTRACT(EPOCH FROM s.duration) as duration_seconds,
-                    COALESCE(d.username, 'Unknown Device') as device_name,
-                    s.calltotal,
-                    EXTRACT(EPOCH FROM s.callduration) as callduration_seconds,
-                    CASE 
-                        WHEN s.calltotal > 0 
-                        THEN EXTRACT(EPOCH FROM s.callduration) / s.calltotal
-                        ELSE 0 
-                    END as acd_seconds
-                FROM sessions s
-                LEFT JOIN devices d ON s.devid = d.id
-                WHERE s.operid = %s 
-                AND s.duration IS NOT NULL
-                AND DATE(s.start) BETWEEN %s AND %s
-                ORDER BY s.start DESC
-            """, [operator_id, start_date, end_date])
-            
-            sessions_data = []
-            total_calls = 0
-            total_minutes = 0
-            
-            for row in cursor.fetchall():
-                session_data = {
-                    'session_id': row[0],
-                    'start': row[1],
-                    'duration_seconds': row[2],
-                    'device_name': row[3],
-                    'calltotal': row[4],
-                    'callduration_seconds': row[5],
-                    'acd_seconds': row[6]
-                }
-                sessions_data.append(session_data)
-                
-                total_calls += row[4] if row[4] else 0
-                total_minutes += row[5] if row[5] else 0
+        # Individual sessions are not rolled up, so a page comes from sessions
+        start_day, end_day = reports.day_range(start_date, end_date)
+        try:
+            page = reports.agent_sessions_page(
+                operator_id, start_day, end_day, page_size,
+                before=request.GET.get('before'), after=request.GET.get('after')
+            )
+        except ValueError:
+            # A mangled cursor falls back to the newest sessions
+            page = reports.agent_sessions_page(operator_id, start_day, end_day, page_size)
+        sessions_data = page.rows
+        
+        # Totals cover every page, from the daily rollup
+        total_sessions, total_calls, total_minutes = reports.agent_totals(operator_id, start_day, end_day)
         
         # Calculate overall ACD
         overall_acd = total_minutes / total_calls if total_calls > 0 else 0
@@ -681,8 +506,12 @@ def reports_agent_detail(request, centre_id, language_id, operator_id):
             'language': language,
             'operator': operator,
             'sessions_data': sessions_data,
+            'page': page,
+            'page_size': page_size,
+            'page_sizes': reports.AGENT_SESSIONS_PAGE_SIZES,
             'start_date': start_date,
             'end_date': end_date,
+            'total_sessions': total_sessions,
             'total_calls': total_calls,
             'total_minutes': total_minutes,
             'overall_acd': overall_acd
@@ -695,6 +524,81 @@ def reports_agent_detail(request, centre_id, language_id, operator_id):
         messages.error(request, f'Error loading report: {str(e)}')
         return redirect('reports-centres')
 
+def report_export(request, name, header, export_rows):
+    """Stream export_rows(start_day, end_day) as ?format=csv or xlsx for the ?start_date/end_date range"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(f"Unknown export format '{export_format}'", status=400, content_type='text/plain')
+    
+    start_date = request.GET.get('start_date', date.today().strftime('%Y-%m-%d'))
+    end_date = request.GET.get('end_date', date.today().strftime('%Y-%m-%d'))
+    try:
+        start_day, end_day = reports.day_range(start_date, end_date)
+    except ValueError:
+        return HttpResponse('start_date and end_date must be dates in YYYY-MM-DD format', status=400, content_type='text/plain')
+    
+    filename = f'{name}-{start_date}-to-{end_date}'
+    return export_response(request, export_format, filename, header, export_rows(start_day, end_day))
+
+def report_minutes(seconds):
+    return round((seconds or 0) / 60, 2)
+
+def reports_centres_export(request):
+    """Centres report as a CSV or XLSX download"""
+    header = ['Centre', 'Languages', 'Agents', 'Sessions', 'Calls', 'Minutes', 'ACD (seconds)']
+    
+    def export_rows(start_day, end_day):
+        for centre in reports.iter_aggregate('centre', start_day, end_day):
+            yield (centre.name, centre.languages_count, centre.agents_count, centre.sessions_count,
+                   centre.total_calls, report_minutes(centre.total_minutes_seconds), round(centre.acd_seconds))
+    
+    return report_export(request, 'centres', header, export_rows)
+
+def reports_centre_detail_export(request, centre_id):
+    """Centre detail report with rates and amounts due as a CSV or XLSX download"""
+    centre = get_object_or_404(Centres, id=centre_id)
+    header = ['Language', 'Agents', 'Sessions', 'Calls', 'Minutes', 'ACD (seconds)', 'Rate', 'Due']
+    
+    def export_rows(start_day, end_day):
+        rate_table = payplans.get_rate_table()
+        for language in reports.iter_aggregate('language', start_day, end_day, centre=centre_id):
+            rate = due = None
+            if language.acd_seconds > 0:
+                rate = rate_table.rate(centre_id, language.id, language.acd_seconds)
+            if rate is not None:
+                due = round(language.total_minutes_seconds / 60 * float(rate), 2)
+            yield (language.name, language.agents_count, language.sessions_count, language.total_calls,
+                   report_minutes(language.total_minutes_seconds), round(language.acd_seconds), rate, due)
+    
+    return report_export(request, f'{slugify(centre.name)}-languages', header, export_rows)
+
+def reports_language_detail_export(request, centre_id, language_id):
+    """Agents report for a language within a centre as a CSV or XLSX download"""
+    centre = get_object_or_404(Centres, id=centre_id)
+    language = get_object_or_404(Languages, id=language_id)
+    header = ['Agent', 'Sessions', 'Calls', 'Minutes', 'ACD (seconds)']
+    
+    def export_rows(start_day, end_day):
+        for agent in reports.iter_aggregate('agent', start_day, end_day, centre=centre_id, language=language_id):
+            yield (agent.name, agent.sessions_count, agent.total_calls,
+                   report_minutes(agent.total_minutes_seconds), round(agent.acd_seconds))
+    
+    return report_export(request, f'{slugify(centre.name)}-{slugify(language.name)}-agents', header, export_rows)
+
+def reports_agent_detail_export(request, centre_id, language_id, operator_id):
+    """Every session of an agent as a CSV or XLSX download"""
+    operator = get_object_or_404(Operators, id=operator_id)
+    header = ['Session', 'Start (UTC)', 'Duration (seconds)', 'Device', 'Calls', 'Minutes', 'ACD (seconds)']
+    
+    def export_rows(start_day, end_day):
+        for session in reports.iter_agent_sessions(operator_id, start_day, end_day):
+            acd_seconds = session.acd_seconds
+            yield (session.session_id, session.start, round(session.duration_seconds or 0),
+                   session.device_name, session.calltotal, report_minutes(session.callduration_seconds),
+                   None if acd_seconds is None else round(acd_seconds))
+    
+    return report_export(request, f'{slugify(f"{operator.fname} {operator.sname}")}-sessions', header, export_rows)
+
 def admin_centres(request):
     """Centres administration - list view"""
     try:
@@ -1038,6 +942,7 @@ def admin_payments_create(request):
                 rate=request.POST.get('rate') or 0.0
             )
             payplan.save()
+            payplans.invalidate()
             messages.success(request, f'Payplan created successfully.')
             return redirect('admin-payments')
         except Exception as e:
@@ -1067,6 +972,7 @@ def admin_payments_edit(request, payplan_id):
             payplan.acd = request.POST.get('acd') or 0
             payplan.rate = request.POST.get('rate') or 0.0
             payplan.save()
+            payplans.invalidate()
             messages.success(request, f'Payplan updated successfully.')
             return redirect('admin-payments')
         except Exception as e:
@@ -1117,6 +1023,7 @@ def admin_payments_delete(request, payplan_id):
         try:
             # Delete the payplan
             Payplan.objects.filter(id=payplan_id).delete()
+            payplans.invalidate()
             
             messages.success(request, f'Payplan deleted successfully.')
             return redirect('admin-payments')